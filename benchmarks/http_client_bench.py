@@ -0,0 +1,190 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 对比HTTP/1.1(requests)与HTTP/2(Http2Session)并发拉取SSE流的耗时和连接数
+             在进程内启动两个本地替身服务：基于 h2 的 h2c 服务和标准库的 HTTP/1.1 服务，不访问Kimi
+             在 chatgpt-on-wechat 根目录下运行(需要 common.log、httpx[http2])：
+             python plugins/kimichat/benchmarks/http_client_bench.py [并发数] [轮数]
+
+"""
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 插件目录用于直接导入 module.*(不经过插件包的 __init__)，机器人根目录(上两级)提供 common.log
+sys.path[:0] = [PLUGIN_DIR, os.path.dirname(os.path.dirname(PLUGIN_DIR))]
+
+from module import http_client  # noqa: E402
+
+# 替身服务每个请求返回的事件数和事件间隔，模拟流式回复
+EVENTS = 20
+EVENT_INTERVAL = 0.01
+
+
+def _event(index):
+    return f'data: {{"event":"cmpl","text":"第{index}段"}}\n\n'.encode("utf-8")
+
+
+class H2cServer:
+    """基于 h2 的明文HTTP/2(prior knowledge)SSE服务，每个连接一个线程，每个流一个线程"""
+
+    def __init__(self):
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, sock):
+        import h2.config
+        import h2.connection
+        import h2.events
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        lock = threading.Lock()
+        conn.initiate_connection()
+        sock.sendall(conn.data_to_send())
+        with sock:
+            while True:
+                try:
+                    data = sock.recv(65535)
+                except OSError:
+                    return
+                if not data:
+                    return
+                with lock:
+                    events = conn.receive_data(data)
+                    sock.sendall(conn.data_to_send())
+                for event in events:
+                    if isinstance(event, h2.events.RequestReceived):
+                        threading.Thread(target=self._respond, args=(sock, conn, lock, event.stream_id),
+                                         daemon=True).start()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+
+    @staticmethod
+    def _respond(sock, conn, lock, stream_id):
+        try:
+            with lock:
+                conn.send_headers(stream_id, [(":status", "200"), ("content-type", "text/event-stream")])
+                sock.sendall(conn.data_to_send())
+            for index in range(EVENTS):
+                time.sleep(EVENT_INTERVAL)
+                with lock:
+                    conn.send_data(stream_id, _event(index))
+                    sock.sendall(conn.data_to_send())
+            with lock:
+                conn.end_stream(stream_id)
+                sock.sendall(conn.data_to_send())
+        except Exception:
+            # 客户端提前断开
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = [_event(index) for index in range(EVENTS)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(sum(len(part) for part in body)))
+        self.end_headers()
+        for part in body:
+            time.sleep(EVENT_INTERVAL)
+            self.wfile.write(part)
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Http1Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SSEHandler)
+        self.port = self.server_address[1]
+        self.connections = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _http2_session():
+    session = http_client.Http2Session(http_client._requests_session(), {"max_connections": 2, "ping_interval": 0})
+    # 明文时按 h2c 直接发起HTTP/2，httpx 对 http:// 默认只用HTTP/1.1
+    session.client.close()
+    session.client = session._httpx.Client(http1=False, http2=True,
+                                           limits=session._httpx.Limits(max_connections=2))
+    return session
+
+
+def _run(session, url, concurrency, rounds):
+    def fetch(_):
+        started = time.perf_counter()
+        response = session.get(url, stream=True, timeout=(5, 30))
+        for _line in response.iter_lines():
+            pass
+        response.close()
+        return time.perf_counter() - started
+
+    latencies = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(rounds):
+            latencies += list(executor.map(fetch, range(concurrency)))
+    latencies.sort()
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "p50": round(latencies[len(latencies) // 2], 4),
+        "p95": round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 4),
+    }
+
+
+def benchmark(concurrency=16, rounds=3):
+    """
+    :return: {传输方式: {'seconds': 总耗时, 'p50': ..., 'p95': ..., 'connections': 服务端接受的连接数}}
+    """
+    results = {}
+    for name, server, make_session in (("http1.1", Http1Server(), http_client._requests_session),
+                                       ("http2", H2cServer(), _http2_session)):
+        session = make_session()
+        try:
+            results[name] = _run(session, f"http://127.0.0.1:{server.port}/stream", concurrency, rounds)
+            results[name]["connections"] = server.connections
+        finally:
+            session.close()
+            server.close()
+    return results
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    for transport, result in benchmark(*args).items():
+        print(f"{transport:8s} {result}")
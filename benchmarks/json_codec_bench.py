@@ -0,0 +1,102 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 对比原有的SSE逐行解析/请求体整体序列化与 json_codec 的耗时，并核对两者结果一致
+             在 chatgpt-on-wechat 根目录下运行：
+             python plugins/kimichat/benchmarks/json_codec_bench.py [录制的回复流文件]
+
+"""
+import json
+import os
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 插件目录用于直接导入 module.*(不经过插件包的 __init__)
+sys.path.insert(0, PLUGIN_DIR)
+
+from module.json_codec import BACKEND, encode_chat_request, sse_text  # noqa: E402
+
+
+def _legacy_sse_text(line):
+    line = line.decode('utf-8')
+    if line.startswith('data: '):
+        try:
+            json_data = json.loads(line[6:])
+            if json_data.get('event') == 'cmpl' and 'text' in json_data:
+                return json_data['text']
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+def _sample_stream():
+    """录制的回复流格式：搜索进度、逐字的 cmpl 事件和结束事件"""
+    lines = [b'data: {"event":"req","id":"cp0a1b2c3d","group_id":"cp0a1b2c4e"}',
+             b'data: {"event":"resp","id":"cp0a1b2c5f","group_id":"cp0a1b2c4e"}']
+    lines += [b'data: {"event":"search_plus","msg":{"type":"get_res","successNum":%d,"title":"\xe7\xbb\x93\xe6\x9e\x9c"}}'
+              % i for i in range(20)]
+    text = "Kimi 是月之暗面推出的智能助手，支持超长上下文。"
+    for i in range(400):
+        piece = json.dumps({"event": "cmpl", "text": text[i % len(text)], "view": "cmpl"}, ensure_ascii=False)
+        lines.append(b"data: " + piece.encode("utf-8"))
+        if i % 50 == 0:
+            lines.append(b"")
+            lines.append(b'data: {"event":"ping"}')
+    lines.append(b'data: {"event":"all_done"}')
+    return lines
+
+
+def benchmark(path=None, rounds=200):
+    """
+    比较SSE解析和请求体编码的耗时
+    :param path: 录制的回复流文件(每行一条SSE)，为空时使用内置样例
+    :return: 每个回复流 / 每个请求体的平均耗时(微秒)
+    """
+    if path:
+        with open(path, "rb") as f:
+            lines = [line.rstrip(b"\r\n") for line in f]
+    else:
+        lines = _sample_stream()
+    assert "".join(filter(None, map(_legacy_sse_text, filter(None, lines)))) == \
+        "".join(filter(None, map(sse_text, filter(None, lines))))
+
+    results = {"backend": BACKEND}
+    for name, func in (("sse_legacy", _legacy_sse_text), ("sse_fast", sse_text)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            content = ""
+            for line in lines:
+                if line:
+                    text = func(line)
+                    if text:
+                        content += text
+        results[name] = round((time.perf_counter() - started) / rounds * 1e6, 1)
+
+    refs_file = [{"id": "cp0abc", "name": "报告.pdf", "size": 1024, "detail": {"status": "parsed", "type": "file"}}]
+    data = {
+        "messages": [{"role": "user", "content": "请总结这份文件的要点" * 20}],
+        "use_search": False,
+        "extend": {"sidebar": True},
+        "kimiplus_id": "kimi",
+        "use_research": False,
+        "use_math": False,
+        "refs": ["cp0abc"],
+        "refs_file": refs_file
+    }
+    assert json.loads(encode_chat_request(data["messages"][0]["content"], False, data["refs"], refs_file)) == data
+    for name, func in (("request_legacy", lambda: json.dumps(data).encode("utf-8")),
+                       ("request_fast", lambda: encode_chat_request(data["messages"][0]["content"], False,
+                                                                    data["refs"], refs_file))):
+        started = time.perf_counter()
+        for _ in range(rounds * 10):
+            func()
+        results[name] = round((time.perf_counter() - started) / (rounds * 10) * 1e6, 2)
+    return results
+
+
+if __name__ == "__main__":
+    print(benchmark(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,59 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 对比 ExpiredDict 与按时间分桶的布隆过滤器记录已接收 MsgId 的内存占用、单条耗时和误判数
+             在 chatgpt-on-wechat 根目录下运行(需要 common.expired_dict、common.log)：
+             python plugins/kimichat/benchmarks/msg_dedup_bench.py [消息数] [过期秒数]
+
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# msg_dedup 按文件所在目录导入，机器人根目录(上两级)提供 common.*
+sys.path[:0] = [os.path.join(PLUGIN_DIR, "channel", "wechat"), os.path.dirname(os.path.dirname(PLUGIN_DIR))]
+
+from common.expired_dict import ExpiredDict  # noqa: E402
+from msg_dedup import RotatingBloomDedup  # noqa: E402
+
+
+def benchmark(num_messages=300000, expires_in_seconds=3600):
+    """对比 ExpiredDict 与 RotatingBloomDedup 的内存占用和单条消息耗时"""
+    msg_ids = [str(7000000000000000000 + i * 7919) for i in range(num_messages)]
+    results = {}
+    for name, factory in (
+        ("ExpiredDict", lambda: ExpiredDict(expires_in_seconds)),
+        ("RotatingBloomDedup", lambda: RotatingBloomDedup(expires_in_seconds,
+                                                          capacity_per_bucket=num_messages // 6 + 1)),
+    ):
+        store = factory()
+        started = time.perf_counter()
+        for msg_id in msg_ids:
+            if msg_id not in store:
+                store[msg_id] = True
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        measured = factory()
+        for msg_id in msg_ids:
+            measured[msg_id] = True
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del measured
+        false_positives = sum(1 for i in range(100000) if "x{}".format(i) in store)
+        results[name] = {
+            "peak_memory_mb": round(peak / 1024 / 1024, 2),
+            "us_per_message": round(elapsed / num_messages * 1e6, 2),
+            "false_positives_per_100k": false_positives,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    for name, result in benchmark(*[int(arg) for arg in sys.argv[1:3]]).items():
+        print(name, result)
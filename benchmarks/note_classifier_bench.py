@@ -0,0 +1,79 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 对比系统通知(NOTE)的原有逐个关键词扫描与预编译单次扫描的分类耗时，并核对两者结果一致
+             python plugins/kimichat/benchmarks/note_classifier_bench.py [轮数]
+
+"""
+import os
+import re
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# note_classifier 只依赖标准库，直接按文件所在目录导入
+sys.path.insert(0, os.path.join(PLUGIN_DIR, "channel", "wechat"))
+
+from note_classifier import ACCEPT_FRIEND, BOT_JOIN, EXIT_GROUP, JOIN_GROUP, PATPAT, classify_note  # noqa: E402
+
+
+def _legacy_classify(content, is_group):
+    """原有的逐个关键词列表扫描方式，仅用于基准对比"""
+    notes_join_group = ["加入群聊", "加入了群聊", "invited", "joined"]
+    notes_bot_join_group = ["邀请你", "invited you", "You've joined", "你通过扫描"]
+    notes_exit_group = ["移出了群聊", "removed"]
+    notes_patpat = ["拍了拍我", "tickled my", "tickled me"]
+    if is_group:
+        if any(k in content for k in notes_bot_join_group):
+            return BOT_JOIN, None
+        elif any(k in content for k in notes_join_group):
+            if "加入群聊" not in content:
+                if "invited" in content:
+                    return JOIN_GROUP, re.findall(r'invited\s+(.+?)\s+to\s+the\s+group\s+chat', content)[0]
+                elif "joined" in content:
+                    return JOIN_GROUP, re.findall(r'"(.*?)" joined the group chat via the QR Code shared by', content)[0]
+                return JOIN_GROUP, re.findall(r"\"(.*?)\"", content)[-1]
+            return JOIN_GROUP, re.findall(r"\"(.*?)\"", content)[0]
+        elif any(k in content for k in notes_exit_group):
+            return EXIT_GROUP, re.findall(r"\"(.*?)\"", content)[0]
+        elif any(k in content for k in notes_patpat):
+            if "拍了拍我" in content:
+                return PATPAT, re.findall(r"\"(.*?)\"", content)[0]
+            return PATPAT, re.findall(r'^(.*?)(?:tickled my|tickled me)', content)[0]
+        raise NotImplementedError("Unsupported note message: " + content)
+    elif "你已添加了" in content:
+        return ACCEPT_FRIEND, None
+    elif any(k in content for k in notes_patpat):
+        return PATPAT, None
+    raise NotImplementedError("Unsupported note message: " + content)
+
+
+def benchmark(rounds=20000):
+    samples = [
+        ("\"张三\"邀请\"李四\"加入了群聊", True),
+        ("\"王五\"通过扫描\"张三\"分享的二维码加入群聊", True),
+        ("Alice invited Bob to the group chat", True),
+        ("\"Carol\" joined the group chat via the QR Code shared by \"Alice\"", True),
+        ("你将\"赵六\"移出了群聊", True),
+        ("\"小明\" 拍了拍我", True),
+        ("Dave tickled my head", True),
+        ("你已添加了小红，现在可以开始聊天了。", False),
+    ]
+    for content, is_group in samples:
+        assert _legacy_classify(content, is_group)[0] == classify_note(content, is_group)[0], content
+    results = {}
+    for name, func in (("legacy", _legacy_classify), ("compiled", classify_note)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for content, is_group in samples:
+                func(content, is_group)
+        elapsed = time.perf_counter() - started
+        results[name] = round(elapsed / (rounds * len(samples)) * 1e6, 3)
+    return results  # 单条通知的平均耗时(微秒)
+
+
+if __name__ == "__main__":
+    print(benchmark(*[int(arg) for arg in sys.argv[1:2]]))
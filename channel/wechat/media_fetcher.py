@@ -0,0 +1,148 @@
+# encoding:utf-8
+
+"""
+media fetcher for wechat channel
+复用连接池下载回复中的图片/视频，限制大小，大文件落盘，并按URL缓存
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.log import logger
+
+CHUNK_SIZE = 64 * 1024  # 每次读取64KB
+MAX_MEDIA_BYTES = 100 * 1024 * 1024  # 单个媒体文件最大100MB
+SPOOL_THRESHOLD = 8 * 1024 * 1024  # 不缓存时，超过8MB写入临时文件
+CACHE_TTL = 3600  # URL缓存有效期(秒)
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # URL缓存目录上限
+TIMEOUT = (5, 60)  # (连接超时, 读取超时)
+
+
+class MediaTooLargeError(Exception):
+    pass
+
+
+class MediaFetcher:
+    def __init__(self, cache_dir=None, max_bytes=MAX_MEDIA_BYTES, cache_ttl=CACHE_TTL, cache_max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._url_locks = {}
+        self._locks_guard = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    @contextmanager
+    def _url_lock(self, url):
+        """同一URL的互斥锁，按持有和等待的线程数计数，最后一个释放时才删除"""
+        with self._locks_guard:
+            entry = self._url_locks.get(url)
+            if entry is None:
+                entry = self._url_locks[url] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._url_locks[url]
+
+    def fetch(self, url):
+        """
+        下载媒体并返回可读的文件对象(已定位到开头)，调用方负责关闭
+        同一URL并发请求只下载一次，其余等待后直接读缓存
+        """
+        if not self.cache_dir:
+            return self._download_spooled(url)
+        path = self._cache_path(url)
+        with self._url_lock(url):
+            try:
+                if time.time() - os.path.getmtime(path) <= self.cache_ttl:
+                    logger.debug("[WX] media cache hit, url={}".format(url))
+                    return open(path, "rb")
+            except OSError:
+                pass
+            part_path = path + ".part"
+            try:
+                with open(part_path, "wb") as f:
+                    size = self._download_to(url, f)
+                os.replace(part_path, path)
+            finally:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+        logger.info("[WX] download media success, size={}, url={}".format(size, url))
+        self._evict()
+        return open(path, "rb")
+
+    def _download_spooled(self, url):
+        storage = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+        try:
+            size = self._download_to(url, storage)
+        except Exception:
+            storage.close()
+            raise
+        storage.seek(0)
+        logger.info("[WX] download media success, size={}, url={}".format(size, url))
+        return storage
+
+    def _download_to(self, url, storage):
+        with self.session.get(url, stream=True, timeout=TIMEOUT) as res:
+            res.raise_for_status()
+            length = res.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                raise MediaTooLargeError("media too large: {} bytes".format(length))
+            size = 0
+            for block in res.iter_content(CHUNK_SIZE):
+                size += len(block)
+                if size > self.max_bytes:
+                    raise MediaTooLargeError("media exceeds {} bytes".format(self.max_bytes))
+                storage.write(block)
+        return size
+
+    def _evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".part"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.cache_ttl:
+                self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.cache_max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
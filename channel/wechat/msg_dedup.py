@@ -0,0 +1,127 @@
+# encoding:utf-8
+
+"""
+message dedup for wechat channel
+按时间分桶轮换的布隆过滤器，替代 ExpiredDict 记录已接收的 MsgId
+内存固定，不随消息量增长；误判率可配置(误判时消息会被当作重复而忽略)
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from common.log import logger
+
+
+def bloom_size(capacity, error_rate):
+    """根据容量和误判率计算 (位数, 哈希函数个数)"""
+    num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+    num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+    return num_bits, num_hashes
+
+
+class BloomFilter:
+    def __init__(self, num_bits):
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    def contains(self, positions):
+        bits = self.bits
+        for pos in positions:
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, positions):
+        bits = self.bits
+        for pos in positions:
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+
+def _hash_pair(key):
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class RotatingBloomDedup:
+    """
+    将 expires_in_seconds 切分为若干时间桶，每个桶一个布隆过滤器
+    查询时检查所有存活的桶，写入只写当前桶；最旧的桶整体过期丢弃
+    兼容 ExpiredDict 在 _check 中的用法: `key in d` 与 `d[key] = True`
+    """
+
+    def __init__(self, expires_in_seconds, buckets=6, capacity_per_bucket=50000, error_rate=1e-6):
+        self.bucket_span = max(1.0, expires_in_seconds / buckets)
+        self.num_buckets = buckets + 1  # 多保留一个桶，保证至少保存 expires_in_seconds
+        self.capacity_per_bucket = capacity_per_bucket
+        # 所有桶大小相同，位置只需计算一次即可在各个桶中复用
+        self.num_bits, self.num_hashes = bloom_size(capacity_per_bucket, error_rate)
+        self.expires_in_seconds = expires_in_seconds
+        self._lock = threading.Lock()
+        self._filters = []  # [(bucket_start, BloomFilter)]，从旧到新
+        self._warned_at = None
+        self._rotate(time.monotonic())
+
+    def _rotate(self, now):
+        early = False
+        if self._filters:
+            start, current = self._filters[-1]
+            if now - start < self.bucket_span:
+                if current.count < self.capacity_per_bucket:
+                    return
+                early = True
+        self._filters.append((now, BloomFilter(self.num_bits)))
+        while len(self._filters) > self.num_buckets or now - self._filters[0][0] > self.bucket_span * self.num_buckets:
+            self._filters.pop(0)
+        if early:
+            self._warn_window(now)
+
+    def _warn_window(self, now):
+        """当前桶提前写满时最旧的桶会被提前丢弃，去重窗口短于 expires_in_seconds，每个桶周期最多提示一次"""
+        if self._warned_at is not None and now - self._warned_at < self.bucket_span:
+            return
+        self._warned_at = now
+        logger.warning("[WX] message dedup bucket is full ({} ids), dedup window shortened to {:.0f}s "
+                       "(expires_in_seconds={}), consider a larger capacity_per_bucket".format(
+                           self.capacity_per_bucket, now - self._filters[0][0], self.expires_in_seconds))
+
+    def _positions(self, key):
+        h1, h2 = _hash_pair(key)
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate(time.monotonic())
+            for _, bloom in reversed(self._filters):
+                if bloom.contains(positions):
+                    return True
+        return False
+
+    def __setitem__(self, key, value):
+        self.add(key)
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate(time.monotonic())
+            self._filters[-1][1].add(positions)
+
+    def check_and_add(self, key):
+        """已存在返回True，否则记录并返回False"""
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate(time.monotonic())
+            for _, bloom in reversed(self._filters):
+                if bloom.contains(positions):
+                    return True
+            self._filters[-1][1].add(positions)
+        return False
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(len(bloom.bits) for _, bloom in self._filters)
+
@@ -0,0 +1,105 @@
+# encoding:utf-8
+
+"""
+note message classifier for wechat channel
+系统通知(NOTE)分类：导入时预编译，单次扫描得到通知类型和昵称
+可通过 register_keywords 为其他语言添加关键词
+"""
+
+import re
+import threading
+
+# 类型优先级，数值越小优先级越高
+BOT_JOIN = "bot_join"
+JOIN_GROUP = "join_group"
+EXIT_GROUP = "exit_group"
+PATPAT = "patpat"
+ACCEPT_FRIEND = "accept_friend"
+
+CATEGORY_RANK = {BOT_JOIN: 0, JOIN_GROUP: 1, EXIT_GROUP: 2, PATPAT: 3, ACCEPT_FRIEND: 4}
+GROUP_CATEGORIES = {BOT_JOIN, JOIN_GROUP, EXIT_GROUP, PATPAT}
+SINGLE_CATEGORIES = {ACCEPT_FRIEND, PATPAT}
+
+# 昵称提取方式
+NICKNAME_PATTERNS = {
+    "quoted_first": (re.compile(r"\"(.*?)\""), 0),
+    "quoted_last": (re.compile(r"\"(.*?)\""), -1),
+    "invited": (re.compile(r"invited\s+(.+?)\s+to\s+the\s+group\s+chat"), 0),
+    "qrcode": (re.compile(r"\"(.*?)\" joined the group chat via the QR Code shared by"), 0),
+    "tickled": (re.compile(r"^(.*?)(?:tickled my|tickled me)"), 0),
+}
+
+# 每种语言的关键词: {类型: [(关键词, 昵称提取方式)]}，同类型内按列表顺序决定优先级
+NOTE_KEYWORDS = {
+    "zh": {
+        BOT_JOIN: [("邀请你", None), ("你通过扫描", None)],
+        JOIN_GROUP: [("加入群聊", "quoted_first"), ("加入了群聊", "quoted_last")],
+        EXIT_GROUP: [("移出了群聊", "quoted_first")],
+        PATPAT: [("拍了拍我", "quoted_first")],
+        ACCEPT_FRIEND: [("你已添加了", None)],
+    },
+    "en": {
+        BOT_JOIN: [("invited you", None), ("You've joined", None)],
+        JOIN_GROUP: [("invited", "invited"), ("joined", "qrcode")],
+        EXIT_GROUP: [("removed", "quoted_first")],
+        PATPAT: [("tickled my", "tickled"), ("tickled me", "tickled")],
+    },
+}
+
+
+class NoteClassifier:
+    def __init__(self, keyword_tables):
+        self._lock = threading.Lock()
+        self.keyword_tables = keyword_tables
+        self._build()
+
+    def _build(self):
+        rules = {}
+        order = 0
+        for table in self.keyword_tables.values():
+            for category, keywords in table.items():
+                for keyword, extractor in keywords:
+                    order += 1
+                    if keyword not in rules:
+                        rules[keyword] = (CATEGORY_RANK[category], order, category, extractor)
+        # 长关键词优先，保证 "invited you" 不会被 "invited" 截断
+        alternation = "|".join(re.escape(k) for k in sorted(rules, key=len, reverse=True))
+        self._rules = rules
+        self._pattern = re.compile(alternation)
+
+    def register_keywords(self, language, category, keywords):
+        """添加关键词，keywords 为 [(关键词, 昵称提取方式)]"""
+        with self._lock:
+            table = self.keyword_tables.setdefault(language, {})
+            table.setdefault(category, []).extend(keywords)
+            self._build()
+
+    def classify(self, content, is_group):
+        """
+        :return: (类型, 昵称)；不支持的通知抛出 NotImplementedError
+        """
+        allowed = GROUP_CATEGORIES if is_group else SINGLE_CATEGORIES
+        rules = self._rules
+        best = None
+        for match in self._pattern.finditer(content):
+            rule = rules[match.group(0)]
+            if rule[2] in allowed and (best is None or rule < best):
+                best = rule
+        if best is None:
+            raise NotImplementedError("Unsupported note message: " + content)
+        category, extractor = best[2], best[3]
+        nickname = None
+        if extractor:
+            pattern, index = NICKNAME_PATTERNS[extractor]
+            found = pattern.findall(content)
+            if found:
+                nickname = found[index]
+        return category, nickname
+
+
+classifier = NoteClassifier(NOTE_KEYWORDS)
+
+
+def classify_note(content, is_group):
+    return classifier.classify(content, is_group)
+
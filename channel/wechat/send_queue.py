@@ -0,0 +1,227 @@
+# encoding:utf-8
+
+"""
+outbound send queue for wechat channel
+回复统一进入发送队列：同一接收者按顺序发送，全局和单个接收者分别限速，被限流时退避重试
+"""
+
+import collections
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from common.log import logger
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """预占一个令牌，返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class SendThrottledError(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("func", "args", "kwargs", "enqueued_at", "future", "attempt", "not_before", "reserved")
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        self.future = Future()
+        self.attempt = 0
+        self.not_before = 0.0  # 限速或退避结束前不发送
+        self.reserved = False  # 已为本次发送预占令牌
+
+
+class OutboundDispatcher:
+    """
+    限速等待和失败退避期间，接收者交给定时线程到期后重新排队，发送线程不阻塞在等待上
+    空闲(令牌已回满)的接收者限速桶定期清理
+    """
+
+    def __init__(self, global_rate=2.0, global_burst=5, receiver_rate=1.0, receiver_burst=3,
+                 max_retries=3, backoff=1.0, workers=2, prune_interval=60):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.receiver_rate = receiver_rate
+        self.receiver_burst = receiver_burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.prune_interval = prune_interval
+        self._receiver_buckets = {}
+        self._pending = {}  # {receiver: deque([job])}
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._timers = []  # [(到期时间, 序号, receiver)]
+        self._timer_cond = threading.Condition()
+        self._timer_seq = itertools.count()
+        self._stats = {"enqueued": 0, "sent": 0, "failed": 0, "retries": 0,
+                       "latency_total": 0.0, "latency_max": 0.0}
+        self._started_at = time.monotonic()
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name="wx-send-{}".format(i), daemon=True)
+            t.start()
+        threading.Thread(target=self._timer_loop, name="wx-send-timer", daemon=True).start()
+
+    def submit(self, receiver, func, *args, **kwargs):
+        """
+        非阻塞入队，func 返回假值或抛出异常时视为发送失败
+        :return: Future，发送成功时结果为 func 的返回值，最终失败时为None
+        """
+        job = _Job(func, args, kwargs)
+        with self._lock:
+            self._stats["enqueued"] += 1
+            jobs = self._pending.get(receiver)
+            if jobs is not None:
+                # 接收者已在队列中，由当前处理它的线程按顺序发送
+                jobs.append(job)
+                return job.future
+            self._pending[receiver] = collections.deque([job])
+        self._ready.put(receiver)
+        return job.future
+
+    def _receiver_bucket(self, receiver):
+        with self._lock:
+            bucket = self._receiver_buckets.get(receiver)
+            if bucket is None:
+                bucket = self._receiver_buckets[receiver] = TokenBucket(self.receiver_rate, self.receiver_burst)
+            return bucket
+
+    def _worker(self):
+        while True:
+            receiver = self._ready.get()
+            try:
+                self._drain(receiver)
+            except Exception as e:
+                logger.exception("[WX] send queue worker error: {}".format(e))
+
+    def _drain(self, receiver):
+        bucket = self._receiver_bucket(receiver)
+        while True:
+            with self._lock:
+                jobs = self._pending.get(receiver)
+                if not jobs:
+                    self._pending.pop(receiver, None)
+                    return
+                job = jobs[0]
+            now = time.monotonic()
+            if job.not_before > now:
+                self._schedule(receiver, job.not_before)
+                return
+            if not job.reserved:
+                job.reserved = True
+                delay = max(self.global_bucket.reserve(), bucket.reserve())
+                if delay > 0:
+                    job.not_before = now + delay
+                    self._schedule(receiver, job.not_before)
+                    return
+            job.reserved = False
+            if not self._attempt(receiver, job):
+                # 退避期间接收者仍留在 _pending 中，新回复排在其后
+                self._schedule(receiver, job.not_before)
+                return
+            with self._lock:
+                jobs.popleft()
+
+    def _attempt(self, receiver, job):
+        """发送一次，返回该条回复是否已结束(成功或重试用尽)"""
+        try:
+            result = job.func(*job.args, **job.kwargs)
+            if result is not None and not result:
+                raise SendThrottledError("send returned {}".format(result))
+        except Exception as e:
+            if job.attempt >= self.max_retries:
+                with self._lock:
+                    self._stats["failed"] += 1
+                logger.error("[WX] send failed after {} retries, receiver={}, error={}".format(job.attempt, receiver, e))
+                job.future.set_result(None)
+                return True
+            with self._lock:
+                self._stats["retries"] += 1
+            wait = self.backoff * (2 ** job.attempt)
+            job.attempt += 1
+            job.not_before = time.monotonic() + wait
+            logger.warning("[WX] send throttled, retry in {:.1f}s, receiver={}, error={}".format(wait, receiver, e))
+            return False
+        self._record_sent(job.enqueued_at)
+        job.future.set_result(result)
+        return True
+
+    def _schedule(self, receiver, due):
+        with self._timer_cond:
+            heapq.heappush(self._timers, (due, next(self._timer_seq), receiver))
+            self._timer_cond.notify()
+
+    def _timer_loop(self):
+        prune_at = time.monotonic() + self.prune_interval
+        while True:
+            due = []
+            with self._timer_cond:
+                now = time.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    due.append(heapq.heappop(self._timers)[2])
+                if not due:
+                    timeout = prune_at - now
+                    if self._timers:
+                        timeout = min(timeout, self._timers[0][0] - now)
+                    self._timer_cond.wait(max(timeout, 0))
+            for receiver in due:
+                self._ready.put(receiver)
+            if time.monotonic() >= prune_at:
+                self._prune_buckets()
+                prune_at = time.monotonic() + self.prune_interval
+
+    def _prune_buckets(self):
+        """删除令牌已回满且没有待发送回复的接收者限速桶，之后重新创建时状态相同"""
+        now = time.monotonic()
+        with self._lock:
+            idle = [receiver for receiver, bucket in self._receiver_buckets.items()
+                    if receiver not in self._pending and
+                    bucket.tokens + (now - bucket.updated_at) * bucket.rate >= bucket.capacity]
+            for receiver in idle:
+                del self._receiver_buckets[receiver]
+
+    def _record_sent(self, enqueued_at):
+        latency = time.monotonic() - enqueued_at
+        with self._lock:
+            self._stats["sent"] += 1
+            self._stats["latency_total"] += latency
+            self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+            sent = self._stats["sent"]
+        if sent % 100 == 0:
+            logger.info("[WX] send queue stats: {}".format(self.stats()))
+
+    def stats(self):
+        with self._lock:
+            sent = self._stats["sent"]
+            elapsed = time.monotonic() - self._started_at
+            return {
+                "enqueued": self._stats["enqueued"],
+                "sent": sent,
+                "failed": self._stats["failed"],
+                "retries": self._stats["retries"],
+                "pending": sum(len(jobs) for jobs in self._pending.values()),
+                "avg_latency": round(self._stats["latency_total"] / sent, 3) if sent else 0.0,
+                "max_latency": round(self._stats["latency_max"], 3),
+                "throughput": round(sent / elapsed, 3) if elapsed > 0 else 0.0,
+            }
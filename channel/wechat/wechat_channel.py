@@ -9,14 +9,15 @@ import json
 import os
 import threading
 import time
-import requests
 
 from bridge.context import *
 from bridge.reply import *
 from channel.chat_channel import ChatChannel
 from channel import chat_channel
 from channel.wechat.wechat_message import *
-from common.expired_dict import ExpiredDict
+from channel.wechat.media_fetcher import MediaFetcher
+from channel.wechat.send_queue import OutboundDispatcher
+from channel.wechat.msg_dedup import RotatingBloomDedup
 from common.log import logger
 from common.singleton import singleton
 from common.time_check import time_checker
@@ -51,10 +52,9 @@ def handler_group_msg(msg):
 def _check(func):
     def wrapper(self, cmsg: ChatMessage):
         msgId = cmsg.msg_id
-        if msgId in self.receivedMsgs:
+        if self.receivedMsgs.check_and_add(msgId):
             logger.info("Wechat message {} already received, ignore".format(msgId))
             return
-        self.receivedMsgs[msgId] = True
         create_time = cmsg.create_time  # 消息时间戳
         if conf().get("hot_reload") == True and int(create_time) < int(time.time()) - 60:  # 跳过1分钟前的历史消息
             logger.debug("[WX]history message {} skipped".format(msgId))
@@ -112,8 +112,16 @@ class WechatChannel(ChatChannel):
 
     def __init__(self):
         super().__init__()
-        self.receivedMsgs = ExpiredDict(conf().get("expires_in_seconds", 3600))
+        self.receivedMsgs = RotatingBloomDedup(conf().get("expires_in_seconds", 3600))
         self.auto_login_times = 0
+        self.media_fetcher = MediaFetcher(os.path.join(get_appdata_dir(), "media_cache"))
+        send_conf = _send_queue_conf()
+        self.send_queue = OutboundDispatcher(
+            global_rate=send_conf.get("global_rate", 2.0),
+            global_burst=send_conf.get("global_burst", 5),
+            receiver_rate=send_conf.get("receiver_rate", 1.0),
+            receiver_burst=send_conf.get("receiver_burst", 3)
+        )
 
     def startup(self):
         try:
@@ -129,8 +137,7 @@ class WechatChannel(ChatChannel):
                 exitCallback=self.exitCallback,
                 loginCallback=self.loginCallback
             )
-            self.user_id = itchat.instance.storageClass.userName
-            self.name = itchat.instance.storageClass.nickName
+            self.user_id, self.name = refresh_self_identity()
             logger.info("Wechat login success, user_id: {}, nickname: {}".format(self.user_id, self.name))
             # start message listener
             itchat.run()
@@ -152,6 +159,7 @@ class WechatChannel(ChatChannel):
 
     def loginCallback(self):
         logger.debug("Login success")
+        refresh_self_identity()
         _send_login_success()
 
     # handle_* 系列函数处理收到的消息后构造Context，然后传入produce函数中处理Context和发送回复
@@ -214,64 +222,81 @@ class WechatChannel(ChatChannel):
             self.produce(context)
 
     # 统一的发送函数，每个Channel自行实现，根据reply的type字段发送不同类型的消息
+    # 回复先进入发送队列，由发送线程按接收者顺序限速发送，文本类回复不会阻塞在itchat中
+    # 语音、图片、文件、视频的内容是文件或流，调用方返回后可能关闭或删除，等待发送完成后再返回
+    # 图片、视频URL在调用线程下载后再入队，发送线程不会被下载阻塞
     def send(self, reply: Reply, context: Context):
         receiver = context["receiver"]
+        if reply.type in (ReplyType.IMAGE_URL, ReplyType.VIDEO_URL):
+            self._send_media_url(reply, receiver)
+            return
+        future = self.send_queue.submit(receiver, self._send_now, reply, receiver)
+        if reply.type in (ReplyType.VOICE, ReplyType.IMAGE, ReplyType.FILE, ReplyType.VIDEO):
+            future.result()
+
+    def _send_media_url(self, reply: Reply, receiver):
+        url = reply.content
+        is_image = reply.type == ReplyType.IMAGE_URL
+        kind = "image" if is_image else "video"
+        logger.debug(f"[WX] start download {kind}, url={url}")
+        try:
+            storage = self.media_fetcher.fetch(url)
+        except Exception as e:
+            logger.error(f"[WX] download {kind} failed, url={url}, error={e}")
+            return
+        with storage:
+            content = storage
+            if is_image and ".webp" in url:
+                try:
+                    content = convert_webp_to_png(storage)
+                except Exception as e:
+                    logger.error(f"Failed to convert image: {e}")
+                    return
+            media = Reply(ReplyType.IMAGE if is_image else ReplyType.VIDEO, content)
+            self.send_queue.submit(receiver, self._send_now, media, receiver).result()
+        logger.info("[WX] send{} url={}, receiver={}".format("Image" if is_image else "Video", url, receiver))
+
+    def _send_now(self, reply: Reply, receiver):
         if reply.type == ReplyType.TEXT:
-            reply.content = remove_markdown_symbol(reply.content)
-            itchat.send(reply.content, toUserName=receiver)
+            # 插件已处理过的回复(见 KimiChat 的回复后处理)不再重复去除markdown符号
+            if not getattr(reply, "markdown_removed", False):
+                reply.content = remove_markdown_symbol(reply.content)
+            result = itchat.send(reply.content, toUserName=receiver)
             logger.info("[WX] sendMsg={}, receiver={}".format(reply, receiver))
+            return result
         elif reply.type == ReplyType.ERROR or reply.type == ReplyType.INFO:
             reply.content = remove_markdown_symbol(reply.content)
-            itchat.send(reply.content, toUserName=receiver)
+            result = itchat.send(reply.content, toUserName=receiver)
             logger.info("[WX] sendMsg={}, receiver={}".format(reply, receiver))
+            return result
         elif reply.type == ReplyType.VOICE:
-            itchat.send_file(reply.content, toUserName=receiver)
+            result = itchat.send_file(reply.content, toUserName=receiver)
             logger.info("[WX] sendFile={}, receiver={}".format(reply.content, receiver))
-        elif reply.type == ReplyType.IMAGE_URL:  # 从网络下载图片
-            img_url = reply.content
-            logger.debug(f"[WX] start download image, img_url={img_url}")
-            pic_res = requests.get(img_url, stream=True)
-            image_storage = io.BytesIO()
-            size = 0
-            for block in pic_res.iter_content(1024):
-                size += len(block)
-                image_storage.write(block)
-            logger.info(f"[WX] download image success, size={size}, img_url={img_url}")
-            image_storage.seek(0)
-            if ".webp" in img_url:
-                try:
-                    image_storage = convert_webp_to_png(image_storage)
-                except Exception as e:
-                    logger.error(f"Failed to convert image: {e}")
-                    return
-            itchat.send_image(image_storage, toUserName=receiver)
-            logger.info("[WX] sendImage url={}, receiver={}".format(img_url, receiver))
+            return result
         elif reply.type == ReplyType.IMAGE:  # 从文件读取图片
             image_storage = reply.content
             image_storage.seek(0)
-            itchat.send_image(image_storage, toUserName=receiver)
+            result = itchat.send_image(image_storage, toUserName=receiver)
             logger.info("[WX] sendImage, receiver={}".format(receiver))
+            return result
         elif reply.type == ReplyType.FILE:  # 新增文件回复类型
             file_storage = reply.content
-            itchat.send_file(file_storage, toUserName=receiver)
+            result = itchat.send_file(file_storage, toUserName=receiver)
             logger.info("[WX] sendFile, receiver={}".format(receiver))
+            return result
         elif reply.type == ReplyType.VIDEO:  # 新增视频回复类型
             video_storage = reply.content
-            itchat.send_video(video_storage, toUserName=receiver)
+            result = itchat.send_video(video_storage, toUserName=receiver)
             logger.info("[WX] sendFile, receiver={}".format(receiver))
-        elif reply.type == ReplyType.VIDEO_URL:  # 新增视频URL回复类型
-            video_url = reply.content
-            logger.debug(f"[WX] start download video, video_url={video_url}")
-            video_res = requests.get(video_url, stream=True)
-            video_storage = io.BytesIO()
-            size = 0
-            for block in video_res.iter_content(1024):
-                size += len(block)
-                video_storage.write(block)
-            logger.info(f"[WX] download video success, size={size}, video_url={video_url}")
-            video_storage.seek(0)
-            itchat.send_video(video_storage, toUserName=receiver)
-            logger.info("[WX] sendVideo url={}, receiver={}".format(video_url, receiver))
+            return result
+
+def _send_queue_conf():
+    """发送队列的限速配置；config.py 的 available_setting 中没有该项时使用默认值"""
+    try:
+        return conf().get("wechat_send_queue") or {}
+    except Exception:
+        return {}
+
 
 def _send_login_success():
     try:
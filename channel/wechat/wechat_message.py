@@ -1,12 +1,32 @@
-import re
-
 from bridge.context import ContextType
 from channel.chat_message import ChatMessage
+from channel.wechat.note_classifier import (ACCEPT_FRIEND, BOT_JOIN, EXIT_GROUP, JOIN_GROUP, PATPAT,
+                                            classify_note)
 from common.log import logger
 from common.tmp_dir import TmpDir
 from lib import itchat
 from lib.itchat.content import *
 
+NOTE_CONTEXT_TYPES = {
+    JOIN_GROUP: ContextType.JOIN_GROUP,
+    EXIT_GROUP: ContextType.EXIT_GROUP,
+    PATPAT: ContextType.PATPAT,
+    ACCEPT_FRIEND: ContextType.ACCEPT_FRIEND,
+}
+
+# 登录账号的 (userName, nickName)，登录成功后刷新，避免每条消息都读取 storageClass
+_self_identity = None
+
+
+def refresh_self_identity():
+    global _self_identity
+    storage = itchat.instance.storageClass
+    if not storage.userName:
+        return storage.userName, storage.nickName
+    _self_identity = (storage.userName, storage.nickName)
+    return _self_identity
+
+
 class WechatMessage(ChatMessage):
     def __init__(self, itchat_msg, is_group=False):
         super().__init__(itchat_msg)
@@ -14,11 +34,6 @@ class WechatMessage(ChatMessage):
         self.create_time = itchat_msg["CreateTime"]
         self.is_group = is_group
 
-        notes_join_group = ["加入群聊", "加入了群聊", "invited", "joined"]  # 可通过添加对应语言的加入群聊通知中的关键词适配更多
-        notes_bot_join_group = ["邀请你", "invited you", "You've joined", "你通过扫描"]
-        notes_exit_group = ["移出了群聊", "removed"]  # 可通过添加对应语言的踢出群聊通知中的关键词适配更多
-        notes_patpat = ["拍了拍我", "tickled my", "tickled me"] # 可通过添加对应语言的拍一拍通知中的关键词适配更多
-
         if itchat_msg["Type"] == TEXT:
             self.ctype = ContextType.TEXT
             self.content = itchat_msg["Text"]
@@ -36,49 +51,16 @@ class WechatMessage(ChatMessage):
             self._prepare_fn = lambda: itchat_msg.download(self.content)
             logger.debug(f"[WX] Received video message: {itchat_msg}")
         elif itchat_msg["Type"] == NOTE and itchat_msg["MsgType"] == 10000:
-            if is_group:
-                if any(note_bot_join_group in itchat_msg["Content"] for note_bot_join_group in notes_bot_join_group):  # 邀请机器人加入群聊
-                    logger.warn("机器人加入群聊消息，不处理~")
-                    pass
-                elif any(note_join_group in itchat_msg["Content"] for note_join_group in notes_join_group): # 若有任何在notes_join_group列表中的字符串出现在NOTE中
-                # 这里只能得到nickname， actual_user_id还是机器人的id
-                    if "加入群聊" not in itchat_msg["Content"]:
-                        self.ctype = ContextType.JOIN_GROUP
-                        self.content = itchat_msg["Content"]
-                        if "invited" in itchat_msg["Content"]: # 匹配英文信息
-                            self.actual_user_nickname = re.findall(r'invited\s+(.+?)\s+to\s+the\s+group\s+chat', itchat_msg["Content"])[0]
-                        elif "joined" in itchat_msg["Content"]: # 匹配通过二维码加入的英文信息
-                            self.actual_user_nickname = re.findall(r'"(.*?)" joined the group chat via the QR Code shared by', itchat_msg["Content"])[0]
-                        elif "加入了群聊" in itchat_msg["Content"]:
-                            self.actual_user_nickname = re.findall(r"\"(.*?)\"", itchat_msg["Content"])[-1]
-                    elif "加入群聊" in itchat_msg["Content"]:
-                        self.ctype = ContextType.JOIN_GROUP
-                        self.content = itchat_msg["Content"]
-                        self.actual_user_nickname = re.findall(r"\"(.*?)\"", itchat_msg["Content"])[0]
-
-                elif any(note_exit_group in itchat_msg["Content"] for note_exit_group in notes_exit_group):  # 若有任何在notes_exit_group列表中的字符串出现在NOTE中
-                    self.ctype = ContextType.EXIT_GROUP
-                    self.content = itchat_msg["Content"]
-                    self.actual_user_nickname = re.findall(r"\"(.*?)\"", itchat_msg["Content"])[0]
-
-                elif any(note_patpat in itchat_msg["Content"] for note_patpat in notes_patpat):  # 若有任何在notes_patpat列表中的字符串出现在NOTE中:
-                    self.ctype = ContextType.PATPAT
-                    self.content = itchat_msg["Content"]
-                    if "拍了拍我" in itchat_msg["Content"]:  # 识别中文
-                        self.actual_user_nickname = re.findall(r"\"(.*?)\"", itchat_msg["Content"])[0]
-                    elif "tickled my" in itchat_msg["Content"] or "tickled me" in itchat_msg["Content"]:
-                        self.actual_user_nickname = re.findall(r'^(.*?)(?:tickled my|tickled me)', itchat_msg["Content"])[0]
-                else:
-                    raise NotImplementedError("Unsupported note message: " + itchat_msg["Content"])
-                    
-            elif "你已添加了" in itchat_msg["Content"]:  #通过好友请求
-                self.ctype = ContextType.ACCEPT_FRIEND
-                self.content = itchat_msg["Content"]
-            elif any(note_patpat in itchat_msg["Content"] for note_patpat in notes_patpat):  # 若有任何在notes_patpat列表中的字符串出现在NOTE中:
-                self.ctype = ContextType.PATPAT
-                self.content = itchat_msg["Content"]
+            # 关键词表见 note_classifier.NOTE_KEYWORDS，可通过 register_keywords 适配更多语言
+            note_type, note_nickname = classify_note(itchat_msg["Content"], is_group)
+            if note_type == BOT_JOIN:  # 邀请机器人加入群聊
+                logger.warn("机器人加入群聊消息，不处理~")
             else:
-                raise NotImplementedError("Unsupported note message: " + itchat_msg["Content"])
+                self.ctype = NOTE_CONTEXT_TYPES[note_type]
+                self.content = itchat_msg["Content"]
+                # 这里只能得到nickname， actual_user_id还是机器人的id
+                if is_group and note_nickname is not None:
+                    self.actual_user_nickname = note_nickname
         elif itchat_msg["Type"] == ATTACHMENT:
             self.ctype = ContextType.FILE
             self.content = TmpDir().path() + itchat_msg["FileName"]  # content直接存临时目录路径
@@ -93,8 +75,7 @@ class WechatMessage(ChatMessage):
         self.from_user_id = itchat_msg["FromUserName"]
         self.to_user_id = itchat_msg["ToUserName"]
 
-        user_id = itchat.instance.storageClass.userName
-        nickname = itchat.instance.storageClass.nickName
+        user_id, nickname = _self_identity or refresh_self_identity()
 
         # 虽然from_user_id和to_user_id用的少，但是为了保持一致性，还是要填充一下
         # 以下很繁琐，一句话总结：能填的都填了。
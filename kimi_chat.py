@@ -8,24 +8,70 @@ Description:
 
 """
 import os
-import json
 import time
 import logging
 import re
 import mimetypes
 
+_IMPORT_STARTED = time.perf_counter()
+
 import plugins
+from config import global_config
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from channel.chat_message import ChatMessage
 from plugins import *
-from .module.token_manager import tokens, refresh_access_token
-from .module.api_models import create_new_chat_session, stream_chat_responses
+from .module.token_manager import tokens, refresh_access_token, set_state_store
+from .module.api_models import create_new_chat_session, stream_chat_responses, stop_chat_generation, is_failed_reply
 from .module.file_uploader import FileUploader
+from .module.resilience import Deadline
+from .module.generation import GenerationRegistry
+from .module.text_extractor import build_inline_prompt, is_text_file, read_text_file
+from .module.session_pool import SessionPool
+from .module.map_reduce import fits_map_reduce, load_document_chunks, run_map_reduce
+from .module.answer_cache import AnswerCache, file_digest
+from .module.image_hash import ImageRecognitionCache
+from .module.reply_pipeline import process_reply
+from .module.config_manager import ConfigManager
+from .module.router import ROUTE_RESET, ROUTE_TOGGLE_SEARCH, ROUTE_FILE_TRIGGER, ROUTE_URL, ROUTE_CHAT, ROUTE_PROFILE
+from .module.profiler import install_signal_handler, start_profiling
+from .module.temp_files import TempFileManager
+from .module.conversation import ConversationTracker
+from .module.search_classifier import SearchClassifier
+from .module.link_digest import LinkDigestBatcher
+from .module.worker_pool import ShardedWorkerPool
+from .module.state_store import create_store
+from .module.admission import (AdmissionController, CLASS_CHAT, CLASS_FILE, CLASS_SUMMARY, CLASS_URL,
+                               DEFAULT_BUSY_REPLY, DEFAULT_SUMMARY_BUSY_REPLY)
+from .module import http_client
+from .module.http_client import warm_up
+from .module.warmup import StartupReport, run_warm_up
+from .module import log_utils
+from .module.log_utils import CategoryLogger
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+DEFAULT_DIGEST_PROMPT = "以下是群里最近分享的{count}篇文章，请按顺序用一两句话分别总结每篇的核心内容，最后用一句话概括它们的共同主题"
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
+# 对话过程和文件处理过程的日志，分别受 show_chat_process / show_file_process 控制
+chat_log = CategoryLogger(logger, "chat")
+file_log = CategoryLogger(logger, "file")
+
+
+def pipeline_reply(segment):
+    """已经过回复后处理管线的文本回复，通道发送时不再重复去除markdown符号"""
+    reply = Reply(ReplyType.TEXT, segment)
+    reply.markdown_removed = True
+    return reply
+
+
+def _snapshot_property(name):
+    """只读属性，读取当前配置快照中的同名项"""
+    return property(lambda self: getattr(self.config.snapshot, name))
+
 
 @plugins.register(
     name="KimiChat",
@@ -38,63 +84,123 @@ logger.setLevel(logging.INFO)
 class KimiChat(Plugin):
     def __init__(self):
         super().__init__()
+        self.startup_report = StartupReport()
+        self.startup_report.record("导入", _IMPORT_SECONDS)
+        started = time.perf_counter()
         try:
             # 确保 tmp 目录存在
             if not os.path.exists('tmp'):
                 os.makedirs('tmp')
                 logger.info("[KimiChat] 创建 tmp 目录")
             
-            # 设置日志编码
+            # 设置日志编码，插件重载时不重复包装
             import sys
-            if sys.stdout.encoding != 'utf-8':
-                import codecs
-                sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
-                sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+            for stream in (sys.stdout, sys.stderr):
+                if (getattr(stream, 'encoding', None) or '').lower().replace('-', '') != 'utf8' \
+                        and hasattr(stream, 'reconfigure'):
+                    stream.reconfigure(encoding='utf-8')
             
-            # 加载配置
+            # 加载配置，文件修改后自动重新加载
             curdir = os.path.dirname(__file__)
-            config_path = os.path.join(curdir, "config.json")
-            with open(config_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                content = ''.join(char for char in content if ord(char) >= 32 or char in '\n\r\t')
-                self.conf = json.loads(content)
+            self.config = ConfigManager(os.path.join(curdir, "config.json"), on_reload=self.on_config_reload)
 
             # 设置日志
-            log_config = self.conf.get("logging", {})
-            if not log_config.get("enabled", True):
-                logger.disabled = True
-            else:
-                logger.setLevel(log_config.get("level", "INFO"))
-            
-            # 从配置文件加载所有设置
-            tokens['refresh_token'] = self.conf["refresh_token"]
-            if not tokens['access_token']:
-                refresh_access_token()
-            
-            # 基础配置
-            self.keyword = self.conf["keyword"]
-            self.reset_keyword = self.conf["reset_keyword"] 
-            self.toggle_search_keyword = self.conf["toggle_search_keyword"]
-            
-            # 群组配置
-            self.group_names = self.conf["group_names"]
-            self.auto_summary = self.conf["auto_summary"]
-            self.summary_prompt = self.conf["summary_prompt"]
-            self.exclude_urls = self.conf["exclude_urls"]
-            
-            # 文件处理配置
-            self.file_upload = self.conf["file_upload"]
-            self.file_triggers = self.conf["file_triggers"]
-            self.file_parsing_prompts = self.conf["file_parsing_prompts"]
-            self.image_prompts = self.conf["image_prompts"]
-            self.use_system_prompt = self.conf["use_system_prompt"]
-            self.show_custom_prompt = self.conf["show_custom_prompt"]
+            log_config = self.config.get("logging", {})
+            self.apply_logging(log_config)
+            http_client.configure(self.config.get("http", {}))
+            
+            # 从配置文件加载所有设置，access_token 在后台预热时刷新
+            tokens['refresh_token'] = self.config.get("refresh_token")
+            self.startup_report.record("配置", time.perf_counter() - started)
+            started = time.perf_counter()
+            
+            # 多实例共享的token、会话、上传结果和分析结果缓存，默认仅本进程内存
+            store_conf = self.config.get("state_store", {})
+            self.state = create_store(store_conf, curdir)
+            self.session_ttl = store_conf.get("session_ttl", 24 * 3600)
+            self.upload_ttl = store_conf.get("upload_ttl", 3600)
+            set_state_store(self.state)
+            
+            # 文件/图片分析结果缓存
+            cache_conf = self.config.get("answer_cache", {})
+            self.answer_cache = AnswerCache(
+                os.path.join(os.path.dirname(__file__), "cache", "answers"),
+                ttl=cache_conf.get("ttl", 7 * 24 * 3600),
+                max_bytes=cache_conf.get("max_size", 20) * 1024 * 1024,
+                enabled=cache_conf.get("enabled", True),
+                # 进程内存储不跨实例，结果已在本地磁盘缓存，不再多存一份
+                store=self.state if self.state.shared else None
+            )
+            # 近似重复图片的识别结果复用
+            image_cache_conf = self.config.get("image_cache", {})
+            self.image_cache = ImageRecognitionCache(
+                algorithm=image_cache_conf.get("algorithm", "phash"),
+                threshold=image_cache_conf.get("threshold", 6),
+                max_entries=image_cache_conf.get("max_entries", 2000),
+                ttl=cache_conf.get("ttl", 7 * 24 * 3600),
+                enabled=image_cache_conf.get("enabled", True)
+            )
             
             # 其他初始化
             self.waiting_files = {}
             self.chat_data = {}
+            self.search_enabled = {}  # 用户的联网搜索开关，默认开启
             self.processed_links = {}
             self.link_cache_time = 60  # 链接缓存时间（秒）
+            self.message_timeout = self.config.get("message_timeout", 120)  # 单条消息的处理预算（秒）
+            self.generations = GenerationRegistry(
+                stop_upstream=self.config.get("stop_on_cancel", False),
+                stop_func=stop_chat_generation
+            )
+            self.session_pool = SessionPool(size=self.config.get("session_pool_size", 2))
+            # 长会话自动轮转
+            rollover_conf = self.config.get("rollover", {})
+            self.conversations = ConversationTracker(
+                max_turns=rollover_conf.get("max_turns", 20),
+                max_tokens=rollover_conf.get("max_tokens", 12000),
+                summary_turns=rollover_conf.get("summary_turns", 6),
+                summary_chars=rollover_conf.get("summary_chars", 1500),
+                enabled=rollover_conf.get("enabled", True)
+            )
+            # 群聊链接合并总结，未开启时每条链接单独总结
+            digest_conf = self.config.get("link_digest", {})
+            self.link_digest = None
+            if digest_conf.get("enabled", False):
+                self.link_digest = LinkDigestBatcher(
+                    self.flush_link_digest,
+                    window=digest_conf.get("window", 60),
+                    max_batch=digest_conf.get("max_batch", 5)
+                )
+            # 准入控制，过载时立即回复繁忙
+            admission_conf = self.config.get("admission", {})
+            self.admission = AdmissionController(
+                capacity=admission_conf.get("capacity", 6),
+                slo=admission_conf.get("slo"),
+                low_priority_share=admission_conf.get("low_priority_share", 0.5),
+                enabled=admission_conf.get("enabled", True)
+            )
+            # 本地判断问题是否需要联网搜索
+            self.search_classifier = SearchClassifier(enabled=self.config.get("smart_search", True))
+            # 文件哈希、图片哈希和文档拆分可放到工作进程中执行，为0时在当前进程执行
+            worker_conf = self.config.get("worker_pool", {})
+            self.workers = ShardedWorkerPool(
+                workers=worker_conf.get("processes", 0),
+                start_method=worker_conf.get("start_method", "spawn"),
+                timeout=worker_conf.get("timeout", 60)
+            )
+            # tmp 目录下临时文件的有效期、配额和后台清理
+            temp_conf = self.config.get("temp_files", {})
+            self.temp_files = TempFileManager(
+                'tmp',
+                ttl=temp_conf.get("ttl", 600),
+                orphan_ttl=temp_conf.get("orphan_ttl", 3600),
+                quota_bytes=temp_conf.get("quota", 500) * 1024 * 1024,
+                sweep_interval=temp_conf.get("sweep_interval", 300),
+                min_age=temp_conf.get("min_age", 600)
+            ).start()
+            # 性能分析结果目录，kill -USR1 <pid> 也可触发一次分析
+            self.profile_dir = os.path.join(os.path.dirname(__file__), "profiles")
+            install_signal_handler(self.profile_dir)
             
             # 注册事件处理器
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
@@ -107,6 +213,17 @@ class KimiChat(Plugin):
                 logger.info(f"[KimiChat] 文件触发词: {self.file_triggers}")
                 logger.info("[KimiChat] 初始化完成")
             
+            self.config.start(self.config.get("config_reload_interval", 5))
+            self.startup_report.record("初始化", time.perf_counter() - started)
+            
+            # 注册完成后在后台预热：预建连接、刷新token、补足会话池
+            run_warm_up([
+                ("预建连接", warm_up),
+                ("刷新token", self.warm_up_token),
+                ("会话池", self.session_pool.fill),
+                ("工作进程", self.workers.start),
+            ], self.startup_report)
+            
         except Exception as e:
             logger.error(f"[KimiChat] 初始化失败: {str(e)}", exc_info=True)
             raise e
@@ -114,6 +231,77 @@ class KimiChat(Plugin):
         # 添加会话管理相关属性
         self.chat_sessions = {}  # 格式: {session_key: {'chat_id': chat_id, 'last_active': timestamp}}
 
+    # keyword、router 等配置项从当前配置快照读取，热加载后立即生效
+    keyword = _snapshot_property("keyword")
+    group_names = _snapshot_property("group_names")
+    auto_summary = _snapshot_property("auto_summary")
+    summary_prompt = _snapshot_property("summary_prompt")
+    file_triggers = _snapshot_property("file_triggers")
+    file_parsing_prompts = _snapshot_property("file_parsing_prompts")
+    image_prompts = _snapshot_property("image_prompts")
+    supported_formats = _snapshot_property("supported_formats")
+    max_reply_length = _snapshot_property("max_reply_length")
+    local_text_max_size = _snapshot_property("local_text_max_size")
+    local_text_total_size = _snapshot_property("local_text_total_size")
+    map_reduce_conf = _snapshot_property("map_reduce_conf")
+    follow_up_tip = _snapshot_property("follow_up_tip")
+    router = _snapshot_property("router")
+
+    def apply_logging(self, log_config):
+        if not log_config.get("enabled", True):
+            logger.disabled = True
+        else:
+            logger.disabled = False
+            logger.setLevel(log_config.get("level", "INFO"))
+        log_utils.configure(log_config, [logger])
+
+    def warm_up_token(self):
+        if not tokens['access_token']:
+            refresh_access_token()
+        return bool(tokens['access_token'])
+
+    def handle_profile(self, arg, asker_id, e_context):
+        """管理员命令：限时采样所有线程的调用栈和内存分配，不影响消息处理"""
+        if asker_id not in global_config.get("admin_users", []):
+            logger.info(f"[KimiChat] 非管理员尝试性能分析: {asker_id}")
+            # 明确回复后结束，不再交给其他插件或默认对话处理
+            e_context["reply"] = Reply(ReplyType.TEXT, "性能分析仅限管理员使用")
+            e_context.action = EventAction.BREAK_PASS
+            return True
+        duration = max(1, min(int(arg), 300)) if arg.isdigit() else 30
+        channel, context = e_context["channel"], e_context["context"]
+
+        def on_done(result):
+            if result:
+                text = (f"性能分析完成，共采样 {result['samples']} 次\n"
+                        f"调用栈: {result['stacks']}\n报告: {result['report']}")
+            else:
+                text = "性能分析失败，请查看日志"
+            channel.send(Reply(ReplyType.TEXT, text), context)
+
+        if start_profiling(duration, self.profile_dir, on_done):
+            text = f"已开始性能分析，持续 {duration} 秒"
+        else:
+            text = "已有性能分析在进行中"
+        e_context["reply"] = Reply(ReplyType.TEXT, text)
+        e_context.action = EventAction.BREAK_PASS
+        return True
+
+    def reload(self):
+        """管理命令 #reloadp 时立即重新加载配置"""
+        self.config.reload(force=True)
+
+    def on_config_reload(self, old, new):
+        """配置热加载后的回调，缓存、会话池等在初始化时创建的组件仍需重启生效"""
+        self.apply_logging(new.conf.get("logging", {}))
+        http_client.configure(new.conf.get("http", {}))
+        if new.conf["refresh_token"] != old.conf["refresh_token"]:
+            # 换了账号，共享存储中旧账号的token不再沿用
+            self.state.delete("tokens")
+            tokens['refresh_token'] = new.conf["refresh_token"]
+            refresh_access_token()
+        logger.info(f"[KimiChat] 新配置已生效, 关键词: {new.keyword}, 文件触发词: {new.file_triggers}")
+
     def check_file_format(self, file_path):
         """检查文件格式是否支持"""
         if not file_path:
@@ -122,23 +310,13 @@ class KimiChat(Plugin):
         # 获取文件扩展名
         ext = os.path.splitext(file_path)[1].lower()
         
-        # 从配置文件获取支持的格式列表
-        supported_formats = self.conf.get("supported_file_formats", [
-            ".dot", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".ppa", ".pptx",
-            ".md", ".pdf", ".txt", ".csv",
-            ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp",
-            ".py", ".java", ".cpp", ".c", ".h", ".hpp", ".js", ".ts", ".html", ".css",
-            ".json", ".xml", ".yaml", ".yml", ".sh", ".bat",
-            ".log", ".ini", ".conf", ".properties"
-        ])
-        
         # 检查扩展名是否在支持列表中
-        is_supported = ext in supported_formats
+        is_supported = ext in self.supported_formats
         
         # 添加日志输出便于调试
         if not is_supported:
             logger.warning(f"[KimiChat] 文件格式检查: 扩展名={ext}, 是否支持={is_supported}")
-            logger.debug(f"[KimiChat] 支持的格式列表: {supported_formats}")
+            logger.debug(f"[KimiChat] 支持的格式列表: {sorted(self.supported_formats)}")
         
         return is_supported
 
@@ -165,16 +343,12 @@ class KimiChat(Plugin):
         if not content:
             return None
         
-        # 更精确的URL匹配模式
-        url_pattern = r'https?://[^\s<>"]+|www\.[^\s<>"]+(?:\?[^\s<>"]*)?(?:#[^\s<>"]*)?'
-        urls = re.findall(url_pattern, content)
-        if urls:
-            url = urls[0]
+        url = self.router.find_url(content)
+        if url:
             # 检查是否是需要排除的链接
-            for exclude_url in self.exclude_urls:
-                if exclude_url in url:
-                    logger.info(f"[KimiChat] 检测到排除链接，跳过处理: {url}")
-                    return None
+            if self.router.is_excluded_url(url):
+                logger.info(f"[KimiChat] 检测到排除链接，跳过处理: {url}")
+                return None
             
             # 处理HTML实体编码
             url = url.replace('&amp;', '&')
@@ -185,7 +359,75 @@ class KimiChat(Plugin):
             return f'<url id="" type="url" status="" title="" wc="">{url}</url>'
         return None
 
-    def handle_url_content(self, content, user_id, e_context):
+    def get_chat_info(self, user_id):
+        """用户当前的会话，本进程没有时沿用其他实例创建的会话"""
+        chat_info = self.chat_data.get(user_id)
+        if chat_info is None:
+            shared = self.state.get(f"session:{user_id}")
+            if shared:
+                chat_info = self.chat_data[user_id] = dict(shared)
+        return chat_info
+
+    def bind_chat(self, user_id, chat_id, use_search):
+        chat_info = self.chat_data[user_id] = {'chatid': chat_id, 'use_search': use_search}
+        self.state.set(f"session:{user_id}", dict(chat_info), ttl=self.session_ttl)
+        return chat_info
+
+    def ask_kimi(self, user_id, content, deadline=None, asker_id=None):
+        """
+        在用户的会话中提问，没有会话时新建
+        同一提问者的新问题会取消其进行中的回复，被取消时返回None
+        """
+        chat_info = self.get_chat_info(user_id)
+        prompt = content
+        old_info = None
+        if chat_info and self.conversations.should_rollover(chat_info):
+            # 会话过长，换用新会话并带上近期对话摘要
+            old_info, chat_info = chat_info, None
+            prompt = self.conversations.seed_prompt(self.conversations.build_summary(old_info), content)
+        if chat_info:
+            chat_id = chat_info['chatid']
+        else:
+            chat_id = self.session_pool.acquire(deadline=deadline)
+        
+        use_search = self.search_enabled.get(user_id, True)
+        if use_search and self.search_classifier.enabled:
+            # 开启联网时按问题判断是否真的需要搜索
+            use_search, reason = self.search_classifier.decide(content)
+            chat_log.debug("[KimiChat] 联网判断: %s (%s)", use_search, reason)
+            self.search_classifier.observe(asker_id or user_id, content, use_search)
+        handle = self.generations.start(user_id, asker_id, chat_id)
+        self.admission.mark_upstream()
+        started = time.monotonic()
+        try:
+            if chat_info:
+                rely_content = stream_chat_responses(chat_id, prompt, use_search=use_search, deadline=deadline, handle=handle)
+            else:
+                rely_content = stream_chat_responses(chat_id, prompt, use_search=use_search, new_chat=True,
+                                                     deadline=deadline, handle=handle)
+                if handle.superseded:
+                    # 已被重置或取代，新会话不再绑定；问题还没发出时会话仍是空的，放回池中
+                    if not handle.attached:
+                        self.session_pool.release(chat_id)
+                elif old_info and (not rely_content or is_failed_reply(rely_content)):
+                    # 轮转后的首个问题失败，保留旧会话和摘要，下次提问重新轮转
+                    logger.warning(f"[KimiChat] 会话轮转失败，继续使用旧会话: {old_info.get('chatid')}")
+                elif chat_id:
+                    chat_info = self.bind_chat(user_id, chat_id, use_search)
+                    if old_info:
+                        self.conversations.rolled_over(old_info, chat_info)
+        finally:
+            self.generations.finish(handle)
+        
+        if handle.superseded:
+            return None
+        if chat_info and rely_content and not is_failed_reply(rely_content):
+            latency = time.monotonic() - started
+            self.conversations.record(chat_info, content, rely_content, latency, sent=prompt)
+            self.search_classifier.record_latency(use_search, latency)
+        return rely_content
+
+    def handle_url_content(self, content, user_id, e_context, deadline=None, asker_id=None):
         """统一处理URL内容的函数"""
         # 从内容中提取URL和自定义提示词
         content = content.strip()
@@ -208,27 +450,63 @@ class KimiChat(Plugin):
             # 使用自定义提示词或默认提示词
             actual_prompt = custom_prompt if custom_prompt else self.summary_prompt
             actual_content = f"{actual_prompt}\n\n{formatted_url}"
-            logger.info(f"[KimiChat] 检测到URL,使用提示词: {actual_prompt}")
-            logger.info(f"[KimiChat] 格式化内容: {actual_content}")
+            chat_log.info("[KimiChat] 检测到URL,使用提示词: %s", actual_prompt)
+            chat_log.debug("[KimiChat] 格式化内容: %s", actual_content)
             
             # 使用现有会话或创建新会话
-            if user_id in self.chat_data:
-                chat_info = self.chat_data[user_id]
-                chat_id = chat_info['chatid']
-                rely_content = stream_chat_responses(chat_id, actual_content, use_search=True)
-            else:
-                chat_id = create_new_chat_session()
-                rely_content = stream_chat_responses(chat_id, actual_content, new_chat=True)
-                self.chat_data[user_id] = {'chatid': chat_id, 'use_search': True}
+            rely_content = self.ask_kimi(user_id, actual_content, deadline, asker_id)
+            if rely_content is None:
+                # 已被重置或新消息取代，不再回复
+                e_context.action = EventAction.BREAK_PASS
+                return True
             
-            rely_content = self.clean_references(rely_content)
-            tip_message = f"\n\n发送 {self.keyword}+问题 可以继续追问"
-            reply = Reply(ReplyType.TEXT, rely_content + tip_message)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
+            self.reply_text(e_context, rely_content)
             return True
         return False
 
+    def queue_link_digest(self, content, user_id, e_context):
+        """群聊分享的链接先加入合并总结队列，窗口结束后统一回复"""
+        url = self.router.find_url(content)
+        if url and not self.router.is_excluded_url(url):
+            queued = self.link_digest.add(user_id, url, {
+                'user_id': user_id,
+                'channel': e_context["channel"],
+                'context': e_context["context"]
+            })
+            if not queued:
+                logger.info(f"[KimiChat] 链接已在总结队列或刚总结过，跳过: {url}")
+        e_context.action = EventAction.BREAK_PASS
+        return True
+
+    def flush_link_digest(self, group_key, items):
+        """把一批链接合并为一次请求，结果发到最后一条链接所在的群"""
+        links = [self.extract_url(item['url']) for item in items]
+        links = [link for link in links if link]
+        if not links:
+            return
+        if len(links) == 1:
+            content = f"{self.summary_prompt}\n\n{links[0]}"
+        else:
+            digest_prompt = self.config.get("link_digest", {}).get("prompt", DEFAULT_DIGEST_PROMPT)
+            content = digest_prompt.format(count=len(links)) + "\n\n" + "\n".join(links)
+        last = items[-1]
+        ticket = self.admission.admit(CLASS_SUMMARY)
+        if ticket is None:
+            logger.info(f"[KimiChat] 当前过载，放弃本批 {len(links)} 条链接的合并总结")
+            # 整批只提示一次
+            text = self.summary_busy_notice(last['context'])
+            if text:
+                last['channel'].send(Reply(ReplyType.TEXT, text), last['context'])
+            return
+        try:
+            rely_content = self.ask_kimi(last['user_id'], content, Deadline(self.message_timeout))
+        finally:
+            self.admission.release(ticket)
+        if rely_content is None:
+            return
+        for segment in self.reply_segments(rely_content):
+            last['channel'].send(pipeline_reply(segment), last['context'])
+
     def on_handle_context(self, e_context: EventContext):
         """处理消息上下文"""
         if not e_context['context'].content:
@@ -237,29 +515,39 @@ class KimiChat(Plugin):
         content = e_context['context'].content.strip()
         context_type = e_context['context'].type
         
+        # 本条消息的处理截止时间，贯穿会话创建、上传和流式回复各阶段
+        deadline = Deadline(self.message_timeout)
+
         # 获取用户信息
         msg = e_context['context'].kwargs.get('msg')
         user_id = msg.from_user_id if msg else None
         isgroup = e_context['context'].kwargs.get('isgroup', False)
+        asker_id = msg.actual_user_id if (msg and isgroup) else user_id
+        
+        # 文本消息一次前缀匹配确定路由，与机器人无关的消息直接返回
+        route, matched = None, None
+        if context_type == ContextType.TEXT:
+            route, matched = self.router.route(content)
+            if route is None:
+                return
         
         # 修改群组检查逻辑
         if isgroup:
             group_name = msg.other_user_nickname if msg else None
             
             # 检查是否在允许的群组列表中
-            allowed_groups = self.conf.get("allowed_groups", [])
-            if allowed_groups and group_name not in allowed_groups:
+            if not self.router.group_allowed(group_name):
                 logger.debug(f"[KimiChat] 群组不在允许列表中: {group_name}")
                 return
             
             # 对于链接自动总结功能，单独检查 group_names
             if context_type == ContextType.SHARING and self.auto_summary:
-                if group_name not in self.conf.get("group_names", []):
+                if not self.router.summary_group(group_name):
                     logger.debug(f"[KimiChat] 群组不在自动总结表中: {group_name}")
                     return
         
         # 处理重置会话命令
-        if content == self.reset_keyword:
+        if route == ROUTE_RESET:
             success, message = self.reset_chat(user_id, e_context['context'])
             if success:
                 reply = Reply(ReplyType.TEXT, f"{message}\n\n发送 k+问题 可以继续追问")
@@ -269,61 +557,54 @@ class KimiChat(Plugin):
             e_context.action = EventAction.BREAK_PASS
             return True
         
+        # 切换联网搜索
+        if route == ROUTE_TOGGLE_SEARCH:
+            enabled = not self.search_enabled.get(user_id, True)
+            self.search_enabled[user_id] = enabled
+            e_context["reply"] = Reply(ReplyType.TEXT, "已开启联网搜索" if enabled else "已关闭联网搜索")
+            e_context.action = EventAction.BREAK_PASS
+            return True
+        
+        # 性能分析(仅管理员)
+        if route == ROUTE_PROFILE:
+            return self.handle_profile(content[len(matched):].strip(), asker_id, e_context)
+        
         # 处理分享类型消息
         if context_type == ContextType.SHARING and self.auto_summary:
             # 判断是否是群聊
             if isgroup:
-                # 检查群组名单
-                group_name = msg.other_user_nickname if msg else None
-                if group_name not in self.conf.get("group_names", []):
-                    logger.debug(f"[KimiChat] 群组不在自动总结表中: {group_name}")
-                    return
                 logger.info(f"[KimiChat] 收到群聊分享链接: {content}")
-                return self.handle_url_content(content, user_id, e_context)
+                if self.link_digest:
+                    return self.queue_link_digest(content, user_id, e_context)
+                return self.run_admitted(CLASS_SUMMARY, e_context, self.handle_url_content,
+                                         content, user_id, e_context, deadline, asker_id)
             else:
                 # 私聊消息，检查私聊自动总结开关
-                if not self.conf.get("private_auto_summary", False):
+                if not self.config.get("private_auto_summary", False):
                     logger.debug("[KimiChat] 私聊自动总结功能已关闭")
                     return
                 logger.info(f"[KimiChat] 收到私聊分享链接: {content}")
-                return self.handle_url_content(content, user_id, e_context)
+                return self.run_admitted(CLASS_SUMMARY, e_context, self.handle_url_content,
+                                         content, user_id, e_context, deadline, asker_id)
         
         # 处理文本消息
         if context_type == ContextType.TEXT:
-            content = content.strip()
-            
             # 检查是否是文件识别触发词
-            for trigger in self.file_triggers:
-                if content.startswith(trigger):
-                    logger.info(f"[KimiChat] 用户 {user_id} 触发文件识别")
-                    return self.handle_file_trigger(trigger, content, user_id, e_context)
+            if route == ROUTE_FILE_TRIGGER:
+                logger.info(f"[KimiChat] 用户 {user_id} 触发文件识别")
+                return self.handle_file_trigger(matched, content, user_id, e_context)
+            
+            # 检查是否包含URL
+            if route == ROUTE_URL:
+                return self.run_admitted(CLASS_URL, e_context, self.handle_url_content,
+                                         content, user_id, e_context, deadline, asker_id)
             
             # 处理普通文本对话
-            if self.keyword == "" or content.startswith(self.keyword):
-                # 检查是否包含URL
-                if 'http' in content:
-                    return self.handle_url_content(content, user_id, e_context)
-                
+            if route == ROUTE_CHAT:
                 # 移除关键词前缀
-                if self.keyword and content.startswith(self.keyword):
-                    content = content[len(self.keyword):].strip()
-                
-                # 处理普通对话
-                if user_id in self.chat_data:
-                    chat_info = self.chat_data[user_id]
-                    chat_id = chat_info['chatid']
-                    rely_content = stream_chat_responses(chat_id, content, use_search=True)
-                else:
-                    chat_id = create_new_chat_session()
-                    rely_content = stream_chat_responses(chat_id, content, new_chat=True)
-                    self.chat_data[user_id] = {'chatid': chat_id, 'use_search': True}
-                
-                rely_content = self.clean_references(rely_content)
-                tip_message = f"\n\n发送 {self.keyword}+问题 可以继续追问"
-                reply = Reply(ReplyType.TEXT, rely_content + tip_message)
-                e_context["reply"] = reply
-                e_context.action = EventAction.BREAK_PASS
-                return True
+                content = content[len(matched):].strip()
+                return self.run_admitted(CLASS_CHAT, e_context, self.handle_chat,
+                                         content, user_id, e_context, deadline, asker_id)
         
         # 处理文件上传
         if context_type in [ContextType.FILE, ContextType.IMAGE]:
@@ -336,8 +617,8 @@ class KimiChat(Plugin):
             waiting_id = f"{group_id}_{real_user_id}" if is_group else real_user_id
             
             # 添加调试日志
-            logger.debug(f"[KimiChat] 收到文件，waiting_id={waiting_id}, user_id={real_user_id}, group_id={group_id}")
-            logger.debug(f"[KimiChat] 当前等待列表: {list(self.waiting_files.keys())}")
+            file_log.debug("[KimiChat] 收到文件，waiting_id=%s, user_id=%s, group_id=%s", waiting_id, real_user_id, group_id)
+            file_log.debug("[KimiChat] 当前等待列表: %s", self.waiting_files.keys())
             
             # 先检查是否有等待记录
             if waiting_id not in self.waiting_files:
@@ -345,8 +626,9 @@ class KimiChat(Plugin):
                 return False
             
             waiting_info = self.waiting_files[waiting_id]
-            logger.debug(f"[KimiChat] 找到等待记录: {waiting_info}")
-            logger.debug(f"[KimiChat] 验证信息: trigger_user={waiting_info.get('trigger_user_id')}, current_user={real_user_id}, is_group={is_group}, group_id={group_id}")
+            file_log.debug("[KimiChat] 找到等待记录: %s", waiting_info)
+            file_log.debug("[KimiChat] 验证信息: trigger_user=%s, current_user=%s, is_group=%s, group_id=%s",
+                           waiting_info.get('trigger_user_id'), real_user_id, is_group, group_id)
             
             # 添加超时检查
             if time.time() - waiting_info.get('trigger_time', 0) > waiting_info.get('timeout', 300):
@@ -387,75 +669,59 @@ class KimiChat(Plugin):
                     e_context.action = EventAction.BREAK_PASS
                     return True
                 
+                # 登记临时文件，处理完成或过期后删除
+                self.temp_files.track(file_path, waiting_id)
+                
                 # 检查文件格式
                 if not self.check_file_format(file_path):
                     logger.warning(f"[KimiChat] 不支持的文件格式: {file_path}")
+                    self.temp_files.release(file_path)
                     reply = Reply(ReplyType.TEXT, "不支持的文件格式")
                     e_context['reply'] = reply
                     e_context.action = EventAction.BREAK_PASS
                     return True
                 
-                # 上传文件
                 current_filename = os.path.basename(file_path)
-                logger.info(f"[KimiChat] 开始上传文件: {current_filename}")
-                uploader = FileUploader()
-                file_id = uploader.upload(current_filename, file_path)
+                file_hash = self.workers.run(waiting_id, file_digest, file_path)
                 
-                if not file_id:
-                    logger.error("[KimiChat] 文件上传失败")
-                    raise Exception("文件上传失败")
+                # 单个超大文档在本地拆分后并行分析
+                if waiting_info['count'] == 1 and self.should_map_reduce(file_path):
+                    chunks = self.workers.run(waiting_id, load_document_chunks, file_path,
+                                              self.map_reduce_conf.get("chunk_chars", 20000))
+                    max_chunks = self.map_reduce_conf.get("max_chunks", 12)
+                    if chunks and len(chunks) > max_chunks:
+                        # 块数过多时不拆分，按普通文件上传
+                        logger.info(f"[KimiChat] 文档 {current_filename} 拆分为 {len(chunks)} 块，超过上限 {max_chunks}，"
+                                    f"改为直接上传")
+                    if fits_map_reduce(chunks, max_chunks):
+                        waiting_info['received_files'].append({'name': current_filename, 'path': file_path, 'hash': file_hash})
+                        return self.run_admitted(CLASS_FILE, e_context, self.handle_map_reduce,
+                                                 chunks, current_filename, waiting_info, waiting_id,
+                                                 user_id, real_user_id, e_context, on_reject=waiting_id)
                 
-                logger.info(f"[KimiChat] 文件上传成功: id={file_id}")
+                inline_text = None
+                if is_text_file(file_path) and self.inline_budget_left(waiting_info) > 0:
+                    inline_text = read_text_file(file_path, min(self.local_text_max_size, self.inline_budget_left(waiting_info)))
                 
-                # 记录已处理的文件信息
-                waiting_info['received'].append(file_id)
+                # 先记录文件，全部收齐后再统一查缓存和上传
                 waiting_info['received_files'].append({
-                    'id': file_id,
-                    'name': current_filename
+                    'id': None,
+                    'name': current_filename,
+                    'path': file_path,
+                    'hash': file_hash,
+                    'text': inline_text
                 })
                 
                 # 检查是否已收集足够的文件
-                if len(waiting_info['received']) >= waiting_info['count']:
-                    # 发送处理提示
-                    processing_reply = Reply(ReplyType.TEXT, "文件接收完毕，正在解析处理中，请稍候...")
-                    e_context["channel"].send(processing_reply, e_context["context"])
-                    
-                    # 开始处理文件
-                    refs_list = waiting_info['received']
-                    custom_prompt = waiting_info['prompt']
-                    
-                    # 根据文件类型选择提示词
-                    if context_type == ContextType.IMAGE:
-                        if not custom_prompt:
-                            custom_prompt = self.image_prompts
-                        logger.info(f"[KimiChat] 使用图片提示词: {custom_prompt}")
-                    else:
-                        if not custom_prompt:
-                            custom_prompt = self.file_parsing_prompts
-                        logger.info(f"[KimiChat] 使用文件提示词: {custom_prompt}")
-                    
-                    # 创建新会话并处理文件
-                    chat_id = create_new_chat_session()
-                    rely_content = stream_chat_responses(chat_id, custom_prompt, refs_list, False, True)
-                    self.chat_data[user_id] = {'chatid': chat_id, 'use_search': False}
-                    
-                    if rely_content:
-                        # 添加提示信
-                        tip_message = f"\n\n发送 {self.keyword}+问题 可以继续追问"
-                        reply = Reply(ReplyType.TEXT, rely_content + tip_message)
-                    else:
-                        reply = Reply(ReplyType.TEXT, "处理失败，请重试")
-                    
-                    e_context["reply"] = reply
-                    e_context.action = EventAction.BREAK_PASS
-                    
-                    # 清理状态
-                    self.clean_waiting_files(waiting_id)
-                    return True
+                received_count = len(waiting_info['received_files'])
+                if received_count >= waiting_info['count']:
+                    return self.run_admitted(CLASS_FILE, e_context, self.analyze_received_files,
+                                             waiting_info, waiting_id, context_type,
+                                             user_id, real_user_id, deadline, e_context, on_reject=waiting_id)
                 else:
                     # 还需要更多文件
-                    remaining = waiting_info['count'] - len(waiting_info['received'])
-                    reply = Reply(ReplyType.TEXT, f"已接收{len(waiting_info['received'])}个文件，还需要{remaining}个")
+                    remaining = waiting_info['count'] - received_count
+                    reply = Reply(ReplyType.TEXT, f"已接收{received_count}个文件，还需要{remaining}个")
                     e_context["reply"] = reply
                     e_context.action = EventAction.BREAK_PASS
                     return True
@@ -474,15 +740,238 @@ class KimiChat(Plugin):
         
         return False
 
+    def run_admitted(self, request_class, e_context, func, *args, on_reject=None):
+        """
+        准入控制通过后执行 func(*args)，过载时立即回复繁忙提示
+        :param on_reject: 被拒绝时需要清理的文件等待ID
+        """
+        ticket = self.admission.admit(request_class)
+        if ticket is None:
+            if on_reject is not None:
+                self.clean_waiting_files(on_reject)
+            if request_class == CLASS_SUMMARY:
+                text = self.summary_busy_notice(e_context["context"])
+            else:
+                text = self.admission.busy_reply(request_class,
+                                                 self.config.get("admission", {}).get("busy_reply", DEFAULT_BUSY_REPLY))
+            if text:
+                e_context["reply"] = Reply(ReplyType.TEXT, text)
+            e_context.action = EventAction.BREAK_PASS
+            return True
+        try:
+            return func(*args)
+        finally:
+            self.admission.release(ticket)
+
+    def summary_busy_notice(self, context):
+        """
+        自动总结被拒绝时的提示；同一群聊/私聊在 summary_busy_interval 秒内只提示一次，
+        繁忙时连续分享的链接不会各收到一条提示。不需要提示时返回None
+        """
+        admission_conf = self.config.get("admission", {})
+        text = admission_conf.get("summary_busy_reply", DEFAULT_SUMMARY_BUSY_REPLY)
+        if text and self.admission.notice_due(context["receiver"], admission_conf.get("summary_busy_interval", 300)):
+            return text
+        return None
+
+    def handle_chat(self, content, user_id, e_context, deadline=None, asker_id=None):
+        """普通文本对话"""
+        rely_content = self.ask_kimi(user_id, content, deadline, asker_id)
+        if rely_content is None:
+            # 已被重置或新消息取代，不再回复
+            e_context.action = EventAction.BREAK_PASS
+            return True
+        
+        self.reply_text(e_context, rely_content)
+        return True
+
+    def should_map_reduce(self, file_path):
+        """文件是否需要拆分后并行分析"""
+        if not self.map_reduce_conf.get("enabled", True):
+            return False
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return False
+        return size >= self.map_reduce_conf.get("min_size", 512) * 1024
+
+    def handle_map_reduce(self, chunks, file_name, waiting_info, waiting_id, user_id, real_user_id, e_context):
+        """分块并行分析超大文档并合并结果"""
+        try:
+            prompt = waiting_info['prompt'] or self.file_parsing_prompts
+            cache_key = AnswerCache.make_key([f['hash'] for f in waiting_info['received_files']], prompt, False)
+            cached = self.answer_cache.get(cache_key)
+            if cached:
+                logger.info(f"[KimiChat] 命中分析结果缓存: {file_name}")
+                self.reply_text(e_context, cached, tip=False)
+                return True
+            
+            logger.info(f"[KimiChat] 文档 {file_name} 拆分为 {len(chunks)} 块并行分析")
+            processing_reply = Reply(ReplyType.TEXT, f"文档较大，已拆分为{len(chunks)}部分并行解析，请稍候...")
+            e_context["channel"].send(processing_reply, e_context["context"])
+            
+            deadline = Deadline(self.map_reduce_conf.get("timeout", 300))
+            self.admission.mark_upstream()
+            handle = self.generations.start(user_id, real_user_id)
+            try:
+                rely_content, chat_id, report = run_map_reduce(
+                    chunks, prompt, file_name, self.session_pool,
+                    max_workers=self.map_reduce_conf.get("max_workers", 4),
+                    deadline=deadline, handle=handle,
+                    reduce_chars=self.map_reduce_conf.get("reduce_chars", 30000)
+                )
+            finally:
+                self.generations.finish(handle)
+            if handle.superseded:
+                e_context.action = EventAction.BREAK_PASS
+                return True
+            
+            if rely_content:
+                if chat_id:
+                    self.bind_chat(user_id, chat_id, False)
+                if report.get('failed', 0) == 0 and not is_failed_reply(rely_content):
+                    self.answer_cache.set(cache_key, rely_content)
+                self.reply_text(e_context, rely_content)
+            else:
+                self.reply_text(e_context, "处理失败，请重试", tip=False)
+            return True
+        finally:
+            self.clean_waiting_files(waiting_id)
+
+    def analyze_received_files(self, waiting_info, waiting_id, context_type, user_id, real_user_id, deadline, e_context):
+        """文件收齐后统一分析：先查结果缓存，未命中再上传并提问"""
+        received_files = waiting_info['received_files']
+        custom_prompt = waiting_info['prompt']
+        
+        # 根据文件类型选择提示词
+        if context_type == ContextType.IMAGE:
+            if not custom_prompt:
+                custom_prompt = self.image_prompts
+            logger.info(f"[KimiChat] 使用图片提示词: {custom_prompt}")
+        else:
+            if not custom_prompt:
+                custom_prompt = self.file_parsing_prompts
+            logger.info(f"[KimiChat] 使用文件提示词: {custom_prompt}")
+        
+        cache_key = AnswerCache.make_key([f['hash'] for f in received_files], custom_prompt, False)
+        cached = self.answer_cache.get(cache_key)
+        if cached:
+            logger.info(f"[KimiChat] 命中分析结果缓存，跳过上传: {[f['name'] for f in received_files]}")
+            self.reply_text(e_context, cached, tip=False)
+            self.clean_waiting_files(waiting_id)
+            return True
+        
+        # 单张图片再按感知哈希查找近似重复的图片
+        image_hash = None
+        if context_type == ContextType.IMAGE and len(received_files) == 1:
+            image_hash = self.image_cache.image_hash(received_files[0]['path'], self.workers, waiting_id)
+            similar = self.image_cache.lookup(image_hash, custom_prompt)
+            if similar:
+                self.reply_text(e_context, similar, tip=False)
+                self.clean_waiting_files(waiting_id)
+                return True
+        
+        # 发送处理提示
+        processing_reply = Reply(ReplyType.TEXT, "文件接收完毕，正在解析处理中，请稍候...")
+        e_context["channel"].send(processing_reply, e_context["context"])
+        
+        # 上传本地未能直接读取的文件
+        self.admission.mark_upstream()
+        for file_info in received_files:
+            if file_info.get('text') is not None:
+                logger.info(f"[KimiChat] 本地读取文本文件: {file_info['name']}, {len(file_info['text'])} 字")
+                self.temp_files.release(file_info['path'])
+                continue
+            file_id = self.upload_once(file_info, deadline)
+            if not file_id:
+                logger.error("[KimiChat] 文件上传失败")
+                raise Exception("文件上传失败")
+            logger.info(f"[KimiChat] 文件上传成功: id={file_id}")
+            self.temp_files.release(file_info['path'])
+            file_info['id'] = file_id
+            waiting_info['received'].append(file_id)
+        refs_list = waiting_info['received']
+        
+        # 本地读取的文本内联到提示词中
+        text_files = [(f['name'], f['text']) for f in received_files if f.get('text') is not None]
+        prompt = build_inline_prompt(custom_prompt, text_files) if text_files else custom_prompt
+        
+        # 创建新会话(优先使用预建会话)并处理文件
+        chat_id = self.session_pool.acquire(deadline=deadline)
+        handle = self.generations.start(user_id, real_user_id, chat_id)
+        try:
+            rely_content = stream_chat_responses(chat_id, prompt, refs_list or None, False, True,
+                                                 deadline=deadline, handle=handle)
+        finally:
+            self.generations.finish(handle)
+        if handle.superseded:
+            self.clean_waiting_files(waiting_id)
+            e_context.action = EventAction.BREAK_PASS
+            return True
+        if chat_id:
+            self.bind_chat(user_id, chat_id, False)
+        
+        if rely_content:
+            if not is_failed_reply(rely_content):
+                self.answer_cache.set(cache_key, rely_content)
+                self.image_cache.add(image_hash, custom_prompt, rely_content)
+            self.reply_text(e_context, rely_content)
+        else:
+            self.reply_text(e_context, "处理失败，请重试", tip=False)
+        
+        # 清理状态
+        self.clean_waiting_files(waiting_id)
+        return True
+
+    def upload_once(self, file_info, deadline):
+        """相同内容的文件在 upload_ttl 内只上传一次，各实例共用上传结果"""
+        key = f"upload:{file_info['hash']}"
+        file_id = self.state.get(key)
+        if file_id:
+            logger.info(f"[KimiChat] 文件已上传过，直接引用: {file_info['name']}, id={file_id}")
+            return file_id
+        with self.state.lock(key, ttl=120, wait=deadline.remaining() if deadline else 60) as acquired:
+            # 等锁期间其他实例可能已上传完成
+            file_id = self.state.get(key)
+            if file_id:
+                return file_id
+            if not acquired:
+                # 其他实例仍在上传同一文件(或存储不可用)，不重复上传，本次按上传失败处理
+                logger.warning(f"[KimiChat] 等待其他实例上传超时: {file_info['name']}")
+                return None
+            logger.info(f"[KimiChat] 开始上传文件: {file_info['name']}")
+            file_id = FileUploader().upload(file_info['name'], file_info['path'], deadline=deadline)
+            if file_id:
+                self.state.set(key, file_id, ttl=self.upload_ttl)
+        return file_id
+
+    def inline_budget_left(self, waiting_info):
+        """本次文件处理中剩余的本地内联字节预算"""
+        if not self.local_text_max_size:
+            return 0
+        used = sum(len(f['text'].encode('utf-8')) for f in waiting_info['received_files'] if f.get('text') is not None)
+        return max(0, self.local_text_total_size - used)
+
     def clean_references(self, text):
-        """清理引用标记"""
+        """清理引用标记、参考文献和markdown符号"""
         if not text:
             return text
-        # 移除引用标记
-        text = re.sub(r'\[\^\d+\^\]', '', text)
-        # 移参考文献部分
-        text = re.sub(r'参考文献：[\s\S]*$', '', text)
-        return text.strip()
+        return "\n\n".join(process_reply(text, len(text) + 1))
+
+    def reply_segments(self, text, tip=True):
+        """追问提示在切分前加入，带提示的最后一段同样不超过 max_reply_length"""
+        return process_reply(text, self.max_reply_length, self.follow_up_tip if tip else "") or ["处理失败，请重试"]
+
+    def reply_text(self, e_context, text, tip=True):
+        """
+        回复经后处理管线单遍清理，超长时按段落/句子切分
+        前面的分段直接发送，最后一段作为插件回复
+        """
+        segments = self.reply_segments(text, tip)
+        for segment in segments[:-1]:
+            e_context["channel"].send(pipeline_reply(segment), e_context["context"])
+        e_context["reply"] = pipeline_reply(segments[-1])
+        e_context.action = EventAction.BREAK_PASS
 
     def handle_files(self, user_id, prompt):
         """处理上传的文件"""
@@ -794,14 +1283,7 @@ class KimiChat(Plugin):
                 received_files = waiting_info.get('received_files', [])
                 for file_info in received_files:
                     if isinstance(file_info, dict) and 'path' in file_info:
-                        file_path = file_info['path']
-                        try:
-                            if os.path.exists(file_path):
-                                os.remove(file_path)
-                                logger.debug(f"[KimiChat] 删除临时文件: {file_path}")
-                        except Exception as e:
-                            logger.error(f"[KimiChat] 删除临时文件失败: {str(e)}")
-                            continue
+                        self.temp_files.release(file_info['path'])
                 
                 # 删除等待状态
                 del self.waiting_files[user_id]
@@ -870,7 +1352,7 @@ class KimiChat(Plugin):
             'is_group': is_group,
             'group_id': group_id
         }
-        logger.debug(f"[KimiChat] 已创建等待记录: {self.waiting_files[waiting_id]}")
+        file_log.debug("[KimiChat] 已创建等待记录: %s", self.waiting_files[waiting_id])
         
         # 返回更详的等待提示
         timeout_minutes = 5
@@ -920,7 +1402,10 @@ class KimiChat(Plugin):
             else:
                 reply_text = "已重置与您的私聊对话。"
             
-            # 清理会话数据
+            # 取消进行中的回复并清理会话数据
+            self.generations.cancel(user_id, "reset")
+            self.chat_data.pop(user_id, None)
+            self.state.delete(f"session:{user_id}")
             if session_key in self.chat_sessions:
                 del self.chat_sessions[session_key]
             
@@ -935,7 +1420,7 @@ class KimiChat(Plugin):
 
     def handle_message(self, context):
         group_name = context.get("group_name")
-        if group_name not in self.conf.get("allowed_groups", []):
+        if group_name not in self.config.get("allowed_groups", []):
             return  # 如果不在允的群组列表中，直接返回
         
         # 继续理消息的其他逻辑
@@ -0,0 +1,126 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 准入控制：按各类请求实测的处理耗时和当前并发估算等待时间，过载时立即回复繁忙而不是排队
+
+"""
+import threading
+import time
+
+from common.log import logger
+
+CLASS_CHAT = "chat"        # 直接提问
+CLASS_URL = "url"          # 用户主动发送的链接
+CLASS_FILE = "file"        # 文件/图片分析
+CLASS_SUMMARY = "summary"  # 分享链接自动总结，优先级最低
+
+LOW_PRIORITY = {CLASS_SUMMARY}
+
+# 各类请求处理耗时的初始估计(秒)，之后按实测值滑动平均
+DEFAULT_SERVICE_TIMES = {CLASS_CHAT: 15, CLASS_URL: 25, CLASS_FILE: 40, CLASS_SUMMARY: 25}
+# 各类请求可接受的最长预计耗时(秒)
+DEFAULT_SLO = {CLASS_CHAT: 60, CLASS_URL: 90, CLASS_FILE: 180, CLASS_SUMMARY: 90}
+
+DEFAULT_BUSY_REPLY = "Kimi当前繁忙，预计需要等待{wait}秒以上，请稍后再试。"
+DEFAULT_SUMMARY_BUSY_REPLY = "当前请求较多，暂不总结该链接，可稍后发送 k+链接 获取总结。"
+
+
+class AdmissionController:
+    """
+    预计耗时 = 该类请求的平均处理耗时 × max(1, (进行中请求数 + 1) / capacity)
+    即并发超过 capacity 后，每个请求按比例变慢
+    - 普通请求：预计耗时超过该类的 slo 时拒绝
+    - 低优先级请求：进行中请求数达到 capacity × low_priority_share 时也拒绝，给直接提问留出余量
+    没有进行中的请求时总是放行，避免耗时估计偏高后无法恢复
+    只有调用过上游接口(mark_upstream)的请求计入平均处理耗时，命中缓存的请求不参与
+    """
+
+    def __init__(self, capacity=6, slo=None, low_priority_share=0.5, alpha=0.2, enabled=True):
+        self.capacity = max(1, capacity)
+        self.slo = dict(DEFAULT_SLO, **(slo or {}))
+        self.low_priority_share = low_priority_share
+        self.alpha = alpha
+        self.enabled = enabled
+        self.service_times = dict(DEFAULT_SERVICE_TIMES)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()  # 当前线程正在处理的请求凭据
+        self._notified = {}  # {key: 上次回复繁忙提示的时间}
+        self.stats = {"admitted": 0, "rejected": 0, "rejected_low": 0}
+
+    def estimate(self, request_class, in_flight=None):
+        in_flight = self.in_flight if in_flight is None else in_flight
+        return self.service_times.get(request_class, DEFAULT_SERVICE_TIMES[CLASS_CHAT]) * \
+            max(1.0, (in_flight + 1) / self.capacity)
+
+    def admit(self, request_class):
+        """
+        :return: 放行时返回凭据(处理结束后交给 release)，拒绝时返回None
+        """
+        if not self.enabled:
+            return self._ticket(request_class)
+        with self._lock:
+            in_flight = self.in_flight
+            estimate = self.estimate(request_class, in_flight)
+            reject = in_flight > 0 and (
+                estimate > self.slo.get(request_class, self.slo[CLASS_CHAT]) or
+                (request_class in LOW_PRIORITY and in_flight >= self.capacity * self.low_priority_share)
+            )
+            if reject:
+                self.stats["rejected"] += 1
+                if request_class in LOW_PRIORITY:
+                    self.stats["rejected_low"] += 1
+            else:
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+        if reject:
+            logger.warning(f"[KimiChat] 过载拒绝({request_class}): 进行中 {in_flight}, 预计耗时 {estimate:.0f}s, "
+                           f"统计: {self.stats}")
+            return None
+        return self._ticket(request_class)
+
+    def _ticket(self, request_class):
+        # [请求类别, 开始时间, 是否调用过上游]
+        ticket = [request_class, time.monotonic(), False]
+        self._local.ticket = ticket
+        return ticket
+
+    def mark_upstream(self):
+        """当前线程的请求实际调用了上游接口，结束时用其耗时更新平均处理耗时"""
+        ticket = getattr(self._local, "ticket", None)
+        if ticket is not None:
+            ticket[2] = True
+
+    def release(self, ticket):
+        """请求处理结束；调用过上游时用实际耗时更新该类的平均处理耗时"""
+        request_class, started, upstream = ticket
+        elapsed = time.monotonic() - started
+        if getattr(self._local, "ticket", None) is ticket:
+            self._local.ticket = None
+        if not self.enabled:
+            return
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if upstream:
+                previous = self.service_times.get(request_class, elapsed)
+                self.service_times[request_class] = previous + self.alpha * (elapsed - previous)
+
+    def busy_reply(self, request_class, template=DEFAULT_BUSY_REPLY, summary_template=DEFAULT_SUMMARY_BUSY_REPLY):
+        if request_class in LOW_PRIORITY:
+            return summary_template
+        # 模板中可能有其他花括号，只替换 {wait}
+        return template.replace("{wait}", str(int(self.estimate(request_class))))
+
+    def notice_due(self, key, interval):
+        """同一 key(如群聊)在 interval 秒内只回复一次繁忙提示，返回本次是否需要回复"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._notified.get(key, -interval) < interval:
+                return False
+            self._notified[key] = now
+            if len(self._notified) > 1000:
+                self._notified = {k: t for k, t in self._notified.items() if now - t < interval}
+            return True
@@ -0,0 +1,172 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 文件/图片分析结果的本地磁盘缓存，按(内容哈希, 提示词, 是否联网)索引
+
+"""
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from common.log import logger
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """归一化提示词：合并空白、去掉首尾标点、统一小写"""
+    prompt = _WHITESPACE.sub(" ", prompt or "").strip().lower()
+    return prompt.strip("。.!！?？,，;； ")
+
+
+class AnswerCache:
+    """
+    每条结果存为一个json文件，重启后依然有效
+    超过 ttl 的条目读取时视为失效；总大小超过 max_bytes 时按最近访问时间淘汰
+    各文件大小和访问顺序在内存中维护，启动时扫描一次目录，写入时不再遍历目录
+    传入共享状态存储时，本地未命中会再查其他实例写入的结果
+    """
+
+    def __init__(self, cache_dir, ttl=7 * 24 * 3600, max_bytes=20 * 1024 * 1024, enabled=True, store=None):
+        self.cache_dir = cache_dir
+        self.store = store
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # {path: size}，按最近访问时间从旧到新
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_entries()
+
+    def _load_entries(self):
+        """启动时扫描缓存目录，清理上次中断留下的临时文件"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp"):
+                self._remove(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        for _, size, path in sorted(entries):
+            self._entries[path] = size
+            self._total += size
+
+    @staticmethod
+    def make_key(content_hashes, prompt, use_search):
+        raw = json.dumps([sorted(content_hashes), normalize_prompt(prompt), bool(use_search)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return self._get_shared(key)
+        if time.time() - entry.get("created_at", 0) > self.ttl:
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None)  # 更新访问时间，重启后仍按LRU淘汰
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        self.hits += 1
+        logger.debug(f"[KimiChat] 结果缓存命中: hits={self.hits}, misses={self.misses}")
+        return entry.get("answer")
+
+    def _get_shared(self, key):
+        """本地未命中时查共享存储，命中后写入本地"""
+        answer = self.store.get(f"answer:{key}") if self.store else None
+        if not answer:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._write(key, answer)
+        logger.debug(f"[KimiChat] 共享结果缓存命中: hits={self.hits}, misses={self.misses}")
+        return answer
+
+    def set(self, key, answer):
+        if not self.enabled or not answer:
+            return
+        if self.store:
+            self.store.set(f"answer:{key}", answer, ttl=self.ttl)
+        self._write(key, answer)
+
+    def _write(self, key, answer):
+        path = self._path(key)
+        tmp_path = None
+        try:
+            # 同一个key可能被多个线程同时写入，各自使用独立的临时文件
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{key}.", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created_at": time.time(), "answer": answer}, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[KimiChat] 写入结果缓存失败: {str(e)}")
+            if tmp_path is not None:
+                self._remove(tmp_path)
+            return
+        with self._lock:
+            self._total += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+        self._evict()
+
+    def _remove(self, path):
+        with self._lock:
+            self._total -= self._entries.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        victims = []
+        with self._lock:
+            while self._total > self.max_bytes and self._entries:
+                path, size = self._entries.popitem(last=False)
+                self._total -= size
+                victims.append(path)
+            total = self._total
+        if not victims:
+            return
+        for path in victims:
+            self._remove(path)
+        logger.debug(f"[KimiChat] 结果缓存淘汰完成，当前大小: {total}")
@@ -9,10 +9,14 @@ Description:
 """
 
 import requests
-import json
 
 from common.log import logger
+from .http_client import get_session
+from .json_codec import dumps, encode_chat_request, loads, sse_text
+from .log_utils import file_log
 from .token_manager import ensure_access_token, tokens
+from .resilience import (BREAKERS, BUSY_REPLY, CircuitOpenError, DEGRADE_BUSY, DEGRADE_DISABLE_SEARCH,
+                         DEGRADE_SKIP_PRE_N2S, is_server_failure, request_timeout)
 
 # 常量定义，用于HTTP请求头
 HEADERS = {
@@ -24,12 +28,19 @@ HEADERS = {
                   'Safari/537.36'
 }
 
+# 对话请求的固定请求头
+STREAM_HEADERS = {
+    'Content-Type': 'application/json',
+    'Origin': 'https://kimi.moonshot.cn'
+}
+
 
 # 创建新会话的函数
 @ensure_access_token
-def create_new_chat_session():
+def create_new_chat_session(deadline=None):
     """
     发送POST请求以创建新的聊天会话。
+    :param deadline: 单条消息的截止时间(Deadline)，为空则只使用默认超时
     :return: 如果请求成功，返回会话ID；如果失败，返回None。
     """
     # 从全局tokens变量中获取access_token
@@ -45,13 +56,33 @@ def create_new_chat_session():
         "is_example": False
     }
 
+    breaker = BREAKERS["session"]
+    if deadline is not None and deadline.remaining() < DEGRADE_BUSY:
+        logger.warning(f"[KimiChat] 剩余时间不足，放弃新建会话: {deadline}")
+        return None
+
     # 发送POST请求
-    response = requests.post('https://kimi.moonshot.cn/api/chat', json=payload, headers=headers)
+    try:
+        breaker.check()
+        response = get_session().post('https://kimi.moonshot.cn/api/chat', data=dumps(payload), headers=headers,
+                                      timeout=request_timeout("session", deadline))
+    except CircuitOpenError:
+        logger.warning("[KimiChat] 新建会话熔断中，直接返回")
+        return None
+    except requests.RequestException as e:
+        breaker.record_failure()
+        logger.error(f"[KimiChat] 新建会话请求失败: {str(e)}")
+        return None
+
+    if is_server_failure(response.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
 
     # 检查响应状态码并处理响应
     if response.status_code == 200:
         logger.debug("[KimiChat] 新建会话ID操作成功！")
-        return response.json().get('id')  # 返回会话ID
+        return loads(response.content).get('id')  # 返回会话ID
     else:
         logger.error(f"[KimiChat] 新建会话ID失败，状态码：{response.status_code}")
         return None
@@ -59,7 +90,7 @@ def create_new_chat_session():
 
 # 实现流式请求聊天数据的函数
 @ensure_access_token
-def stream_chat_responses(chat_id, content, refs=None, use_search=False, new_chat=False):
+def stream_chat_responses(chat_id, content, refs=None, use_search=False, new_chat=False, deadline=None, handle=None):
     """
     处理聊天响应
     :param chat_id: 会话ID
@@ -67,38 +98,37 @@ def stream_chat_responses(chat_id, content, refs=None, use_search=False, new_cha
     :param refs: 引用的文件ID列表
     :param use_search: 是否使用搜索
     :param new_chat: 是否新会话
-    :return: 响应内容
+    :param deadline: 单条消息的截止时间(Deadline)，预算不足时依次跳过pre-n2s、关闭搜索、直接返回繁忙
+    :param handle: 可取消的生成句柄(GenerationHandle)，被重置或新消息取代时关闭上游连接
+    :return: 响应内容，被取代时返回None
     """
-    auth_token = tokens['access_token']
-    headers = {
-        'Authorization': f'Bearer {auth_token}',
-        'Content-Type': 'application/json',
-        'Origin': 'https://kimi.moonshot.cn',
-        'Referer': f'https://kimi.moonshot.cn/chat/{chat_id}'
-    }
-    
-    # 构建请求数据
-    data = {
-        "messages": [{
-            "role": "user",
-            "content": content
-        }],
-        "use_search": use_search,
-        "extend": {"sidebar": True},
-        "kimiplus_id": "kimi",
-        "use_research": False,
-        "use_math": False
-    }
+    if not chat_id:
+        return BUSY_REPLY
+
+    stream_breaker = BREAKERS["stream"]
+    if deadline is not None:
+        remaining = deadline.remaining()
+        if remaining < DEGRADE_BUSY:
+            logger.warning(f"[KimiChat] 剩余时间不足，返回繁忙提示: {deadline}")
+            return BUSY_REPLY
+        if use_search and remaining < DEGRADE_DISABLE_SEARCH:
+            logger.info(f"[KimiChat] 剩余时间不足，关闭联网搜索: {deadline}")
+            use_search = False
+    if stream_breaker.state == stream_breaker.OPEN:
+        logger.warning("[KimiChat] 对话接口熔断中，返回繁忙提示")
+        return BUSY_REPLY
+
+    headers = STREAM_HEADERS.copy()
+    headers['Authorization'] = f"Bearer {tokens['access_token']}"
+    headers['Referer'] = f'https://kimi.moonshot.cn/chat/{chat_id}'
     
     # 处理文件引用
+    refs_file = []
     if refs:
         # 确保refs是列表
         if isinstance(refs, str):
             refs = [refs]
         
-        data["refs"] = refs
-        refs_file = []
-        
         for ref_id in refs:
             try:
                 file_info = get_file_info(ref_id)
@@ -156,44 +186,145 @@ def stream_chat_responses(chat_id, content, refs=None, use_search=False, new_cha
             except Exception as e:
                 logger.error(f"[KimiChat] 获取文件信息失败: {str(e)}")
                 continue
-        
-        if refs_file:
-            data["refs_file"] = refs_file
+    
+    # 构建请求数据，固定字段已预先序列化
+    body = encode_chat_request(content, use_search, refs, refs_file)
     
     try:
-        # 发送预处理请求
-        pre_url = f"https://kimi.moonshot.cn/api/chat/{chat_id}/pre-n2s"
-        pre_response = requests.post(pre_url, headers=headers, json=data)
-        pre_response.raise_for_status()
-        
+        # 发送预处理请求，预算紧张或接口熔断时跳过
+        pre_breaker = BREAKERS["pre_n2s"]
+        skip_pre = deadline is not None and deadline.remaining() < DEGRADE_SKIP_PRE_N2S
+        if skip_pre:
+            logger.info(f"[KimiChat] 剩余时间不足，跳过pre-n2s: {deadline}")
+        elif pre_breaker.allow_request():
+            pre_url = f"https://kimi.moonshot.cn/api/chat/{chat_id}/pre-n2s"
+            try:
+                pre_response = get_session().post(pre_url, headers=headers, data=body,
+                                                  timeout=request_timeout("pre_n2s", deadline))
+            except requests.RequestException as e:
+                pre_breaker.record_failure()
+                logger.warning(f"[KimiChat] pre-n2s请求失败，继续发送消息: {str(e)}")
+            else:
+                # 只有5xx/429计为上游故障，4xx说明上游可用
+                if is_server_failure(pre_response.status_code):
+                    pre_breaker.record_failure()
+                else:
+                    pre_breaker.record_success()
+                if pre_response.status_code >= 400:
+                    logger.warning(f"[KimiChat] pre-n2s请求失败，继续发送消息: {pre_response.status_code}")
+        else:
+            logger.info("[KimiChat] pre-n2s熔断中，跳过")
+
         # 发送实际的聊天请求
+        try:
+            stream_breaker.check()
+        except CircuitOpenError:
+            return BUSY_REPLY
         url = f"https://kimi.moonshot.cn/api/chat/{chat_id}/completion/stream"
-        response = requests.post(url, headers=headers, json=data, stream=True)
-        response.raise_for_status()
-        
-        content = ""
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    try:
-                        json_data = json.loads(line[6:])
-                        if json_data.get('event') == 'cmpl' and 'text' in json_data:
-                            content += json_data['text']
-                    except json.JSONDecodeError:
-                        continue
-        
-        final_content = content.strip()
-        if not final_content:
-            logger.error("[KimiChat] 未获取到有效回复内容")
-            return "很抱歉，处理失败，请重试。"
-            
-        return final_content
+        # 每次放行的请求都要有结论：连接错误和5xx计为失败，上游正常响应计为成功，
+        # 被取消或用完消息预算时只归还探测名额，不影响熔断统计
+        outcome = None
+        try:
+            try:
+                response = get_session().post(url, headers=headers, data=body, stream=True,
+                                              timeout=request_timeout("stream", deadline))
+            except requests.RequestException:
+                outcome = "failure"
+                raise
+            if is_server_failure(response.status_code):
+                outcome = "failure"
+            elif response.status_code >= 400:
+                outcome = "success"
+            response.raise_for_status()
+            if handle is not None:
+                handle.attach(response)
+
+            content = ""
+            timed_out = False
+            try:
+                for line in response.iter_lines():
+                    if handle is not None and handle.cancelled:
+                        break
+                    if deadline is not None and deadline.expired():
+                        timed_out = True
+                        if handle is not None:
+                            handle.cancel("deadline")
+                        break
+                    if line:
+                        text = sse_text(line)
+                        if text:
+                            content += text
+            except requests.RequestException:
+                if handle is not None and handle.superseded:
+                    return None
+                outcome = "failure"
+                if not content:
+                    raise
+                timed_out = True
+            finally:
+                response.close()
+
+            if handle is not None and handle.superseded:
+                logger.info(f"[KimiChat] 回复已被取消({handle.cancel_reason})，丢弃 {len(content)} 字")
+                return None
+
+            final_content = content.strip()
+            if timed_out:
+                logger.warning(f"[KimiChat] 流式回复超时，已关闭连接，已接收 {len(final_content)} 字")
+                if not final_content:
+                    return BUSY_REPLY
+                return final_content + "\n\n（回复超时，内容可能不完整）"
+
+            outcome = "success"
+            if not final_content:
+                logger.error("[KimiChat] 未获取到有效回复内容")
+                return "很抱歉，处理失败，请重试。"
+
+            return final_content
+        finally:
+            if outcome == "failure":
+                stream_breaker.record_failure()
+            elif outcome == "success":
+                stream_breaker.record_success()
+            else:
+                stream_breaker.release()
         
     except Exception as e:
+        if handle is not None and handle.superseded:
+            return None
         logger.error(f"[KimiChat] 发送消息失败: {str(e)}")
         return f"处理失败: {str(e)}"
 
+
+@ensure_access_token
+def stop_chat_generation(chat_id):
+    """
+    通知Kimi停止会话中正在进行的生成
+    :param chat_id: 会话ID
+    :return: 是否成功
+    """
+    auth_token = tokens['access_token']
+    headers = HEADERS.copy()
+    headers['Authorization'] = f'Bearer {auth_token}'
+    try:
+        response = get_session().post(f'https://kimi.moonshot.cn/api/chat/{chat_id}/completion/stop', json={},
+                                      headers=headers, timeout=request_timeout("session"))
+        if response.status_code == 200:
+            logger.debug(f"[KimiChat] 已停止会话生成: {chat_id}")
+            return True
+        logger.warning(f"[KimiChat] 停止会话生成失败，状态码：{response.status_code}")
+    except requests.RequestException as e:
+        logger.warning(f"[KimiChat] 停止会话生成请求失败: {str(e)}")
+    return False
+
+def is_failed_reply(content):
+    """判断 stream_chat_responses 的返回是否为失败/繁忙提示"""
+    if not content:
+        return True
+    return (content == BUSY_REPLY or content.startswith("处理失败")
+            or content.startswith("很抱歉，处理失败") or content.endswith("（回复超时，内容可能不完整）"))
+
+
 def get_file_info(file_id):
     """获取文件信息"""
     try:
@@ -223,7 +354,7 @@ def get_file_info(file_id):
             "done": True
         }
         
-        logger.debug(f"[KimiChat] 构建文件信息: {file_info}")
+        file_log.debug("[KimiChat] 构建文件信息: %s", file_info)
         return file_info
         
     except Exception as e:
@@ -0,0 +1,224 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 配置热加载：轮询 config.json 的修改时间，校验通过后整体替换为新的只读快照
+
+"""
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from common.log import logger
+from .router import MessageRouter
+
+# 除换行、回车、制表符外的控制字符
+_CONTROL_CHARS = dict.fromkeys(c for c in range(32) if chr(c) not in "\n\r\t")
+
+DEFAULT_FILE_FORMATS = [
+    ".dot", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".ppa", ".pptx",
+    ".md", ".pdf", ".txt", ".csv",
+    ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp",
+    ".py", ".java", ".cpp", ".c", ".h", ".hpp", ".js", ".ts", ".html", ".css",
+    ".json", ".xml", ".yaml", ".yml", ".sh", ".bat",
+    ".log", ".ini", ".conf", ".properties"
+]
+
+# 必填项及其类型
+REQUIRED_KEYS = {
+    "refresh_token": str,
+    "keyword": str,
+    "reset_keyword": str,
+    "toggle_search_keyword": str,
+    "group_names": list,
+    "auto_summary": bool,
+    "summary_prompt": str,
+    "exclude_urls": list,
+    "file_upload": bool,
+    "file_triggers": list,
+    "file_parsing_prompts": str,
+    "image_prompts": str,
+    "use_system_prompt": bool,
+    "show_custom_prompt": bool,
+}
+
+# 选填项及其类型
+OPTIONAL_KEYS = {
+    "allowed_groups": list,
+    "profile_keyword": str,
+    "supported_file_formats": list,
+    "max_reply_length": int,
+    "local_text_max_size": (int, float),
+    "local_text_total_size": (int, float),
+    "map_reduce": dict,
+    "logging": dict,
+}
+
+
+class ConfigError(Exception):
+    pass
+
+
+def _freeze(value):
+    """逐层转换为只读结构：dict 转为 MappingProxyType，list 转为 tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def load_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().translate(_CONTROL_CHARS)
+    try:
+        return json.loads(content)
+    except ValueError as e:
+        raise ConfigError(f"配置文件格式错误: {e}")
+
+
+def validate_config(conf):
+    if not isinstance(conf, dict):
+        raise ConfigError("配置文件顶层必须是对象")
+    for key, expected in REQUIRED_KEYS.items():
+        if key not in conf:
+            raise ConfigError(f"缺少配置项: {key}")
+        if not isinstance(conf[key], expected):
+            raise ConfigError(f"配置项 {key} 类型错误")
+    for key, expected in OPTIONAL_KEYS.items():
+        if key in conf and not isinstance(conf[key], expected):
+            raise ConfigError(f"配置项 {key} 类型错误")
+    for key in ("group_names", "exclude_urls", "file_triggers", "allowed_groups"):
+        if not all(isinstance(item, str) for item in conf.get(key, [])):
+            raise ConfigError(f"配置项 {key} 只能包含字符串")
+
+
+class ConfigSnapshot:
+    """
+    一次加载得到的只读配置，派生的集合、路由表和提示词在构建时一次算好
+    消息处理时读取 manager.snapshot 即可，无需加锁
+    """
+
+    def __init__(self, conf, mtime=0.0):
+        # 嵌套的 dict/list 一并冻结，避免经快照修改到共享的配置
+        conf = _freeze(conf)
+        self.conf = conf
+        self.mtime = mtime
+
+        # 基础配置
+        self.keyword = conf["keyword"]
+        self.reset_keyword = conf["reset_keyword"]
+        self.toggle_search_keyword = conf["toggle_search_keyword"]
+
+        # 群组配置
+        self.group_names = conf["group_names"]
+        self.auto_summary = conf["auto_summary"]
+        self.summary_prompt = conf["summary_prompt"]
+        self.exclude_urls = conf["exclude_urls"]
+
+        # 文件处理配置
+        self.file_upload = conf["file_upload"]
+        self.file_triggers = conf["file_triggers"]
+        self.file_parsing_prompts = conf["file_parsing_prompts"]
+        self.image_prompts = conf["image_prompts"]
+        self.use_system_prompt = conf["use_system_prompt"]
+        self.show_custom_prompt = conf["show_custom_prompt"]
+        self.supported_formats = frozenset(ext.lower() for ext in conf.get("supported_file_formats", DEFAULT_FILE_FORMATS))
+        self.max_reply_length = conf.get("max_reply_length", 1800)  # 单条回复的最大长度，超出后分段发送
+        # 小于该大小(KB)的纯文本文件本地读取后直接内联，不走上传流程，0 表示关闭
+        self.local_text_max_size = conf.get("local_text_max_size", 64) * 1024
+        self.local_text_total_size = conf.get("local_text_total_size", 256) * 1024
+        # 超大文档的分块并行分析
+        self.map_reduce_conf = conf.get("map_reduce", MappingProxyType({}))
+        self.follow_up_tip = f"\n\n发送 {self.keyword}+问题 可以继续追问"
+
+        # 触发词、关键词、群组和排除链接的路由表
+        self.router = MessageRouter(
+            keyword=self.keyword,
+            reset_keyword=self.reset_keyword,
+            toggle_search_keyword=self.toggle_search_keyword,
+            file_triggers=self.file_triggers,
+            allowed_groups=conf.get("allowed_groups", []),
+            group_names=self.group_names,
+            exclude_urls=self.exclude_urls,
+            profile_keyword=conf.get("profile_keyword", "kimi性能分析")
+        )
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get("_frozen"):
+            raise AttributeError("ConfigSnapshot is read-only")
+        super().__setattr__(name, value)
+
+
+class ConfigManager:
+    """
+    按 interval 秒轮询配置文件的修改时间和大小，变化时重新加载
+    新配置校验失败时记录错误并继续使用旧快照
+    """
+
+    def __init__(self, path, interval=5, on_reload=None):
+        self.path = path
+        self.interval = interval
+        self.on_reload = on_reload
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.snapshot = self._load()
+
+    def get(self, key, default=None):
+        """读取当前快照中的原始配置项"""
+        return self.snapshot.conf.get(key, default)
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime, stat.st_size
+
+    def _load(self):
+        stamp = self._file_stamp()
+        conf = load_config(self.path)
+        validate_config(conf)
+        snapshot = ConfigSnapshot(conf, stamp[0])
+        self._stamp = stamp
+        return snapshot
+
+    def reload(self, force=False):
+        """配置文件有变化时重新加载，返回是否替换了快照"""
+        with self._lock:
+            try:
+                if not force and self._file_stamp() == self._stamp:
+                    return False
+                old, snapshot = self.snapshot, self._load()
+            except (OSError, ConfigError) as e:
+                # 记录当前时间戳，文件再次修改前不重复报错
+                try:
+                    self._stamp = self._file_stamp()
+                except OSError:
+                    pass
+                logger.error(f"[KimiChat] 重新加载配置失败，继续使用原配置: {e}")
+                return False
+            self.snapshot = snapshot
+        logger.info("[KimiChat] 配置已重新加载")
+        if self.on_reload:
+            try:
+                self.on_reload(old, snapshot)
+            except Exception as e:
+                logger.error(f"[KimiChat] 应用新配置出错: {e}")
+        return True
+
+    def start(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        if self.interval <= 0 or self._thread:
+            return
+        self._thread = threading.Thread(target=self._watch, name="kimi-config-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            self.reload()
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 会话轮转：记录每个会话的轮数和估算token，超过阈值时换用新会话并带上近期对话摘要
+
+"""
+import collections
+import re
+import threading
+
+from common.log import logger
+
+_CJK = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# 轮转前后各统计几轮的耗时
+LATENCY_WINDOW = 3
+
+
+def estimate_tokens(text):
+    """粗略估算token数：中日韩字符每字约1个，其余约4个字符1个"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _clip(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class ConversationTracker:
+    """
+    轮数、token和近期问答记录在 chat_data 的会话字典中，随会话一起重置
+    """
+
+    def __init__(self, max_turns=20, max_tokens=12000, summary_turns=6, summary_chars=1500, enabled=True):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_turns = summary_turns
+        self.summary_chars = summary_chars
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._latency = {"before": [0.0, 0], "after": [0.0, 0]}
+        self.rollovers = 0
+
+    def should_rollover(self, chat_info):
+        if not self.enabled or not chat_info:
+            return False
+        return chat_info.get('turns', 0) >= self.max_turns or chat_info.get('tokens', 0) >= self.max_tokens
+
+    def record(self, chat_info, question, answer, latency, sent=None):
+        """
+        记录一轮问答
+        :param sent: 实际发送的内容(轮转后的首个问题带有摘要)，为空时即 question
+        """
+        chat_info['turns'] = chat_info.get('turns', 0) + 1
+        chat_info['tokens'] = chat_info.get('tokens', 0) + estimate_tokens(sent or question) + estimate_tokens(answer)
+        recent = chat_info.setdefault('recent', collections.deque(maxlen=self.summary_turns))
+        recent.append((question, answer))
+        latencies = chat_info.setdefault('latencies', collections.deque(maxlen=LATENCY_WINDOW))
+        latencies.append(latency)
+        if chat_info.get('rolled') and chat_info['turns'] <= LATENCY_WINDOW:
+            self._add_latency("after", [latency])
+
+    def build_summary(self, chat_info):
+        """用最近几轮问答拼出摘要，超出字数时舍弃较早的轮次"""
+        recent = list(chat_info.get('recent', []))
+        if not recent:
+            return ""
+        per_turn = max(80, self.summary_chars // len(recent))
+        turns = []
+        used = 0
+        for question, answer in reversed(recent):
+            turn = f"用户：{_clip(question, per_turn // 3)}\nKimi：{_clip(answer, per_turn - per_turn // 3)}"
+            if turns and used + len(turn) > self.summary_chars:
+                break
+            turns.append(turn)
+            used += len(turn) + 1
+        return "\n".join(reversed(turns))
+
+    def seed_prompt(self, summary, content):
+        if not summary:
+            return content
+        return f"以下是我们之前对话的摘要，请在此基础上继续：\n{summary}\n\n当前问题：{content}"
+
+    def rolled_over(self, old_info, new_info):
+        """旧会话已替换为新会话，记录轮转前的耗时"""
+        new_info['rolled'] = True
+        with self._lock:
+            self.rollovers += 1
+        self._add_latency("before", old_info.get('latencies', []))
+        logger.info(f"[KimiChat] 会话轮转: {old_info.get('chatid')} -> {new_info.get('chatid')}, "
+                    f"轮数={old_info.get('turns', 0)}, 估算token={old_info.get('tokens', 0)}, 统计: {self.stats()}")
+
+    def _add_latency(self, key, values):
+        with self._lock:
+            for value in values:
+                self._latency[key][0] += value
+                self._latency[key][1] += 1
+
+    def stats(self):
+        with self._lock:
+            result = {"rollovers": self.rollovers}
+            for key, (total, count) in self._latency.items():
+                result[f"avg_latency_{key}"] = round(total / count, 2) if count else None
+            return result
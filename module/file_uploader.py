@@ -8,15 +8,40 @@ Description:
 
 """
 
-import requests
-from PIL import Image
-import json
 import os
 import time
 import uuid
 
+import requests
+
 from common.log import logger
+from .http_client import get_session
+from .json_codec import dumps, loads
+from .log_utils import file_log
 from .token_manager import ensure_access_token, tokens
+from .resilience import BREAKERS, CircuitOpenError, DEGRADE_BUSY, is_server_failure, request_timeout
+
+
+class UploadApiError(Exception):
+    """Kimi上传接口返回非200，按状态码判断是否计入熔断"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StorageUploadError(Exception):
+    """上传到对象存储失败，与Kimi接口是否可用无关"""
+    pass
+
+
+def _upload_outcome(error, outcome):
+    """Kimi接口的连接错误和5xx/429计为失败，4xx说明接口可用；对象存储和本地文件的错误不改变已有结论"""
+    if isinstance(error, UploadApiError):
+        return "failure" if is_server_failure(error.status_code) else "success"
+    if isinstance(error, requests.RequestException):
+        return "failure"
+    return outcome
 
 
 class FileUploader:
@@ -34,7 +59,7 @@ class FileUploader:
         return f"{user_id}/{date}/{random_id}"
 
     @ensure_access_token
-    def get_presigned_url(self, file_name, is_image=False):
+    def get_presigned_url(self, file_name, is_image=False, deadline=None):
         auth_token = tokens['access_token']
         headers = {
             'Authorization': f'Bearer {auth_token}',
@@ -44,29 +69,32 @@ class FileUploader:
             "action": "image" if is_image else "file",
             "name": file_name
         }
-        logger.debug(f"[KimiChat] 获取预签名URL请求头: {headers}")
-        logger.debug(f"[KimiChat] 获取预签名URL请求体: {payload}")
-        response = requests.post(self.pre_sign_url_api, headers=headers, json=payload)
-        logger.debug(f"[KimiChat] 获取预签名URL响应状态码: {response.status_code}")
-        logger.debug(f"[KimiChat] 获取预签名URL响应内容: {response.text}")
+        file_log.debug("[KimiChat] 获取预签名URL请求体: %s", payload)
+        response = get_session().post(self.pre_sign_url_api, headers=headers, data=dumps(payload),
+                                      timeout=request_timeout("upload", deadline))
+        file_log.debug("[KimiChat] 获取预签名URL响应状态码: %s", response.status_code)
         
         if response.status_code == 200:
-            response_data = response.json()
-            logger.debug(f"[KimiChat] 获取预签名URL成功: {response_data}")
+            response_data = loads(response.content)
+            file_log.debug("[KimiChat] 获取预签名URL成功: %s", response_data)
             return response_data
         else:
-            raise Exception(f"[KimiChat] 获取预签名URL失败: {response.text}")
+            raise UploadApiError(f"[KimiChat] 获取预签名URL失败: {response.text}", response.status_code)
 
-    def upload_file(self, url, file_path):
+    def upload_file(self, url, file_path, deadline=None):
         """上传文件到预签名URL"""
         with open(file_path, 'rb') as file:
-            response = requests.put(url, data=file)
+            try:
+                response = get_session().put(url, data=file, timeout=request_timeout("upload", deadline))
+            except requests.RequestException as e:
+                raise StorageUploadError(f"[KimiChat] 文件上传失败: {e}") from e
             if response.status_code != 200:
-                raise Exception(f"[KimiChat] 文件上传失败: {response.status_code}")
+                raise StorageUploadError(f"[KimiChat] 文件上传失败: {response.status_code}")
             logger.debug(f"[KimiChat] 文件上传成功: {response.status_code}")
 
     def get_image_dimensions(self, file_path):
         try:
+            from PIL import Image  # 只在上传图片时才需要PIL
             with Image.open(file_path) as img:
                 width, height = img.size
                 return str(width), str(height)
@@ -75,7 +103,7 @@ class FileUploader:
             return "940", "940"
 
     @ensure_access_token
-    def notify_file_upload(self, file_info, file_path=None, is_image=False):
+    def notify_file_upload(self, file_info, file_path=None, is_image=False, deadline=None):
         auth_token = tokens['access_token']
         headers = {
             'Authorization': f'Bearer {auth_token}',
@@ -93,14 +121,15 @@ class FileUploader:
                 }
             })
         
-        logger.debug(f"[KimiChat] 通知文件上传请求: {file_info}")
-        response = requests.post(self.file_upload_api, headers=headers, json=file_info)
+        file_log.debug("[KimiChat] 通知文件上传请求: %s", file_info)
+        response = get_session().post(self.file_upload_api, headers=headers, data=dumps(file_info),
+                                      timeout=request_timeout("upload", deadline))
         if response.status_code == 200:
-            response_data = response.json()
-            logger.debug(f"[KimiChat] 通知文件上传成功: {response_data}")
+            response_data = loads(response.content)
+            file_log.debug("[KimiChat] 通知文件上传成功: %s", response_data)
             return response_data.get("id")
         else:
-            raise Exception(f"[KimiChat] 通知文件上传失败: {response.text}")
+            raise UploadApiError(f"[KimiChat] 通知文件上传失败: {response.text}", response.status_code)
 
     @ensure_access_token
     def parse_process(self, ids):
@@ -115,10 +144,10 @@ class FileUploader:
         }
         
         try:
-            response = requests.post(
+            response = get_session().post(
                 self.parse_process_api,
                 headers=headers,
-                json=payload,
+                data=dumps(payload),
                 timeout=10
             )
             if response.status_code == 200:
@@ -144,33 +173,47 @@ class FileUploader:
         }
         
         try:
-            response = requests.post(
+            response = get_session().post(
                 "https://kimi.moonshot.cn/api/file/recommend_prompt",
                 headers=headers,
-                json=payload,
+                data=dumps(payload),
                 timeout=10
             )
             if response.status_code == 200:
-                data = response.json()
+                data = loads(response.content)
                 return data.get("recommend_prompt", "")
         except Exception as e:
             logger.error(f"[KimiChat] 获取推荐提示词失败: {str(e)}")
         return ""
 
-    def upload(self, filename, filepath):
+    def upload(self, filename, filepath, deadline=None):
+        breaker = BREAKERS["upload"]
+        if deadline is not None and deadline.remaining() < DEGRADE_BUSY:
+            logger.warning(f"[KimiChat] 剩余时间不足，放弃上传文件: {deadline}")
+            return None
         try:
-            logger.debug(f"[KimiChat] 准备上传文件: {filename}")
-            logger.debug(f"[KimiChat] 文件路径: {filepath}")
+            breaker.check()
+        except CircuitOpenError:
+            logger.warning("[KimiChat] 文件上传熔断中，跳过上传")
+            return None
+
+        # 每次放行的上传都要有结论：Kimi接口的连接错误和5xx计为失败，接口正常响应计为成功，
+        # 没有请求到Kimi接口时只归还探测名额
+        outcome = None
+        try:
+            file_log.debug("[KimiChat] 准备上传文件: %s", filename)
+            file_log.debug("[KimiChat] 文件路径: %s", filepath)
             
             # 判断是否为图片
             is_image = filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'))
             
             # 1. 获取预签名 URL
-            pre_sign_info = self.get_presigned_url(filename, is_image)
-            logger.debug(f"[KimiChat] 获取预签名URL响应: {pre_sign_info}")
+            pre_sign_info = self.get_presigned_url(filename, is_image, deadline=deadline)
+            file_log.debug("[KimiChat] 获取预签名URL响应: %s", pre_sign_info)
+            outcome = "success"
             
             # 2. 上传文件到预签名 URL
-            self.upload_file(pre_sign_info['url'], filepath)
+            self.upload_file(pre_sign_info['url'], filepath, deadline=deadline)
             logger.debug("[KimiChat] 文件上传完成")
             
             # 3. 通知服务器文件已上传
@@ -190,13 +233,13 @@ class FileUploader:
                     }
                 })
             
-            file_id = self.notify_file_upload(file_info, filepath if is_image else None, is_image)
-            logger.debug(f"[KimiChat] 获得文件ID: {file_id}")
+            file_id = self.notify_file_upload(file_info, filepath if is_image else None, is_image, deadline=deadline)
+            file_log.debug("[KimiChat] 获得文件ID: %s", file_id)
             
             # 4. 获取系统推荐的提示词
             if file_id:
                 recommend_prompt = self.get_recommend_prompt(file_id)
-                logger.debug(f"[KimiChat] 系统推荐提示词: {recommend_prompt}")
+                file_log.debug("[KimiChat] 系统推荐提示词: %s", recommend_prompt)
                 
                 # 5. 通知开始解析文件(不等待结果)
                 self.parse_process(file_id)
@@ -205,5 +248,13 @@ class FileUploader:
             return file_id
             
         except Exception as e:
+            outcome = _upload_outcome(e, outcome)
             logger.error(f"[KimiChat] 上传过程中发生错误: {str(e)}", exc_info=True)
             return None
+        finally:
+            if outcome == "failure":
+                breaker.record_failure()
+            elif outcome == "success":
+                breaker.record_success()
+            else:
+                breaker.release()
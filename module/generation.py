@@ -0,0 +1,155 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 可取消的生成任务，按会话跟踪正在进行的流式回复
+
+"""
+import threading
+import time
+
+from common.log import logger
+
+
+class GenerationHandle:
+    """一次流式生成的句柄，取消时关闭上游连接，读取线程随即退出"""
+
+    def __init__(self, session_key, asker_id=None, chat_id=None, registry=None):
+        self.session_key = session_key
+        self.asker_id = asker_id
+        self.chat_id = chat_id
+        self.started_at = time.monotonic()
+        self.cancel_reason = None
+        self._registry = registry
+        self._response = None
+        self._children = []
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def superseded(self):
+        """被重置或新消息取代，结果不应再回复给用户"""
+        return self.cancelled and self.cancel_reason != "deadline"
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def attached(self):
+        """是否已经绑定上游响应，即问题已发送给Kimi"""
+        with self._lock:
+            return self._response is not None
+
+    def attach(self, response):
+        """绑定上游响应，若已被取消则立即关闭"""
+        with self._lock:
+            self._response = response
+        if self.cancelled:
+            self._close()
+
+    def child(self):
+        """
+        创建子句柄，用于同一任务中并发的多个流式请求(如分块分析)
+        父句柄取消时子句柄随之取消
+        """
+        child = GenerationHandle(self.session_key, self.asker_id)
+        with self._lock:
+            self._children.append(child)
+        if self.cancelled:
+            child.cancel(self.cancel_reason)
+        return child
+
+    def cancel(self, reason):
+        with self._lock:
+            if self._cancelled.is_set():
+                return False
+            self.cancel_reason = reason
+            self._cancelled.set()
+            children = list(self._children)
+        self._close()
+        for child in children:
+            child.cancel(reason)
+        if self._registry is not None:
+            self._registry._on_cancelled(self)
+        return True
+
+    def _close(self):
+        with self._lock:
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception as e:
+                logger.debug(f"[KimiChat] 关闭上游连接出错: {str(e)}")
+
+
+class GenerationRegistry:
+    """
+    按会话登记正在进行的生成任务
+    同一提问者的新消息会取代旧任务，重置会话会取消该会话下的所有任务
+    """
+
+    def __init__(self, stop_upstream=False, stop_func=None):
+        self.stop_upstream = stop_upstream
+        self.stop_func = stop_func
+        self._active = {}  # {session_key: {asker_id: handle}}
+        self._lock = threading.Lock()
+        self._avg_duration = None
+        self.stats = {
+            "started": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "freed_stream_seconds": 0.0,
+        }
+
+    def start(self, session_key, asker_id=None, chat_id=None):
+        handle = GenerationHandle(session_key, asker_id, chat_id, registry=self)
+        with self._lock:
+            askers = self._active.setdefault(session_key, {})
+            previous = askers.get(asker_id)
+            askers[asker_id] = handle
+            self.stats["started"] += 1
+        if previous is not None:
+            logger.info(f"[KimiChat] 新消息取代进行中的回复: session={session_key}, asker={asker_id}")
+            previous.cancel("superseded")
+        return handle
+
+    def finish(self, handle):
+        with self._lock:
+            askers = self._active.get(handle.session_key, {})
+            if askers.get(handle.asker_id) is handle:
+                del askers[handle.asker_id]
+                if not askers:
+                    self._active.pop(handle.session_key, None)
+            if not handle.cancelled:
+                self.stats["completed"] += 1
+                duration = handle.elapsed()
+                if self._avg_duration is None:
+                    self._avg_duration = duration
+                else:
+                    self._avg_duration = self._avg_duration * 0.8 + duration * 0.2
+
+    def cancel(self, session_key, reason):
+        """取消会话下的所有生成任务，返回取消的数量"""
+        with self._lock:
+            handles = list(self._active.pop(session_key, {}).values())
+        count = sum(1 for handle in handles if handle.cancel(reason))
+        if count:
+            logger.info(f"[KimiChat] 已取消 {count} 个进行中的回复: session={session_key}, reason={reason}")
+        return count
+
+    def _on_cancelled(self, handle):
+        # 释放的流时长按历史平均生成时长估算
+        with self._lock:
+            self.stats["cancelled"] += 1
+            if self._avg_duration is not None:
+                self.stats["freed_stream_seconds"] += max(0.0, self._avg_duration - handle.elapsed())
+        if self.stop_upstream and self.stop_func and handle.chat_id:
+            threading.Thread(target=self.stop_func, args=(handle.chat_id,), daemon=True).start()
+        logger.debug(f"[KimiChat] 生成任务统计: {self.stats}")
@@ -0,0 +1,222 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 共享的HTTP连接池，所有Kimi接口复用同一个Session，启动后可在后台预先建立连接
+             可选HTTP/2(需安装 httpx[http2])：并发的流式回复和上传请求复用少量连接，出错时退回HTTP/1.1
+
+"""
+import threading
+import time
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.log import logger
+
+BASE_URL = "https://kimi.moonshot.cn"
+
+# HTTP/2 连续出现协议错误达到该次数后，本次运行改用HTTP/1.1
+HTTP2_MAX_FAILURES = 3
+
+_session = None
+_lock = threading.Lock()
+_http_conf = {}
+
+
+def configure(http_conf):
+    """设置传输方式；已有会话且配置变化时关闭旧会话，下次请求按新配置创建"""
+    global _http_conf
+    http_conf = dict(http_conf or {})
+    if http_conf != _http_conf:
+        close_session()
+    _http_conf = http_conf
+
+
+def close_session():
+    """关闭共享会话(包括HTTP/2的连接检测线程)"""
+    global _session
+    with _lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+def _requests_session():
+    session = requests.Session()
+    # 与直接调用 requests.post 一致，不在请求之间保留cookie
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """返回进程内共享的Session，首次调用时创建"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _requests_session()
+                if _http_conf.get("http2", False):
+                    try:
+                        _session = Http2Session(_session, _http_conf)
+                        logger.info("[KimiChat] 已启用HTTP/2传输")
+                    except ImportError:
+                        logger.warning("[KimiChat] 未安装 httpx[http2]，使用HTTP/1.1")
+    return _session
+
+
+def warm_up(timeout=5):
+    """预先完成DNS解析和TLS握手，连接放回连接池供后续请求复用"""
+    try:
+        get_session().head(BASE_URL, timeout=timeout)
+        return True
+    except requests.RequestException as e:
+        logger.debug(f"[KimiChat] 预建连接失败: {e}")
+        return False
+
+
+def _httpx_timeout(httpx, timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+class Http2Response:
+    """把 httpx 的响应包装成调用方用到的 requests.Response 接口"""
+
+    def __init__(self, response, httpx):
+        self._response = response
+        self._httpx = httpx
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    @property
+    def text(self):
+        return self._response.text
+
+    @property
+    def content(self):
+        return self._response.content
+
+    def json(self):
+        return self._response.json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self._response.url}", response=self)
+
+    def iter_lines(self):
+        try:
+            for line in self._response.iter_lines():
+                yield line.encode("utf-8")
+        except self._httpx.HTTPError as e:
+            raise _translate(self._httpx, e) from e
+
+    def close(self):
+        self._response.close()
+
+
+def _translate(httpx, e):
+    """httpx 异常转换为 requests 异常，调用方的异常处理和熔断统计保持不变"""
+    if isinstance(e, httpx.TimeoutException):
+        return requests.Timeout(str(e))
+    if isinstance(e, httpx.TransportError):
+        return requests.ConnectionError(str(e))
+    return requests.RequestException(str(e))
+
+
+class Http2Session:
+    """
+    基于 httpx 的HTTP/2会话，提供与 requests.Session 相同的 get/post/put/head
+    - 同一主机的并发请求在少量连接上多路复用，max_connections 限制连接数
+    - ping_interval 秒内没有请求时发送一次 HEAD，保持连接可用并尽早发现断开；close() 后检测线程退出
+    - 协议错误累计 HTTP2_MAX_FAILURES 次后，后续请求改用传入的 HTTP/1.1 会话
+    """
+
+    def __init__(self, fallback, http_conf):
+        import httpx
+        import h2  # noqa: F401  缺少时 httpx 会在首次请求才报错，这里提前检查
+        self._httpx = httpx
+        self.fallback = fallback
+        self.failures = 0
+        self.disabled = False
+        limits = httpx.Limits(
+            max_connections=http_conf.get("max_connections", 4),
+            max_keepalive_connections=http_conf.get("max_connections", 4),
+            keepalive_expiry=http_conf.get("keepalive_expiry", 60)
+        )
+        self.client = httpx.Client(
+            http2=True,
+            limits=limits,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        )
+        self._last_used = time.monotonic()
+        self._closed = threading.Event()
+        self.ping_interval = http_conf.get("ping_interval", 30)
+        if self.ping_interval > 0:
+            # 线程只持有弱引用，会话被丢弃而未调用 close() 时线程也会退出
+            threading.Thread(target=self._ping_loop, args=(weakref.ref(self), self._closed, self.ping_interval),
+                             name="kimi-http2-ping", daemon=True).start()
+
+    @staticmethod
+    def _ping_loop(ref, closed, interval):
+        while not closed.wait(interval):
+            session = ref()
+            if session is None or session.disabled:
+                return
+            if time.monotonic() - session._last_used >= interval:
+                try:
+                    session.head(BASE_URL, timeout=5)
+                except requests.RequestException as e:
+                    logger.debug(f"[KimiChat] HTTP/2连接检测失败: {e}")
+            del session
+
+    def close(self):
+        self._closed.set()
+        self.client.close()
+        self.fallback.close()
+
+    def request(self, method, url, headers=None, json=None, data=None, stream=False, timeout=None):
+        if self.disabled:
+            return self.fallback.request(method, url, headers=headers, json=json, data=data, stream=stream,
+                                         timeout=timeout)
+        httpx = self._httpx
+        self._last_used = time.monotonic()
+        try:
+            req = self.client.build_request(method, url, headers=headers, json=json, content=data,
+                                            timeout=_httpx_timeout(httpx, timeout))
+            response = self.client.send(req, stream=stream)
+        except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+            self._record_failure(e)
+            raise _translate(httpx, e) from e
+        except httpx.HTTPError as e:
+            raise _translate(httpx, e) from e
+        self.failures = 0
+        return Http2Response(response, httpx)
+
+    def _record_failure(self, error):
+        self.failures += 1
+        logger.warning(f"[KimiChat] HTTP/2协议错误({self.failures}/{HTTP2_MAX_FAILURES}): {error}")
+        if self.failures >= HTTP2_MAX_FAILURES and not self.disabled:
+            self.disabled = True
+            logger.error("[KimiChat] HTTP/2多次出错，改用HTTP/1.1")
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
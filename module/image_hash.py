@@ -0,0 +1,198 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 图片感知哈希与近似重复图片的识别结果复用
+微信转发会重新压缩、缩放图片，字节级哈希无法命中，这里用感知哈希+汉明距离查找
+
+"""
+import collections
+import math
+import threading
+import time
+
+from common.log import logger
+from .answer_cache import normalize_prompt
+
+
+def _load_gray(file_path, width, height):
+    """读取图片并缩放为灰度像素矩阵"""
+    from PIL import Image  # 按需导入，未开启识图时不加载PIL
+
+    with Image.open(file_path) as img:
+        img = img.convert("L").resize((width, height), Image.LANCZOS)
+        pixels = list(img.getdata())
+    return [pixels[row * width:(row + 1) * width] for row in range(height)]
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def ahash(file_path, size=8):
+    """均值哈希：像素是否高于均值"""
+    rows = _load_gray(file_path, size, size)
+    pixels = [p for row in rows for p in row]
+    mean = sum(pixels) / len(pixels)
+    return _bits_to_int(p > mean for p in pixels)
+
+
+def dhash(file_path, size=8):
+    """差值哈希：相邻像素的明暗变化"""
+    rows = _load_gray(file_path, size + 1, size)
+    return _bits_to_int(row[col] > row[col + 1] for row in rows for col in range(size))
+
+
+_DCT_CACHE = {}
+
+
+def _dct_matrix(n):
+    if n not in _DCT_CACHE:
+        _DCT_CACHE[n] = [[math.cos(math.pi * (2 * x + 1) * u / (2 * n)) for x in range(n)] for u in range(n)]
+    return _DCT_CACHE[n]
+
+
+def phash(file_path, size=8, highfreq_factor=4):
+    """DCT哈希：低频DCT系数是否高于中位数，对缩放和压缩最稳定"""
+    n = size * highfreq_factor
+    rows = _load_gray(file_path, n, n)
+    matrix = _dct_matrix(n)
+    # 可分离的二维DCT，只计算需要的左上角低频部分
+    row_dct = [[sum(c * p for c, p in zip(matrix[u], row)) for u in range(size)] for row in rows]
+    low = [[sum(matrix[v][y] * row_dct[y][u] for y in range(n)) for u in range(size)] for v in range(size)]
+    values = [value for row in low for value in row]
+    median = sorted(values[1:])[len(values[1:]) // 2]  # 跳过直流分量
+    return _bits_to_int(value > median for value in values)
+
+
+HASH_FUNCTIONS = {"ahash": ahash, "dhash": dhash, "phash": phash}
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """按汉明距离组织的BK树，查询时利用三角不等式剪枝"""
+
+    def __init__(self):
+        self.root = None  # [hash, value, {distance: child}]
+        self.size = 0
+
+    def add(self, item_hash, value):
+        node = [item_hash, value, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(item_hash, current[0])
+            if distance == 0:
+                current[1] = value
+                self.size -= 1
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, item_hash, max_distance):
+        """
+        :return: ([(距离, value)], 访问的节点数)，按距离升序
+        """
+        if self.root is None:
+            return [], 0
+        results = []
+        visited = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            visited += 1
+            distance = hamming_distance(item_hash, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node[2].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        results.sort(key=lambda item: item[0])
+        return results, visited
+
+
+class ImageRecognitionCache:
+    """
+    近似重复图片的识别结果缓存
+    每个提示词一棵BK树，超出容量时把最旧的条目标记为已淘汰，查找时跳过
+    已淘汰的条目超过容量的 1/4 时才整体重建，插入的均摊开销不随容量增长
+    """
+
+    def __init__(self, algorithm="phash", threshold=6, max_entries=2000, ttl=7 * 24 * 3600, enabled=True):
+        self.hash_func = HASH_FUNCTIONS.get(algorithm, phash)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._trees = {}
+        self._entries = collections.deque()  # [[created_at, prompt_key, hash, answer, alive]]，按插入顺序
+        self._evicted = 0  # 树中尚未清除的已淘汰条目数
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "visited": 0, "lookup_ms": 0.0}
+
+    def image_hash(self, file_path, workers=None, key=None):
+        """:param workers: ShardedWorkerPool，传入时在 key 对应的工作进程中计算"""
+        try:
+            if workers is not None:
+                return workers.run(key, self.hash_func, file_path)
+            return self.hash_func(file_path)
+        except Exception as e:
+            logger.warning(f"[KimiChat] 计算图片感知哈希失败: {str(e)}")
+            return None
+
+    def lookup(self, image_hash, prompt):
+        """查找相似图片的识别结果，未命中返回None"""
+        if not self.enabled or image_hash is None:
+            return None
+        started_at = time.perf_counter()
+        with self._lock:
+            tree = self._trees.get(normalize_prompt(prompt))
+            results, visited = tree.search(image_hash, self.threshold) if tree else ([], 0)
+            cost_ms = (time.perf_counter() - started_at) * 1000
+            self.stats["lookups"] += 1
+            self.stats["visited"] += visited
+            self.stats["lookup_ms"] += cost_ms
+            now = time.time()
+            for distance, (created_at, _, _, answer, alive) in results:
+                if alive and now - created_at <= self.ttl:
+                    self.stats["hits"] += 1
+                    logger.info(f"[KimiChat] 相似图片命中: 距离={distance}, 访问节点={visited}, 耗时={cost_ms:.3f}ms")
+                    return answer
+        logger.debug(f"[KimiChat] 相似图片未命中: 访问节点={visited}, 耗时={cost_ms:.3f}ms, 统计={self.stats}")
+        return None
+
+    def add(self, image_hash, prompt, answer):
+        if not self.enabled or image_hash is None or not answer:
+            return
+        prompt_key = normalize_prompt(prompt)
+        entry = [time.time(), prompt_key, image_hash, answer, True]
+        with self._lock:
+            self._entries.append(entry)
+            self._trees.setdefault(prompt_key, BKTree()).add(image_hash, entry)
+            while len(self._entries) > self.max_entries:
+                self._entries.popleft()[4] = False
+                self._evicted += 1
+            if self._evicted > self.max_entries // 4:
+                self._rebuild()
+
+    def _rebuild(self):
+        """只用未淘汰的条目重建各BK树"""
+        self._trees = {}
+        for entry in self._entries:
+            self._trees.setdefault(entry[1], BKTree()).add(entry[2], entry)
+        self._evicted = 0
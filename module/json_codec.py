@@ -0,0 +1,74 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 请求体编码和SSE解析：安装了 orjson 时使用 orjson，否则使用标准库；对话请求中的固定字段预先序列化
+
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    BACKEND = "orjson"
+    dumps = orjson.dumps
+    loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+else:
+    BACKEND = "json"
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    _decoder = json.JSONDecoder()
+    JSONDecodeError = json.JSONDecodeError
+
+    def dumps(obj):
+        """序列化为UTF-8字节"""
+        return _encoder.encode(obj).encode("utf-8")
+
+    def loads(data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode("utf-8")
+        return _decoder.decode(data)
+
+# 对话请求中每次都相同的字段
+_CHAT_STATIC = b'"extend":{"sidebar":true},"kimiplus_id":"kimi","use_research":false,"use_math":false'
+_CHAT_PREFIX = b'{"messages":[{"role":"user","content":'
+_SEARCH = {True: b'}],"use_search":true,', False: b'}],"use_search":false,'}
+
+_SSE_PREFIX = b"data: "
+_CMPL = b"cmpl"
+
+
+def encode_chat_request(content, use_search, refs=None, refs_file=None):
+    """
+    拼接对话请求体，与 dumps(data) 结果等价
+    :return: UTF-8 字节，以 data= 发送并自带 Content-Type
+    """
+    parts = [_CHAT_PREFIX, dumps(content), _SEARCH[bool(use_search)], _CHAT_STATIC]
+    if refs:
+        parts += [b',"refs":', dumps(refs)]
+    if refs_file:
+        parts += [b',"refs_file":', dumps(refs_file)]
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+def sse_text(line):
+    """
+    从一行SSE中取出回复文本，不是 cmpl 事件时返回None
+    原始字节中没有 "cmpl" 的行(ping、搜索进度等)不做json解析
+    """
+    if not line.startswith(_SSE_PREFIX) or _CMPL not in line:
+        return None
+    try:
+        event = loads(line[6:])
+    except (JSONDecodeError, UnicodeDecodeError):
+        return None
+    if event.get('event') == 'cmpl':
+        return event.get('text')
+    return None
+
@@ -0,0 +1,102 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 群聊链接合并总结：时间窗口内分享的链接按群收集、按规范化URL去重，一次请求生成合并摘要
+
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from common.log import logger
+
+# 分享链接中常见的跟踪参数
+TRACKING_PARAMS = {
+    "from", "scene", "srcid", "sharer_sharetime", "sharer_shareid", "clicktime",
+    "enterid", "isappinstalled", "sessionid", "subscene", "ascene", "devicetype", "version", "nettype",
+    "lang", "exportkey", "pass_ticket", "wx_header", "share_token", "share_source", "spm", "spm_id_from",
+    "vd_source", "timestamp", "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+}
+# 公众号文章只靠这几个参数即可唯一确定
+WECHAT_ARTICLE_PARAMS = ("__biz", "mid", "idx", "sn")
+
+
+def canonical_url(url):
+    """去掉跟踪参数、锚点和默认端口，参数排序，用于判断是否是同一篇文章"""
+    url = url.strip().replace("&amp;", "&")
+    if "://" not in url:
+        url = "http://" + url
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if host == "mp.weixin.qq.com" and parts.path.startswith("/s") and any(k == "__biz" for k, _ in params):
+        params = [(k, v) for k, v in params if k in WECHAT_ARTICLE_PARAMS]
+    else:
+        params = [(k, v) for k, v in params if k.lower() not in TRACKING_PARAMS]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme, host, path,
+                       urlencode(sorted(params)), ""))
+
+
+class LinkDigestBatcher:
+    """
+    每个群第一条链接到达时开始计时，window 秒后或凑满 max_batch 条时一起交给 flush_func
+    已总结过的链接在 recent_ttl 秒内再次分享会被忽略
+    """
+
+    def __init__(self, flush_func, window=60, max_batch=5, recent_ttl=600):
+        self.flush_func = flush_func
+        self.window = window
+        self.max_batch = max_batch
+        self.recent_ttl = recent_ttl
+        self._groups = {}  # {群: {'items': OrderedDict(规范化URL -> item), 'timer': Timer}}
+        self._recent = {}  # {规范化URL: 总结时间}
+        self._lock = threading.Lock()
+        self.stats = {"links": 0, "duplicates": 0, "batches": 0}
+
+    def add(self, key, url, item):
+        """加入待总结队列，重复的链接返回False"""
+        canon = canonical_url(url)
+        now = time.time()
+        with self._lock:
+            for recent_url, at in list(self._recent.items()):
+                if now - at > self.recent_ttl:
+                    del self._recent[recent_url]
+            group = self._groups.get(key)
+            if canon in self._recent or (group and canon in group['items']):
+                self.stats["duplicates"] += 1
+                return False
+            if group is None:
+                timer = threading.Timer(self.window, self._flush, [key])
+                timer.daemon = True
+                group = self._groups[key] = {'items': OrderedDict(), 'timer': timer}
+                timer.start()
+            group['items'][canon] = dict(item, url=url)
+            self.stats["links"] += 1
+            full = len(group['items']) >= self.max_batch
+        if full:
+            group['timer'].cancel()
+            threading.Thread(target=self._flush, args=(key,), name="kimi-link-digest", daemon=True).start()
+        return True
+
+    def _flush(self, key):
+        with self._lock:
+            group = self._groups.pop(key, None)
+            if not group:
+                return
+            now = time.time()
+            for canon in group['items']:
+                self._recent[canon] = now
+            self.stats["batches"] += 1
+        items = list(group['items'].values())
+        logger.info(f"[KimiChat] 合并总结 {len(items)} 条链接, 统计: {self.stats}")
+        try:
+            self.flush_func(key, items)
+        except Exception as e:
+            logger.error(f"[KimiChat] 合并总结失败: {e}", exc_info=True)
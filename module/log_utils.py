@@ -0,0 +1,174 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 日志辅助：按类别开关和采样、队列异步写日志、自动隐藏token
+
+"""
+import atexit
+import logging
+import queue
+import random
+import re
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from common.log import logger as common_logger
+
+# 对话过程(chat)和文件处理过程(file)日志的开关与采样率
+_categories = {"chat": True, "file": True}
+_sample_rates = {"chat": 1.0, "file": 1.0}
+
+_listener = None
+_queue = None
+_lock = threading.Lock()
+
+# Bearer 令牌、JWT 以及 access_token/refresh_token 字段的值
+_SECRET_PATTERN = re.compile(
+    r"(?P<bearer>Bearer\s+)[\w\-.=]+"
+    r"|(?P<field>(?:access_token|refresh_token)['\"]?\s*[:=]\s*['\"]?)[^'\"\s,}]+"
+    r"|eyJ[\w\-]+\.[\w\-]+\.[\w\-]+"
+)
+
+
+def _mask(match):
+    return (match.group("bearer") or match.group("field") or "") + "***"
+
+
+def redact(text):
+    return _SECRET_PATTERN.sub(_mask, text)
+
+
+class RedactingFormatter(logging.Formatter):
+    """只格式化日志正文并隐藏其中的token，时间、级别等由最终输出的handler添加"""
+
+    def format(self, record):
+        return redact(record.getMessage())
+
+
+class RedactingHandler(logging.Handler):
+    """
+    在监听线程(同步输出时为调用线程)中格式化并隐藏token，再交给原本经向上传递会到达的handler
+    只处理真正输出的日志，不修改共享logger的handler
+    """
+
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = logger
+        self.setFormatter(RedactingFormatter())
+
+    def emit(self, record):
+        record.msg = self.format(record)
+        record.args = None
+        found = False
+        parent = self.logger.parent
+        while parent:
+            for handler in parent.handlers:
+                found = True
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            if not parent.propagate:
+                break
+            parent = parent.parent
+        if not found and logging.lastResort and record.levelno >= logging.lastResort.level:
+            logging.lastResort.handle(record)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """进程内队列不需要序列化，与转交用的handler一起原样入队，格式化留到监听线程"""
+
+    def __init__(self, log_queue, forward):
+        super().__init__(log_queue)
+        self.forward = forward
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        self.queue.put_nowait((self.forward, record))
+
+
+class _Listener(QueueListener):
+
+    def handle(self, item):
+        forward, record = item
+        forward.handle(record)
+
+
+class CategoryLogger:
+    """
+    按类别输出 debug/info 日志：类别关闭时直接丢弃，开启时按采样率输出
+    参数使用 %s 占位，未输出时不会格式化；warning 及以上不受影响
+    """
+
+    def __init__(self, logger, category):
+        self.logger = logger
+        self.category = category
+
+    def _enabled(self, level):
+        if not _categories.get(self.category, True) or not self.logger.isEnabledFor(level):
+            return False
+        rate = _sample_rates.get(self.category, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def debug(self, msg, *args, **kwargs):
+        if self._enabled(logging.DEBUG):
+            self.logger.debug(msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        if self._enabled(logging.INFO):
+            self.logger.info(msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.logger.warning(msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.logger.error(msg, *args, **kwargs)
+
+
+def _get_queue():
+    global _listener, _queue
+    with _lock:
+        if _listener is None:
+            _queue = queue.SimpleQueue()
+            _listener = _Listener(_queue)
+            _listener.start()
+            atexit.register(_listener.stop)
+    return _queue
+
+
+def _install(logger, use_async):
+    """
+    插件自己的logger不再向上传递，日志经 RedactingHandler 转给上级logger的handler
+    异步时先放入队列，由后台线程转交；热加载时重新安装
+    """
+    for handler in [h for h in logger.handlers if isinstance(h, (RedactingHandler, _DeferredQueueHandler))]:
+        logger.removeHandler(handler)
+    forward = RedactingHandler(logger)
+    logger.addHandler(_DeferredQueueHandler(_get_queue(), forward) if use_async else forward)
+    logger.propagate = False
+
+
+def configure(log_config, loggers=()):
+    """
+    根据 logging 配置更新类别开关和采样率；热加载时可重复调用
+    :param loggers: 插件自己的logger，隐藏其中的token并可异步输出；插件的 chat_log/file_log 总是包含在内
+                    common.log 的共享logger及其handler不做修改
+    """
+    _categories["chat"] = log_config.get("show_chat_process", True)
+    _categories["file"] = log_config.get("show_file_process", True)
+    sample_rate = log_config.get("sample_rate", {})
+    for category in _sample_rates:
+        _sample_rates[category] = float(sample_rate.get(category, 1.0))
+
+    targets = [plugin_logger] + [logger for logger in loggers if logger not in (plugin_logger, common_logger)]
+    for logger in targets:
+        _install(logger, log_config.get("async", True))
+
+
+# 插件模块的分类日志使用共享logger的子logger
+plugin_logger = common_logger.getChild("kimi_chat")
+chat_log = CategoryLogger(plugin_logger, "chat")
+file_log = CategoryLogger(plugin_logger, "file")
@@ -0,0 +1,180 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 超大文档的分块并行分析(map)与结果合并(reduce)
+
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.log import logger
+from .api_models import is_failed_reply, stream_chat_responses
+from .text_extractor import detect_encoding, is_text_file
+
+MAP_PROMPT = (
+    "这是一份长文档的第{index}/{total}部分（{label}）。"
+    "请只针对这一部分完成以下要求，简洁列出要点，不要编造其他部分的内容：{prompt}"
+    "\n\n```\n{text}\n```"
+)
+
+# 合并阶段所有分块结果的总字数上限，超出时按比例截断每块的结果
+REDUCE_CHARS = 30000
+
+REDUCE_PROMPT = (
+    "以下是同一份文档《{name}》按顺序分段分析的结果，请把它们合并成一份完整、连贯、不重复的回答。"
+    "要求：{prompt}\n\n{parts}"
+)
+
+
+def extract_pdf_pages(file_path):
+    """按页提取PDF文本，未安装pypdf/PyPDF2时返回None"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        try:
+            from PyPDF2 import PdfReader
+        except ImportError:
+            logger.debug("[KimiChat] 未安装pypdf，无法本地拆分PDF")
+            return None
+    try:
+        reader = PdfReader(file_path)
+        return [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        logger.warning(f"[KimiChat] 本地解析PDF失败: {str(e)}")
+        return None
+
+
+def _label(start, end, unit_name):
+    return f"第{start}{unit_name}" if start == end else f"第{start}-{end}{unit_name}"
+
+
+def split_units(units, unit_name, chunk_chars):
+    """
+    把按行或按页的文本单元合并成不超过 chunk_chars 的分块
+    :return: [{'label': '第1-20行', 'text': ...}]
+    """
+    chunks = []
+    buffer = []
+    size = 0
+    start = 1
+    for number, unit in enumerate(units, 1):
+        if buffer and size + len(unit) > chunk_chars:
+            chunks.append({'label': _label(start, number - 1, unit_name), 'text': "\n".join(buffer)})
+            buffer, size, start = [], 0, number
+        # 单个超长单元按字符截断成多块
+        while len(unit) > chunk_chars:
+            chunks.append({'label': f"第{number}{unit_name}(部分)", 'text': unit[:chunk_chars]})
+            unit = unit[chunk_chars:]
+        buffer.append(unit)
+        size += len(unit) + 1
+    if buffer and "".join(buffer).strip():
+        chunks.append({'label': _label(start, len(units), unit_name), 'text': "\n".join(buffer)})
+    return chunks
+
+
+def load_document_chunks(file_path, chunk_chars):
+    """
+    在本地读取并拆分文档，支持PDF(按页)和纯文本(按行)
+    :return: 分块列表；不支持的格式或读取失败时返回None
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        pages = extract_pdf_pages(file_path)
+        if not pages:
+            return None
+        return split_units(pages, "页", chunk_chars)
+    if is_text_file(file_path):
+        with open(file_path, "rb") as f:
+            raw = f.read()
+        encoding = detect_encoding(raw)
+        if not encoding:
+            return None
+        lines = raw.decode(encoding).replace("\r\n", "\n").split("\n")
+        return split_units(lines, "行", chunk_chars)
+    return None
+
+
+def fits_map_reduce(chunks, max_chunks):
+    """
+    拆分结果是否走分块并行分析：只有一块时不必拆分；
+    超过 max_chunks 块时每块都要占用一个新会话，改走普通的上传流程
+    """
+    return bool(chunks) and 1 < len(chunks) <= max_chunks
+
+
+def _clip(text, limit):
+    return text if len(text) <= limit else text[:limit] + "…（已截断）"
+
+
+def run_map_reduce(chunks, prompt, name, session_pool, max_workers=4, deadline=None, handle=None,
+                   reduce_chars=REDUCE_CHARS):
+    """
+    并发分析各个分块，再合并为一个回答
+    :param chunks: load_document_chunks 的返回值
+    :param prompt: 用户的分析要求
+    :param name: 文档名称
+    :param session_pool: SessionPool，用于批量获取会话
+    :param max_workers: 最大并发数
+    :param deadline: 截止时间
+    :param handle: 生成句柄，取消时未开始的分块不再分析，进行中的分块随之关闭连接
+    :param reduce_chars: 合并时所有分块结果的总字数上限
+    :return: (回答, 会话ID, 统计报告)；全部分块失败时回答为None
+    """
+    total = len(chunks)
+    started_at = time.monotonic()
+    chat_ids = session_pool.acquire_many(total + 1, deadline=deadline, max_workers=max_workers)
+    reduce_chat_id = chat_ids.pop()
+    timings = [0.0] * total
+
+    def analyze(index):
+        if handle is not None and handle.cancelled:
+            return None
+        chunk = chunks[index]
+        chunk_started = time.monotonic()
+        content = MAP_PROMPT.format(index=index + 1, total=total, label=chunk['label'],
+                                    prompt=prompt, text=chunk['text'])
+        answer = stream_chat_responses(chat_ids[index], content, new_chat=True, deadline=deadline,
+                                       handle=handle.child() if handle is not None else None)
+        timings[index] = time.monotonic() - chunk_started
+        logger.info(f"[KimiChat] 分块 {index + 1}/{total}({chunk['label']}) 完成，耗时 {timings[index]:.1f}s")
+        return answer
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+        answers = list(executor.map(analyze, range(total)))
+    map_elapsed = time.monotonic() - started_at
+    if handle is not None and handle.superseded:
+        logger.info(f"[KimiChat] 分块分析已取消({handle.cancel_reason})")
+        return None, reduce_chat_id, {'chunks': total, 'cancelled': True}
+
+    parts = []
+    per_part = max(500, reduce_chars // total)
+    for chunk, answer in zip(chunks, answers):
+        if is_failed_reply(answer):
+            parts.append(f"【{chunk['label']}】（该部分分析失败）")
+        else:
+            parts.append(f"【{chunk['label']}】\n{_clip(answer, per_part)}")
+    failed = sum(1 for answer in answers if is_failed_reply(answer))
+
+    report = {
+        'chunks': total,
+        'failed': failed,
+        'chunk_seconds': [round(t, 2) for t in timings],
+        'map_seconds': round(map_elapsed, 2),
+        'speedup': round(sum(timings) / map_elapsed, 2) if map_elapsed > 0 else 0,
+    }
+    if failed == total:
+        report['total_seconds'] = round(time.monotonic() - started_at, 2)
+        logger.error(f"[KimiChat] 所有分块分析失败: {report}")
+        return None, reduce_chat_id, report
+
+    reduce_content = REDUCE_PROMPT.format(name=name, prompt=prompt, parts="\n\n".join(parts))
+    reduce_started = time.monotonic()
+    result = stream_chat_responses(reduce_chat_id, reduce_content, new_chat=True, deadline=deadline, handle=handle)
+    report['reduce_seconds'] = round(time.monotonic() - reduce_started, 2)
+    report['total_seconds'] = round(time.monotonic() - started_at, 2)
+    logger.info(f"[KimiChat] 分块分析完成: {report}")
+    return result, reduce_chat_id, report
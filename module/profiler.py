@@ -0,0 +1,161 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 运行中按需性能分析：采样所有线程的调用栈并记录内存分配，结果写入本地文件
+
+"""
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from common.log import logger
+
+# 重点关注的函数，报告中单独统计经过它们的采样数
+FOCUS_FUNCTIONS = ("on_handle_context", "stream_chat_responses", "upload")
+
+_lock = threading.Lock()
+_running = None
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """
+    在后台线程中每隔 interval 秒采样一次所有线程的调用栈，持续 duration 秒
+    采样期间消息处理照常进行；结束后输出 collapsed stack(可直接生成火焰图)和内存分配 top-N
+    """
+
+    def __init__(self, duration, out_dir, interval=0.005, top_n=20, focus=FOCUS_FUNCTIONS):
+        self.duration = duration
+        self.out_dir = out_dir
+        self.interval = interval
+        self.top_n = top_n
+        self.focus = focus
+        self.stacks = collections.Counter()
+        self.focus_samples = collections.Counter()
+        self.samples = 0
+        self.result = None
+
+    def _sample(self, own_ident):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            labels = []
+            names = set()
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                names.add(frame.f_code.co_name)
+                frame = frame.f_back
+            labels.reverse()
+            self.stacks[";".join(labels)] += 1
+            for name in self.focus:
+                if name in names:
+                    self.focus_samples[name] += 1
+        self.samples += 1
+
+    def run(self):
+        own_ident = threading.get_ident()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        started = time.monotonic()
+        try:
+            while time.monotonic() - started < self.duration:
+                self._sample(own_ident)
+                time.sleep(self.interval)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+        return self._write(snapshot, time.monotonic() - started)
+
+    def _write(self, snapshot, elapsed):
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = time.strftime("profile_%Y%m%d_%H%M%S")
+        stack_path = os.path.join(self.out_dir, name + ".collapsed")
+        report_path = os.path.join(self.out_dir, name + "_report.txt")
+
+        with open(stack_path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        stats = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )).statistics("lineno")
+        lines = [
+            f"采样时长: {elapsed:.1f}s, 采样次数: {self.samples}, 间隔: {self.interval * 1000:.0f}ms",
+            "",
+            "重点函数(出现在调用栈中的采样数):",
+        ]
+        for func in self.focus:
+            count = self.focus_samples.get(func, 0)
+            lines.append(f"  {func}: {count} ({count / max(1, self.samples):.0%})")
+        lines += ["", f"内存分配 top {self.top_n}:"]
+        for stat in stats[:self.top_n]:
+            frame = stat.traceback[0]
+            lines.append(f"  {frame.filename}:{frame.lineno}  {stat.size / 1024:.1f} KB  {stat.count} 次")
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        self.result = {"stacks": stack_path, "report": report_path, "samples": self.samples,
+                       "focus": dict(self.focus_samples)}
+        return self.result
+
+
+def start_profiling(duration, out_dir, on_done=None):
+    """
+    启动一次限时性能分析，已有分析在进行时返回False
+    :param on_done: 完成后以结果字典回调
+    """
+    global _running
+    with _lock:
+        if _running is not None:
+            return False
+        _running = ProfileSession(duration, out_dir)
+        session = _running
+
+    def _run():
+        global _running
+        result = None
+        try:
+            result = session.run()
+            logger.info(f"[KimiChat] 性能分析完成: {result['stacks']}, {result['report']}")
+        except Exception as e:
+            logger.error(f"[KimiChat] 性能分析失败: {e}", exc_info=True)
+        finally:
+            with _lock:
+                _running = None
+        if on_done:
+            on_done(result)
+
+    threading.Thread(target=_run, name="kimi-profiler", daemon=True).start()
+    return True
+
+
+def install_signal_handler(out_dir, duration=30, signum=getattr(signal, "SIGUSR1", None)):
+    """收到 SIGUSR1 时启动一次性能分析；不支持该信号或不在主线程时忽略"""
+    if signum is None:
+        return False
+
+    def _handler(sig, frame):
+        if not start_profiling(duration, out_dir):
+            logger.info("[KimiChat] 已有性能分析在进行中")
+
+    try:
+        signal.signal(signum, _handler)
+        return True
+    except ValueError:
+        # 只能在主线程中注册信号处理
+        logger.debug("[KimiChat] 非主线程，未注册性能分析信号")
+        return False
@@ -0,0 +1,116 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 回复后处理：单遍去除引用标记、参考文献和markdown符号，并按段落/句子切分长回复
+
+"""
+import re
+
+# 单个正则一次完成所有行内替换
+_INLINE_PATTERN = re.compile(
+    r"(?P<cite>\[\^\d+\^\])"
+    r"|(?P<fence>^[ \t]*```.*$)"
+    r"|(?P<heading>^[ \t]{0,3}#{1,6}[ \t]+)"
+    r"|(?P<quote>^[ \t]{0,3}>[ \t]?)"
+    r"|(?P<bullet>^(?P<indent>[ \t]*)[-*+][ \t]+)"
+    r"|(?P<emphasis>\*\*|`)",
+    re.M
+)
+
+REFERENCE_MARKER = "参考文献："
+
+# 句子结束符，用于没有段落边界时的切分
+_SENTENCE_END = re.compile(r"[。！？!?；;…]|\.(?=\s)")
+
+
+def _replace(match):
+    if match.group("bullet") is not None:
+        return match.group("indent") + "• "
+    return ""
+
+
+def clean_text(text):
+    """去除引用标记和markdown符号"""
+    return _INLINE_PATTERN.sub(_replace, text)
+
+
+def _split_point(text, max_length):
+    """在 max_length 以内寻找最合适的切分位置"""
+    window = text[:max_length]
+    for boundary in ("\n\n", "\n"):
+        index = window.rfind(boundary)
+        if index >= max_length // 2:
+            return index + len(boundary)
+    last = None
+    for last in _SENTENCE_END.finditer(window):
+        pass
+    if last is not None and last.end() >= max_length // 2:
+        return last.end()
+    return max_length
+
+
+class ReplyPostProcessor:
+    """
+    可增量输入的回复处理器：
+    feed() 接收任意长度的片段，只处理完整的行，返回已经可以发送的分段；
+    finish() 处理剩余内容并返回最后的分段
+    """
+
+    def __init__(self, max_length=1800):
+        self.max_length = max_length
+        self._pending = ""  # 尚未凑成完整行的原始文本
+        self._buffer = ""  # 已清理、等待切分的文本
+        self._dropped = False  # 已进入参考文献部分，丢弃后续内容
+
+    def feed(self, chunk):
+        if self._dropped or not chunk:
+            return []
+        self._pending += chunk
+        cut = self._pending.rfind("\n")
+        if cut < 0:
+            return []
+        lines, self._pending = self._pending[:cut + 1], self._pending[cut + 1:]
+        self._accept(lines)
+        return self._drain(final=False)
+
+    def finish(self, tail=""):
+        """
+        :param tail: 追加在回复末尾的固定文本(如追问提示)，不做清理，与正文一起参与切分
+        """
+        if not self._dropped and self._pending:
+            self._accept(self._pending)
+        self._pending = ""
+        if tail and self._buffer.strip():
+            self._buffer = self._buffer.rstrip() + tail
+        return self._drain(final=True)
+
+    def _accept(self, text):
+        marker = text.find(REFERENCE_MARKER)
+        if marker >= 0:
+            text = text[:marker]
+            self._dropped = True
+        self._buffer += clean_text(text)
+
+    def _drain(self, final):
+        segments = []
+        while len(self._buffer) > self.max_length:
+            point = _split_point(self._buffer, self.max_length)
+            segment = self._buffer[:point].strip()
+            self._buffer = self._buffer[point:].lstrip("\n")
+            if segment:
+                segments.append(segment)
+        if final:
+            segment = self._buffer.strip()
+            self._buffer = ""
+            if segment:
+                segments.append(segment)
+        return segments
+
+
+def process_reply(text, max_length=1800, tail=""):
+    """处理完整回复，返回分段列表，每段(包括带 tail 的最后一段)都不超过 max_length"""
+    processor = ReplyPostProcessor(max_length)
+    return processor.feed(text) + processor.finish(tail)
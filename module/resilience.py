@@ -0,0 +1,151 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: Kimi接口的熔断器、分级超时与单条消息截止时间
+
+"""
+import threading
+import time
+
+from common.log import logger
+
+
+# 各接口的分级超时 (连接超时, 读取超时)，单位秒
+# stream 的读取超时是两次数据之间的最大间隔，整体时长由 Deadline 控制
+TIMEOUTS = {
+    "session": (5, 15),
+    "pre_n2s": (5, 10),
+    "stream": (5, 60),
+    "upload": (5, 60),
+    "refresh": (5, 10),
+}
+
+# 剩余预算低于这些阈值(秒)时进入降级路径
+DEGRADE_SKIP_PRE_N2S = 40
+DEGRADE_DISABLE_SEARCH = 25
+DEGRADE_BUSY = 8
+
+BUSY_REPLY = "Kimi当前繁忙，请稍后再试。"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    简单的三态熔断器：closed -> open -> half_open -> closed
+    连续失败达到阈值后打开，冷却时间过后放行少量探测请求(half_open)，
+    探测成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"[KimiChat] 熔断器 {self.name} 进入半开状态，开始探测")
+
+    def allow_request(self):
+        """判断当前是否允许发起请求"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"[KimiChat] 熔断器 {self.name} 探测成功，恢复关闭状态")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def release(self):
+        """请求没有得出上游是否正常的结论(被取消、用完消息预算)，归还半开状态下的探测名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"[KimiChat] 熔断器 {self.name} 打开，连续失败 {self._failures} 次")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_calls = 0
+
+    def check(self):
+        """不允许请求时抛出 CircuitOpenError"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.name} 熔断中")
+
+
+# 每个接口一个熔断器，互不影响
+BREAKERS = {name: CircuitBreaker(name) for name in TIMEOUTS}
+
+
+class Deadline:
+    """单条消息的处理截止时间，在各个处理阶段之间传递"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def __repr__(self):
+        return f"Deadline(remaining={self.remaining():.1f}s)"
+
+
+def request_timeout(endpoint, deadline=None):
+    """
+    获取接口的 (连接, 读取) 超时，存在截止时间时不超过剩余预算
+    """
+    connect_timeout, read_timeout = TIMEOUTS[endpoint]
+    if deadline is None:
+        return connect_timeout, read_timeout
+    remaining = max(deadline.remaining(), 0.1)
+    return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+
+def is_server_failure(status_code):
+    """5xx 和 429 视为上游故障，计入熔断统计"""
+    return status_code >= 500 or status_code == 429
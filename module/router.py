@@ -0,0 +1,127 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 消息路由表：根据配置一次性构建前缀树、预编译正则和群组/域名索引
+
+"""
+import re
+from urllib.parse import urlsplit
+
+ROUTE_RESET = "reset"
+ROUTE_TOGGLE_SEARCH = "toggle_search"
+ROUTE_FILE_TRIGGER = "file_trigger"
+ROUTE_PROFILE = "profile"
+ROUTE_URL = "url"
+ROUTE_CHAT = "chat"
+
+URL_PATTERN = re.compile(r'https?://[^\s<>"]+|www\.[^\s<>"]+(?:\?[^\s<>"]*)?(?:#[^\s<>"]*)?')
+
+
+class PrefixTrie:
+    """字符前缀树，一次遍历找出所有与文本开头匹配的词"""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, word, value):
+        if not word:
+            return
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node.setdefault(None, (word, value))  # 重复的词保留先配置的
+
+    def prefixes(self, text):
+        """按长度从短到长返回 [(词, 值)]"""
+        node = self.root
+        found = []
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        return found
+
+
+class MessageRouter:
+    """
+    文本消息一次前缀匹配即可判断：重置、切换联网、性能分析、文件触发、普通对话，或与机器人无关
+    """
+
+    def __init__(self, keyword="", reset_keyword="", toggle_search_keyword="", file_triggers=None,
+                 allowed_groups=None, group_names=None, exclude_urls=None, profile_keyword=""):
+        self.keyword = keyword
+        self.reset_keyword = reset_keyword
+        self.toggle_search_keyword = toggle_search_keyword
+        self.allowed_groups = frozenset(allowed_groups or [])
+        self.group_names = frozenset(group_names or [])
+
+        # 重置和切换联网要求整句完全匹配，触发词和关键词按前缀匹配
+        self.exact = {}
+        if reset_keyword:
+            self.exact[reset_keyword] = ROUTE_RESET
+        if toggle_search_keyword:
+            self.exact.setdefault(toggle_search_keyword, ROUTE_TOGGLE_SEARCH)
+        self.trie = PrefixTrie()
+        self.trie.add(profile_keyword, ROUTE_PROFILE)
+        for trigger in file_triggers or []:
+            self.trie.add(trigger, ROUTE_FILE_TRIGGER)
+        self.trie.add(keyword, ROUTE_CHAT)
+
+        # 排除链接按域名建立索引；带路径的规则无法按域名判断，保留子串匹配
+        self.exclude_domains = set()
+        self.exclude_substrings = []
+        for rule in exclude_urls or []:
+            if "/" in rule or ":" in rule:
+                self.exclude_substrings.append(rule)
+            else:
+                self.exclude_domains.add(rule.lower())
+
+    def route(self, content):
+        """
+        :return: (路由类型, 匹配到的触发词或关键词)，与机器人无关时返回 (None, None)
+        """
+        route = self.exact.get(content)
+        if route:
+            return route, content
+        matches = self.trie.prefixes(content)
+        # 命令和文件触发词优先于对话关键词，同类取最长
+        for word, route in reversed(matches):
+            if route != ROUTE_CHAT:
+                return route, word
+        if matches:
+            word = matches[-1][0]
+        elif self.keyword:
+            return None, None
+        else:
+            word = ""
+        if "http" in content:
+            return ROUTE_URL, word
+        return ROUTE_CHAT, word
+
+    def group_allowed(self, group_name):
+        return not self.allowed_groups or group_name in self.allowed_groups
+
+    def summary_group(self, group_name):
+        return group_name in self.group_names
+
+    def is_excluded_url(self, url):
+        host = (urlsplit(url if "://" in url else "http://" + url).hostname or "").lower()
+        domains = self.exclude_domains
+        while host:
+            if host in domains:
+                return True
+            dot = host.find(".")
+            if dot < 0:
+                break
+            host = host[dot + 1:]
+        return any(rule in url for rule in self.exclude_substrings)
+
+    @staticmethod
+    def find_url(content):
+        match = URL_PATTERN.search(content)
+        return match.group(0) if match else None
@@ -0,0 +1,137 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 本地规则判断问题是否需要联网搜索，并统计节省的耗时和用户重复提问率
+
+"""
+import re
+import threading
+import time
+from functools import lru_cache
+
+from common.log import logger
+
+# 时效性强的问题
+_TIME_SENSITIVE = re.compile(
+    r"今天|今日|明天|昨天|现在|目前|最新|最近|近期|本周|这周|本月|今年|刚刚|实时|新闻|热搜|头条|天气|气温|"
+    r"股价|股票|汇率|油价|金价|比分|赛果|赛程|票房|疫情|发布会|上映|开售|"
+    r"\b(?:today|tomorrow|yesterday|now|latest|recent|current|news|weather|price|stock|score)\b",
+    re.I
+)
+# 查找具体事实的问题
+_FACTUAL = re.compile(
+    r"是谁|谁是|哪一年|哪年|什么时候|何时|多少钱|价格|官网|地址|电话|在哪|哪里买|排名|排行|发布了|"
+    r"是多少|有哪些.*(?:公司|产品|型号)|"
+    r"\b(?:who is|who was|when did|when is|where is|how much|ranking|official site)\b",
+    re.I
+)
+# 不需要搜索的任务：改写、翻译、创作、代码、计算、解释给定内容
+_NO_SEARCH = re.compile(
+    r"翻译|润色|改写|扩写|缩写|续写|仿写|写一[首篇段个]|作诗|写诗|起名|取名|代码|函数|报错|正则|sql|"
+    r"计算|算一下|解方程|证明|总结一下|概括|这段|下面的|以下|解释一下|什么意思|"
+    r"\b(?:translate|rewrite|polish|write a|code|function|regex|calculate|prove|explain)\b",
+    re.I
+)
+_URL = re.compile(r"https?://|<url ", re.I)
+_YEAR = re.compile(r"(20\d{2})\s*年?")
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())[:300]
+
+
+@lru_cache(maxsize=4096)
+def classify(text):
+    """
+    :param text: 规范化后的问题
+    :return: (是否搜索, 原因)
+    """
+    if _URL.search(text):
+        return False, "url"
+    score = 0
+    reasons = []
+    if _TIME_SENSITIVE.search(text):
+        score += 2
+        reasons.append("time")
+    years = [int(y) for y in _YEAR.findall(text)]
+    if years and max(years) >= time.localtime().tm_year - 1:
+        score += 2
+        reasons.append("year")
+    if _FACTUAL.search(text):
+        score += 1
+        reasons.append("fact")
+    if _NO_SEARCH.search(text):
+        score -= 2
+        reasons.append("task")
+    return score > 0, ",".join(reasons) or "default"
+
+
+def _bigrams(text):
+    text = text.replace(" ", "")
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+class SearchClassifier:
+    """
+    判定不搜索后，同一提问者在 reask_window 秒内又问了相似的问题，视为一次重复提问(可能判断错了)
+    """
+
+    def __init__(self, enabled=True, reask_window=120, similarity=0.6, report_every=100):
+        self.enabled = enabled
+        self.reask_window = reask_window
+        self.similarity = similarity
+        self.report_every = report_every
+        self._last = {}  # {提问者: (二元组集合, 是否搜索, 时间)}
+        self._lock = threading.Lock()
+        self._stats = {"decisions": 0, "search": 0, "no_search": 0, "reasked": 0,
+                       "search_latency": [0.0, 0], "no_search_latency": [0.0, 0]}
+
+    def decide(self, text):
+        return classify(_normalize(text))
+
+    def observe(self, asker_id, text, use_search):
+        """记录一次判定，并检查是否是对上一次不搜索回答的重复提问"""
+        grams = _bigrams(_normalize(text))
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(asker_id)
+            if last and not last[1] and now - last[2] <= self.reask_window:
+                overlap = len(grams & last[0]) / max(1, len(grams | last[0]))
+                if overlap >= self.similarity:
+                    self._stats["reasked"] += 1
+            self._last[asker_id] = (grams, use_search, now)
+            if len(self._last) > 10000:
+                self._last.pop(next(iter(self._last)))
+            self._stats["decisions"] += 1
+            self._stats["search" if use_search else "no_search"] += 1
+            report = self._stats["decisions"] % self.report_every == 0
+        if report:
+            logger.info(f"[KimiChat] 联网判断统计: {self.stats()}")
+
+    def record_latency(self, use_search, seconds):
+        with self._lock:
+            bucket = self._stats["search_latency" if use_search else "no_search_latency"]
+            bucket[0] += seconds
+            bucket[1] += 1
+
+    def stats(self):
+        with self._lock:
+            s = self._stats
+            avg_search = s["search_latency"][0] / s["search_latency"][1] if s["search_latency"][1] else None
+            avg_plain = s["no_search_latency"][0] / s["no_search_latency"][1] if s["no_search_latency"][1] else None
+            saved = None
+            if avg_search is not None and avg_plain is not None:
+                saved = round(max(0.0, avg_search - avg_plain) * s["no_search"], 1)
+            return {
+                "decisions": s["decisions"],
+                "search": s["search"],
+                "no_search": s["no_search"],
+                "avg_latency_search": round(avg_search, 2) if avg_search is not None else None,
+                "avg_latency_no_search": round(avg_plain, 2) if avg_plain is not None else None,
+                "saved_seconds": saved,
+                "reask_rate": round(s["reasked"] / s["no_search"], 3) if s["no_search"] else None,
+                "cache": classify.cache_info()._asdict(),
+            }
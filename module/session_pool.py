@@ -0,0 +1,104 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 预先创建的Kimi会话池，减少提问前新建会话的等待
+
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.log import logger
+from .api_models import create_new_chat_session
+
+
+class SessionPool:
+    """
+    维护一批预先创建的空会话
+    取用时优先从池中拿，池空时现场创建；过旧的会话直接丢弃
+    """
+
+    def __init__(self, size=2, max_age=1800, create_func=create_new_chat_session):
+        self.size = size
+        self.max_age = max_age
+        self.create_func = create_func
+        self._sessions = []  # [(chat_id, created_at)]
+        self._lock = threading.Lock()
+        self._filling = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _pop(self):
+        now = time.time()
+        with self._lock:
+            while self._sessions:
+                chat_id, created_at = self._sessions.pop(0)
+                if now - created_at <= self.max_age:
+                    return chat_id
+        return None
+
+    def acquire(self, deadline=None):
+        """取一个会话ID，失败返回None"""
+        chat_id = self._pop()
+        if chat_id:
+            logger.debug(f"[KimiChat] 使用预建会话: {chat_id}")
+            self.fill_async()
+            return chat_id
+        return self.create_func(deadline=deadline)
+
+    def release(self, chat_id):
+        """归还取出后未使用(尚未发送任何消息)的会话"""
+        if not chat_id:
+            return
+        with self._lock:
+            if len(self._sessions) < self.size:
+                self._sessions.append((chat_id, time.time()))
+
+    def acquire_many(self, count, deadline=None, max_workers=4):
+        """取多个会话ID，池中不足时并发创建，创建失败的位置为None"""
+        chat_ids = []
+        while len(chat_ids) < count:
+            chat_id = self._pop()
+            if not chat_id:
+                break
+            chat_ids.append(chat_id)
+        missing = count - len(chat_ids)
+        if missing > 0:
+            with ThreadPoolExecutor(max_workers=max(1, min(missing, max_workers))) as executor:
+                chat_ids.extend(executor.map(lambda _: self.create_func(deadline=deadline), range(missing)))
+        self.fill_async()
+        return chat_ids
+
+    def fill(self):
+        """补足会话池"""
+        while len(self) < self.size:
+            chat_id = self.create_func()
+            if not chat_id:
+                logger.warning("[KimiChat] 预建会话失败，停止补充会话池")
+                break
+            with self._lock:
+                self._sessions.append((chat_id, time.time()))
+        logger.debug(f"[KimiChat] 会话池当前数量: {len(self)}")
+
+    def fill_async(self):
+        """在后台线程补足会话池"""
+        if self.size <= 0:
+            return
+        with self._lock:
+            if self._filling or len(self._sessions) >= self.size:
+                return
+            self._filling = True
+
+        def _run():
+            try:
+                self.fill()
+            finally:
+                with self._lock:
+                    self._filling = False
+
+        threading.Thread(target=_run, daemon=True).start()
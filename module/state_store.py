@@ -0,0 +1,299 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 多个机器人实例共享的状态存储：token、会话映射、上传去重和结果缓存，以及跨实例的锁
+
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from common.log import logger
+
+
+class StateStore(ABC):
+    """
+    键值存储，值为可json序列化的对象，ttl 为秒，过期后读取返回None
+    lock 在各实例间互斥，持有者异常退出时锁在 ttl 秒后自动失效
+    shared 为False的存储只在本进程内有效，不必把已有本地缓存的数据再写一份
+    """
+
+    shared = True
+
+    def __init__(self, namespace="kimi"):
+        self.namespace = namespace
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def _try_acquire(self, name, owner, ttl):
+        pass
+
+    @abstractmethod
+    def _release(self, name, owner):
+        pass
+
+    @contextmanager
+    def lock(self, name, ttl=30, wait=10):
+        """
+        :param wait: 最长等待秒数，超时后以未持有锁的状态继续(yield False)，由调用方决定如何处理
+        """
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        delay = 0.05
+        acquired = self._try_acquire(name, owner, ttl)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            acquired = self._try_acquire(name, owner, ttl)
+        if not acquired:
+            logger.warning(f"[KimiChat] 等待共享锁超时: {name}")
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._release(name, owner)
+
+
+class MemoryStore(StateStore):
+    """
+    单实例使用的进程内存储(默认)
+    写入时每隔 purge_interval 秒清理一次过期条目，条目数超过 max_entries 时丢弃最早写入的
+    """
+
+    shared = False
+
+    def __init__(self, namespace="kimi", max_entries=10000, purge_interval=300):
+        super().__init__(namespace)
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self._data = {}  # {键: (值, 过期时间)}，按写入顺序
+        self._lock = threading.Lock()
+        self._purge_at = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(self._key(key))
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.time():
+                del self._data[self._key(key)]
+                return None
+            return item[0]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._data.pop(self._key(key), None)
+            self._data[self._key(key)] = (value, now + ttl if ttl else None)
+            if now >= self._purge_at:
+                self._purge_at = now + self.purge_interval
+                for expired in [k for k, item in self._data.items() if item[1] is not None and item[1] <= now]:
+                    del self._data[expired]
+            if len(self._data) > self.max_entries:
+                lock_prefix = self._key("lock:")
+                for oldest in [k for k in self._data if not k.startswith(lock_prefix)]:
+                    if len(self._data) <= self.max_entries:
+                        break
+                    del self._data[oldest]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(self._key(key), None)
+
+    def _try_acquire(self, name, owner, ttl):
+        key = self._key(f"lock:{name}")
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[1] > now:
+                return False
+            self._data[key] = (owner, now + ttl)
+            return True
+
+    def _release(self, name, owner):
+        key = self._key(f"lock:{name}")
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[0] == owner:
+                del self._data[key]
+
+
+class SQLiteStore(StateStore):
+    """
+    同一台机器上的多个实例共用一个 SQLite 文件，WAL 模式下读写互不阻塞
+    每个线程使用独立连接
+    """
+
+    def __init__(self, path, namespace="kimi"):
+        super().__init__(namespace)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+        self._purge_at = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self._key(key), time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"[KimiChat] 读取共享状态失败: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (self._key(key), json.dumps(value, ensure_ascii=False), now + ttl if ttl else None)
+            )
+            if now >= self._purge_at:
+                # 顺带清理过期条目
+                self._purge_at = now + 300
+                conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        except sqlite3.Error as e:
+            logger.warning(f"[KimiChat] 写入共享状态失败: {e}")
+
+    def delete(self, key):
+        try:
+            self._conn().execute("DELETE FROM kv WHERE key = ?", (self._key(key),))
+        except sqlite3.Error as e:
+            logger.warning(f"[KimiChat] 删除共享状态失败: {e}")
+
+    def _try_acquire(self, name, owner, ttl):
+        now = time.time()
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            return False
+        try:
+            row = conn.execute("SELECT expires_at FROM kv WHERE key = ?", (self._key(f"lock:{name}"),)).fetchone()
+            if row and row[0] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                         (self._key(f"lock:{name}"), json.dumps(owner), now + ttl))
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"[KimiChat] 获取共享锁失败: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return False
+
+    def _release(self, name, owner):
+        try:
+            self._conn().execute("DELETE FROM kv WHERE key = ? AND value = ?",
+                                 (self._key(f"lock:{name}"), json.dumps(owner)))
+        except sqlite3.Error as e:
+            logger.warning(f"[KimiChat] 释放共享锁失败: {e}")
+
+
+class RedisStore(StateStore):
+    """跨机器部署时使用 Redis(或兼容协议的服务)，需要安装 redis 包"""
+
+    _RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url, namespace="kimi"):
+        super().__init__(namespace)
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=5)
+        self._release_script = self._client.register_script(self._RELEASE_SCRIPT)
+
+    def get(self, key):
+        try:
+            value = self._client.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"[KimiChat] 读取共享状态失败: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self._client.set(self._key(key), json.dumps(value, ensure_ascii=False), ex=int(ttl) if ttl else None)
+        except Exception as e:
+            logger.warning(f"[KimiChat] 写入共享状态失败: {e}")
+
+    def delete(self, key):
+        try:
+            self._client.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"[KimiChat] 删除共享状态失败: {e}")
+
+    def _try_acquire(self, name, owner, ttl):
+        try:
+            return bool(self._client.set(self._key(f"lock:{name}"), owner, nx=True, px=int(ttl * 1000)))
+        except Exception as e:
+            # Redis 不可用时按未取得锁处理，由调用方决定是否继续
+            logger.warning(f"[KimiChat] 获取共享锁失败: {e}")
+            return False
+
+    def _release(self, name, owner):
+        try:
+            self._release_script(keys=[self._key(f"lock:{name}")], args=[owner])
+        except Exception as e:
+            logger.warning(f"[KimiChat] 释放共享锁失败: {e}")
+
+
+def create_store(store_conf, base_dir):
+    """
+    按配置创建存储，sqlite/redis 不可用时退回内存存储
+    :param store_conf: {"backend": "memory" | "sqlite" | "redis", "path": ..., "url": ..., "namespace": ...}
+    """
+    backend = store_conf.get("backend", "memory")
+    namespace = store_conf.get("namespace", "kimi")
+    try:
+        if backend == "sqlite":
+            path = store_conf.get("path") or os.path.join(base_dir, "cache", "state.db")
+            store = SQLiteStore(path, namespace)
+            logger.info(f"[KimiChat] 共享状态存储: sqlite {path}")
+            return store
+        if backend == "redis":
+            store = RedisStore(store_conf.get("url", "redis://127.0.0.1:6379/0"), namespace)
+            store._client.ping()
+            logger.info("[KimiChat] 共享状态存储: redis")
+            return store
+    except ImportError:
+        logger.error("[KimiChat] 未安装 redis 包，共享状态改用内存存储")
+    except Exception as e:
+        logger.error(f"[KimiChat] 共享状态存储初始化失败，改用内存存储: {e}")
+    return MemoryStore(namespace)
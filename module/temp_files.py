@@ -0,0 +1,158 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: tmp 目录下临时文件的生命周期管理：登记归属和有效期、磁盘配额、后台清理孤儿文件
+
+"""
+import os
+import threading
+import time
+
+from common.log import logger
+
+
+class TempFileManager:
+    """
+    插件处理中的文件通过 track 登记(归属者 + 有效期)，用完后 release 立即删除
+    后台线程定期扫描 tmp 目录顶层文件：
+      - 已登记且过期的文件删除
+      - 未登记且超过 orphan_ttl 未修改的文件视为孤儿删除
+      - 总大小超过配额时，按最近使用时间从旧到新删除未登记的文件
+    tmp 目录与其他插件共用，未登记的文件在 min_age 秒内有修改或访问时不会被删除
+    """
+
+    def __init__(self, tmp_dir="tmp", ttl=600, orphan_ttl=3600, quota_bytes=500 * 1024 * 1024, sweep_interval=300,
+                 min_age=600):
+        self.tmp_dir = os.path.abspath(tmp_dir)
+        self.ttl = ttl
+        self.orphan_ttl = orphan_ttl
+        self.quota_bytes = quota_bytes
+        self.sweep_interval = sweep_interval
+        self.min_age = min_age
+        self._files = {}  # {绝对路径: {'owner', 'expires_at', 'last_used'}}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._estimated_bytes = 0  # 上次扫描后的目录大小加上新登记的文件
+        self._thread = None
+        self.stats = {"released": 0, "expired": 0, "orphans": 0, "evicted": 0, "freed_bytes": 0}
+
+    def track(self, path, owner, ttl=None):
+        """登记文件，超过配额时唤醒后台线程立即清理"""
+        path = os.path.abspath(path)
+        now = time.time()
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self._lock:
+            self._files[path] = {'owner': owner, 'expires_at': now + (ttl or self.ttl), 'last_used': now}
+            self._estimated_bytes += size
+            over_quota = self._estimated_bytes > self.quota_bytes
+        if over_quota:
+            self._wakeup.set()
+
+    def touch(self, path):
+        with self._lock:
+            record = self._files.get(os.path.abspath(path))
+            if record:
+                record['last_used'] = time.time()
+
+    def release(self, path):
+        """文件已用完(上传完成或处理结束)，立即删除"""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._files.pop(path, None)
+        self._remove(path, "released")
+
+    def release_owner(self, owner):
+        with self._lock:
+            paths = [path for path, record in self._files.items() if record['owner'] == owner]
+        for path in paths:
+            self.release(path)
+
+    def _remove(self, path, reason):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error(f"[KimiChat] 删除临时文件失败: {path}, {e}")
+            return
+        with self._lock:
+            self.stats[reason] += 1
+            self.stats["freed_bytes"] += size
+            self._estimated_bytes = max(0, self._estimated_bytes - size)
+        logger.debug(f"[KimiChat] 删除临时文件({reason}): {path}")
+
+    def sweep(self):
+        """扫描一次 tmp 目录，返回清理后的总大小"""
+        now = time.time()
+        entries = []  # [(最近使用时间, 大小, 路径)]，只含未登记且超过 min_age 的文件
+        total = 0
+        try:
+            scanner = os.scandir(self.tmp_dir)
+        except FileNotFoundError:
+            return 0
+        with scanner:
+            for entry in scanner:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                path = os.path.abspath(entry.path)
+                with self._lock:
+                    record = self._files.get(path)
+                    if record and record['expires_at'] <= now:
+                        self._files.pop(path, None)
+                if record:
+                    if record['expires_at'] <= now:
+                        self._remove(path, "expired")
+                        continue
+                    total += stat.st_size
+                    continue
+                last_used = max(stat.st_mtime, stat.st_atime)
+                if now - last_used < self.min_age:
+                    # 可能是其他插件刚写入、尚未使用的文件
+                    total += stat.st_size
+                    continue
+                if now - stat.st_mtime > self.orphan_ttl:
+                    self._remove(path, "orphans")
+                    continue
+                total += stat.st_size
+                entries.append((last_used, stat.st_size, path))
+
+        if total > self.quota_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.quota_bytes:
+                    break
+                self._remove(path, "evicted")
+                total -= size
+            if total > self.quota_bytes:
+                logger.warning(f"[KimiChat] tmp 目录仍超出配额: {total / 1024 / 1024:.1f}MB，其余文件正在使用中或刚写入")
+        with self._lock:
+            self._estimated_bytes = total
+        return total
+
+    def start(self):
+        if self._thread or self.sweep_interval <= 0:
+            return self
+        self._thread = threading.Thread(target=self._run, name="kimi-tmp-sweeper", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                total = self.sweep()
+                logger.debug(f"[KimiChat] tmp 目录清理完成: {total / 1024 / 1024:.1f}MB, {self.stats}")
+            except Exception as e:
+                logger.error(f"[KimiChat] tmp 目录清理出错: {e}")
+            self._wakeup.wait(self.sweep_interval)
+            self._wakeup.clear()
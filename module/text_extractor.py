@@ -0,0 +1,97 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 纯文本文件的本地读取，小文件直接内联到提问中，无需走上传流程
+
+"""
+import codecs
+import os
+
+from common.log import logger
+
+
+# 可以在本地直接读取的纯文本格式
+TEXT_FILE_FORMATS = {
+    ".txt", ".md", ".csv", ".log",
+    ".json", ".xml", ".yaml", ".yml",
+    ".ini", ".conf", ".properties",
+    ".py", ".java", ".cpp", ".c", ".h", ".hpp",
+    ".js", ".ts", ".html", ".css",
+    ".sh", ".bat",
+}
+
+# 依次尝试的编码，gb18030 兼容 gbk/gb2312
+FALLBACK_ENCODINGS = ("utf-8", "gb18030", "big5")
+
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def is_text_file(file_path):
+    """根据扩展名判断是否为纯文本文件"""
+    return os.path.splitext(file_path)[1].lower() in TEXT_FILE_FORMATS
+
+
+def detect_encoding(raw):
+    """
+    检测文本编码：优先识别BOM，其次依次尝试常见编码
+    :return: 编码名称，疑似二进制内容时返回None
+    """
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding
+    if b"\x00" in raw:
+        return None
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            raw.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def read_text_file(file_path, max_bytes):
+    """
+    读取小体积文本文件
+    :param file_path: 文件路径
+    :param max_bytes: 允许内联的最大字节数
+    :return: 文本内容；文件过大、无法识别编码或读取失败时返回None
+    """
+    try:
+        size = os.path.getsize(file_path)
+        if size > max_bytes:
+            logger.debug(f"[KimiChat] 文件超过本地读取阈值: {file_path}, size={size}")
+            return None
+        with open(file_path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        logger.warning(f"[KimiChat] 本地读取文件失败: {str(e)}")
+        return None
+
+    encoding = detect_encoding(raw)
+    if not encoding:
+        logger.debug(f"[KimiChat] 无法识别文件编码，改为上传: {file_path}")
+        return None
+    text = raw.decode(encoding)
+    return text.replace("\r\n", "\n").strip()
+
+
+def build_inline_prompt(prompt, text_files):
+    """
+    将本地读取的文本拼接到提示词后
+    :param prompt: 提示词
+    :param text_files: [(文件名, 文本内容)]
+    """
+    parts = [prompt or ""]
+    for name, text in text_files:
+        parts.append(f"文件：{name}\n```\n{text}\n```")
+    return "\n\n".join(parts)
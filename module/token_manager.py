@@ -11,6 +11,9 @@ import requests
 import time
 
 from common.log import logger
+from .http_client import get_session
+from .json_codec import loads
+from .resilience import BREAKERS, CircuitOpenError, is_server_failure, request_timeout
 
 
 # 全局变量存储access_token和refresh_token
@@ -20,6 +23,11 @@ tokens = {
     "expires_at": 0  # access_token的过期时间
 }
 
+# 多实例共享的状态存储，未设置时只使用本进程的tokens
+_store = None
+# 共享的access_token剩余有效期不足该秒数时不再采用
+TOKEN_MARGIN = 30
+
 # 请求头定义
 HEADERS = {
     'Accept': '*/*',
@@ -30,30 +38,78 @@ HEADERS = {
 }
 
 
+def set_state_store(store):
+    """设置共享状态存储；其他实例刷新过的token(refresh_token会轮换)优先于配置文件中的"""
+    global _store
+    _store = store
+    shared = store.get("tokens")
+    if shared and shared.get("refresh_token"):
+        tokens.update(shared)
+        logger.info("[KimiChat] 已从共享存储加载token")
+
+
 def refresh_access_token():
     """
     使用refresh_token刷新access_token，并更新全局tokens变量。
+    配置了共享存储时，各实例持有同一把锁刷新，其他实例直接采用刷新结果
     """
+    if _store is None:
+        _refresh()
+        return
+    with _store.lock("token_refresh", ttl=30, wait=15) as acquired:
+        shared = _store.get("tokens") or {}
+        if shared.get("expires_at", 0) - TOKEN_MARGIN > time.time():
+            tokens.update(shared)
+            logger.debug("[KimiChat] 采用其他实例刷新的access_token")
+            return
+        if shared.get("refresh_token"):
+            tokens['refresh_token'] = shared['refresh_token']
+        if not acquired:
+            # 其他实例可能正在刷新，同时刷新会使轮换后的refresh_token失效，本次不刷新，下次请求再试
+            logger.warning("[KimiChat] 等待token刷新锁超时，跳过本次刷新")
+            return
+        if _refresh():
+            _store.set("tokens", dict(tokens))
+
+
+def _refresh():
     global tokens
 
     refresh_token = tokens['refresh_token']
     if not refresh_token:
         logger.error("[KimiChat] 缺少refresh_token，无法刷新access_token")
-        return
+        return False
 
     headers = HEADERS.copy()
     headers['Authorization'] = f'Bearer {refresh_token}'
 
-    response = requests.get('https://kimi.moonshot.cn/api/auth/token/refresh', headers=headers)
+    breaker = BREAKERS["refresh"]
+    try:
+        breaker.check()
+        response = get_session().get('https://kimi.moonshot.cn/api/auth/token/refresh', headers=headers,
+                                     timeout=request_timeout("refresh"))
+    except CircuitOpenError:
+        logger.warning("[KimiChat] 刷新access_token熔断中，跳过本次刷新")
+        return False
+    except requests.RequestException as e:
+        breaker.record_failure()
+        logger.error(f"[KimiChat] 刷新access_token请求失败: {str(e)}")
+        return False
+
+    if is_server_failure(response.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
 
     if response.status_code == 200:
         logger.debug("[KimiChat] access_token刷新成功！")
-        response_data = response.json()
+        response_data = loads(response.content)
         tokens['access_token'] = response_data.get("access_token", "")
         tokens['refresh_token'] = response_data.get("refresh_token", "")
         tokens['expires_at'] = int(time.time()) + 599  # 假设access_token有效期是10分钟
-    else:
-        logger.error(f"[KimiChat] 刷新access_token失败，状态码：{response.status_code}")
+        return True
+    logger.error(f"[KimiChat] 刷新access_token失败，状态码：{response.status_code}")
+    return False
 
 
 def ensure_access_token(func):
@@ -0,0 +1,62 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 启动耗时统计和后台预热任务
+
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from common.log import logger
+
+
+class StartupReport:
+    """按阶段记录启动耗时，预热完成后输出汇总"""
+
+    def __init__(self):
+        self.phases = []  # [(阶段, 秒, 是否成功)]
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok=True):
+        with self._lock:
+            self.phases.append((name, seconds, ok))
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def summary(self):
+        with self._lock:
+            parts = [f"{name} {seconds * 1000:.0f}ms" + ("" if ok else "(失败)") for name, seconds, ok in self.phases]
+        return ", ".join(parts)
+
+
+def run_warm_up(tasks, report, name="kimi-warmup"):
+    """
+    在后台线程依次执行预热任务，不阻塞插件注册
+    :param tasks: [(阶段名, 无参函数)]，函数返回False或抛出异常视为失败
+    """
+
+    def _run():
+        for phase, func in tasks:
+            started = time.perf_counter()
+            ok = True
+            try:
+                ok = func() is not False
+            except Exception as e:
+                ok = False
+                logger.warning(f"[KimiChat] 预热任务 {phase} 出错: {e}")
+            report.record(phase, time.perf_counter() - started, ok)
+        logger.info(f"[KimiChat] 启动耗时: {report.summary()}")
+
+    thread = threading.Thread(target=_run, name=name, daemon=True)
+    thread.start()
+    return thread
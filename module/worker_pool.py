@@ -0,0 +1,164 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 可选的多进程计算池：按会话键一致性哈希分片到固定的工作进程，CPU密集的步骤不再和消息接收抢GIL
+
+"""
+import bisect
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from common.log import logger
+
+# 工作进程的入口不在插件包内，spawn 出的进程反序列化任务时不会导入插件包的 __init__；
+# 子进程继承父进程的 sys.path
+WORKER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "worker")
+if WORKER_DIR not in sys.path:
+    sys.path.append(WORKER_DIR)
+import kimichat_worker
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """一致性哈希环，每个节点放 replicas 个虚拟节点，增减节点时只有少量键换到别的节点"""
+
+    def __init__(self, nodes, replicas=64):
+        self._ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [h for h, _ in self._ring]
+
+    def node(self, key):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._ring[index][1]
+
+
+class WorkerTimeoutError(Exception):
+    pass
+
+
+def _terminate(executor):
+    """关闭执行器并结束其中的进程，shutdown(wait=False) 不会结束卡住的进程"""
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def _task(func, args):
+    """module 包内的模块级函数改为按模块名交给 kimichat_worker.call 在工作进程中加载执行"""
+    package, _, module_name = (getattr(func, "__module__", None) or "").rpartition(".")
+    if package == __package__ and getattr(func, "__qualname__", "").isidentifier():
+        return kimichat_worker.call, (module_name, func.__qualname__) + tuple(args)
+    return func, args
+
+
+class ShardedWorkerPool:
+    """
+    每个分片是一个单进程的 ProcessPoolExecutor，同一会话的任务总在同一进程中按提交顺序执行
+    workers 为0时不启动进程，所有任务在当前线程直接执行；
+    进程崩溃或参数无法序列化时退回当前线程执行，调用方不需要区分
+    超时时结束该分片的进程(下次使用时重新拉起)并抛出 WorkerTimeoutError，不在本地重跑同一任务
+    """
+
+    def __init__(self, workers=0, start_method="spawn", timeout=60):
+        self.workers = max(0, int(workers or 0))
+        self.start_method = start_method
+        self.timeout = timeout
+        self._ring = HashRing(range(self.workers))
+        self._executors = {}
+        self._lock = threading.Lock()
+        self.stats = {"remote": 0, "inline": 0, "fallback": 0, "restarts": 0, "timeouts": 0,
+                      "remote_seconds": 0.0}
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def start(self):
+        """预先拉起所有工作进程，避免第一个任务承担进程启动耗时"""
+        for shard in range(self.workers):
+            self._executor(shard).submit(int).result()
+        if self.workers:
+            logger.info(f"[KimiChat] 工作进程池已启动: {self.workers} 个进程 ({self.start_method})")
+
+    def _executor(self, shard):
+        with self._lock:
+            executor = self._executors.get(shard)
+            if executor is None:
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=kimichat_worker.init_worker
+                )
+                self._executors[shard] = executor
+            return executor
+
+    def _discard(self, shard, executor):
+        with self._lock:
+            if self._executors.get(shard) is executor:
+                del self._executors[shard]
+                self.stats["restarts"] += 1
+        _terminate(executor)
+
+    def _submit(self, shard, func, args):
+        """执行器可能刚被其他线程的 _discard 关闭，submit 抛出 RuntimeError 时换一个新的执行器重试一次"""
+        func, args = _task(func, args)
+        executor = self._executor(shard)
+        try:
+            return executor, executor.submit(func, *args)
+        except RuntimeError:
+            self._discard(shard, executor)
+            executor = self._executor(shard)
+            return executor, executor.submit(func, *args)
+
+    def run(self, key, func, *args):
+        """
+        在 key 对应的工作进程中执行 func(*args) 并返回结果；func 和参数需可序列化(模块级函数)
+        func 自身抛出的异常原样抛给调用方
+        """
+        if not self.workers:
+            self.stats["inline"] += 1
+            return func(*args)
+        shard = self._ring.node(key)
+        executor = None
+        started = time.perf_counter()
+        try:
+            executor, future = self._submit(shard, func, args)
+            result = future.result(timeout=self.timeout)
+        except (BrokenProcessPool, pickle.PicklingError) as e:
+            logger.warning(f"[KimiChat] 工作进程 {shard} 执行 {getattr(func, '__name__', func)} 失败，改为本地执行: {e}")
+            if isinstance(e, BrokenProcessPool) and executor is not None:
+                self._discard(shard, executor)
+            self.stats["fallback"] += 1
+            return func(*args)
+        except concurrent.futures.TimeoutError:
+            name = getattr(func, '__name__', func)
+            logger.warning(f"[KimiChat] 工作进程 {shard} 执行 {name} 超过 {self.timeout}s 未返回，结束该进程")
+            self._discard(shard, executor)
+            self.stats["timeouts"] += 1
+            raise WorkerTimeoutError(f"{name} 执行超时({self.timeout}s)")
+        self.stats["remote"] += 1
+        self.stats["remote_seconds"] += time.perf_counter() - started
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            _terminate(executor)
@@ -0,0 +1,11 @@
+# coding=utf-8
+"""
+在 chatgpt-on-wechat 根目录下运行(需要 common.log)：python -m pytest plugins/kimichat/tests
+插件目录加入 sys.path 后直接导入 module.*，不经过插件包的 __init__ 加载整个机器人
+"""
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PLUGIN_DIR not in sys.path:
+    sys.path.insert(0, PLUGIN_DIR)
@@ -0,0 +1,48 @@
+# coding=utf-8
+import os
+import threading
+
+from module.answer_cache import AnswerCache
+
+
+def _files(cache_dir):
+    return sorted(os.listdir(cache_dir))
+
+
+def test_evicts_least_recently_used_without_rescanning(tmp_path):
+    # 每个文件约100字节，最多放下三个
+    cache = AnswerCache(str(tmp_path), max_bytes=320)
+    for key in ("a", "b", "c"):
+        cache.set(key, "x" * 50)
+    assert cache.get("a") == "x" * 50
+    cache.set("d", "x" * 50)
+    # 总大小由内存维护；b 最久未访问，先被淘汰
+    assert _files(tmp_path) == ["a.json", "c.json", "d.json"]
+    assert cache._total == sum(os.path.getsize(tmp_path / name) for name in _files(tmp_path))
+
+
+def test_rewriting_a_key_does_not_double_count(tmp_path):
+    cache = AnswerCache(str(tmp_path))
+    cache.set("a", "first")
+    cache.set("a", "second answer")
+    assert cache._total == os.path.getsize(tmp_path / "a.json")
+
+
+def test_concurrent_writers_of_the_same_key(tmp_path):
+    cache = AnswerCache(str(tmp_path))
+    answers = [f"answer {i}" * 100 for i in range(8)]
+    threads = [threading.Thread(target=cache.set, args=("k", answer)) for answer in answers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _files(tmp_path) == ["k.json"]
+    assert cache.get("k") in answers
+
+
+def test_reload_restores_sizes_and_removes_stale_temp_files(tmp_path):
+    AnswerCache(str(tmp_path)).set("a", "answer")
+    (tmp_path / "b.abc123.tmp").write_text("partial")
+    cache = AnswerCache(str(tmp_path))
+    assert _files(tmp_path) == ["a.json"]
+    assert cache._total == os.path.getsize(tmp_path / "a.json")
@@ -0,0 +1,60 @@
+# coding=utf-8
+import pytest
+import requests
+
+from module.file_uploader import FileUploader, StorageUploadError, UploadApiError
+from module.resilience import BREAKERS
+
+
+class _Breaker:
+    def __init__(self):
+        self.calls = []
+
+    def check(self):
+        pass
+
+    def record_success(self):
+        self.calls.append("success")
+
+    def record_failure(self):
+        self.calls.append("failure")
+
+    def release(self):
+        self.calls.append("release")
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    fake = _Breaker()
+    monkeypatch.setitem(BREAKERS, "upload", fake)
+    return fake
+
+
+def _uploader(monkeypatch, presign=None, put=None, notify=None):
+    uploader = FileUploader()
+
+    def raiser(error, result=None):
+        def call(*args, **kwargs):
+            if error is not None:
+                raise error
+            return result
+        return call
+
+    monkeypatch.setattr(uploader, "get_presigned_url", raiser(presign, {"url": "u", "object_name": "o"}))
+    monkeypatch.setattr(uploader, "upload_file", raiser(put))
+    monkeypatch.setattr(uploader, "notify_file_upload", raiser(notify, None))
+    return uploader
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({}, "success"),
+    ({"presign": UploadApiError("bad request", 400)}, "success"),
+    ({"presign": UploadApiError("unavailable", 503)}, "failure"),
+    ({"presign": requests.ConnectionError("reset")}, "failure"),
+    ({"put": StorageUploadError("oss 403")}, "success"),
+    ({"notify": UploadApiError("rate limited", 429)}, "failure"),
+    ({"presign": OSError("disk")}, "release"),
+])
+def test_upload_breaker_outcome(monkeypatch, breaker, kwargs, expected):
+    _uploader(monkeypatch, **kwargs).upload("a.txt", "/nonexistent/a.txt")
+    assert breaker.calls == [expected]
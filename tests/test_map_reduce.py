@@ -0,0 +1,31 @@
+# coding=utf-8
+from module.map_reduce import fits_map_reduce, load_document_chunks
+
+CHUNK_CHARS = 20000
+MAX_CHUNKS = 12
+
+
+def _write_text(path, size):
+    line = "2024-01-01 12:00:00 INFO request handled in 12ms\n"
+    path.write_text(line * (size // len(line) + 1), encoding="utf-8")
+    return str(path)
+
+
+def test_large_text_file_falls_back_to_upload(tmp_path):
+    # 默认配置下 min_size(512KB) 的纯文本会拆出二十多块，超过 max_chunks 时不拆分
+    chunks = load_document_chunks(_write_text(tmp_path / "app.log", 512 * 1024), CHUNK_CHARS)
+    assert len(chunks) > MAX_CHUNKS
+    assert not fits_map_reduce(chunks, MAX_CHUNKS)
+
+
+def test_text_file_within_cap_is_split(tmp_path):
+    chunks = load_document_chunks(_write_text(tmp_path / "app.log", CHUNK_CHARS * MAX_CHUNKS - 1000), CHUNK_CHARS)
+    assert 1 < len(chunks) <= MAX_CHUNKS
+    assert fits_map_reduce(chunks, MAX_CHUNKS)
+
+
+def test_chunk_count_boundary():
+    assert fits_map_reduce(["x"] * MAX_CHUNKS, MAX_CHUNKS)
+    assert not fits_map_reduce(["x"] * (MAX_CHUNKS + 1), MAX_CHUNKS)
+    assert not fits_map_reduce(["x"], MAX_CHUNKS)
+    assert not fits_map_reduce(None, MAX_CHUNKS)
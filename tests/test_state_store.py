@@ -0,0 +1,99 @@
+# coding=utf-8
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from module.state_store import MemoryStore, RedisStore, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "state.db"))
+    return MemoryStore()
+
+
+def test_ttl_expiry(store):
+    store.set("short", {"v": 1}, ttl=0.1)
+    store.set("forever", [1, 2])
+    assert store.get("short") == {"v": 1}
+    time.sleep(0.15)
+    assert store.get("short") is None
+    assert store.get("forever") == [1, 2]
+
+
+def test_lock_contention(store):
+    holding = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def holder():
+        with store.lock("refresh", ttl=5, wait=1) as acquired:
+            results.append(("holder", acquired))
+            holding.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    holding.wait(2)
+    with store.lock("refresh", ttl=5, wait=0.2) as acquired:
+        results.append(("waiter", acquired))
+    release.set()
+    thread.join()
+    with store.lock("refresh", ttl=5, wait=0.2) as acquired:
+        results.append(("after", acquired))
+    assert results == [("holder", True), ("waiter", False), ("after", True)]
+
+
+def test_lock_expires_after_ttl(store):
+    assert store._try_acquire("upload", "crashed-owner", 0.1)
+    with store.lock("upload", ttl=5, wait=1) as acquired:
+        assert acquired
+
+
+def test_sqlite_shared_between_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteStore(path), SQLiteStore(path)
+    first.set("session:u1", {"chatid": "c1"}, ttl=60)
+    assert second.get("session:u1") == {"chatid": "c1"}
+    second.delete("session:u1")
+    assert first.get("session:u1") is None
+    with first.lock("token_refresh", ttl=5, wait=0) as acquired:
+        assert acquired
+        with second.lock("token_refresh", ttl=5, wait=0.2) as other:
+            assert not other
+    with second.lock("token_refresh", ttl=5, wait=0) as acquired:
+        assert acquired
+
+
+def test_sqlite_lock_fails_closed_when_database_busy(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStore(path)
+    blocker = sqlite3.connect(path, timeout=0, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        store._conn().execute("PRAGMA busy_timeout=0")
+        with store.lock("token_refresh", ttl=5, wait=0.2) as acquired:
+            assert not acquired
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+
+
+class _DownRedis:
+    def set(self, *args, **kwargs):
+        raise ConnectionError("redis unavailable")
+
+    get = delete = set
+
+
+def test_redis_lock_fails_closed():
+    store = RedisStore.__new__(RedisStore)
+    store.namespace = "kimi"
+    store._client = _DownRedis()
+    store._release_script = store._client.set
+    with store.lock("token_refresh", ttl=5, wait=0.2) as acquired:
+        assert not acquired
+    assert store.get("tokens") is None
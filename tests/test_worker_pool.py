@@ -0,0 +1,39 @@
+# coding=utf-8
+import pytest
+
+from module.answer_cache import file_digest
+from module.worker_pool import ShardedWorkerPool
+
+
+@pytest.fixture
+def pool():
+    workers = ShardedWorkerPool(workers=1, start_method="spawn", timeout=30)
+    yield workers
+    workers.shutdown()
+
+
+def test_spawn_worker_runs_module_function(pool, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    assert pool.run("u1", file_digest, str(path)) == file_digest(str(path))
+    assert pool.stats["remote"] == 1
+
+
+def test_spawn_worker_does_not_import_plugin_package(pool, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    pool.run("u1", file_digest, str(path))
+    # 同一分片的工作进程：module 目录以独立的包名加载，不经过插件包
+    modules = pool.run("u1", eval, "sorted(__import__('sys').modules)")
+    assert "kimichat_worker_modules.answer_cache" in modules
+    assert not any(name == "module" or name.startswith("module.") for name in modules)
+
+
+def test_submit_retries_on_discarded_executor(pool, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    shard = pool._ring.node("u1")
+    # 模拟另一线程刚把执行器关闭，但还没从字典中移除
+    pool._executor(shard).shutdown(wait=True)
+    assert pool.run("u1", file_digest, str(path)) == file_digest(str(path))
+    assert pool.stats["remote"] == 1 and pool.stats["restarts"] == 1
@@ -0,0 +1,43 @@
+# coding=utf-8
+"""
+Author: chazzjimel
+Email: chazzjimel@gmail.com
+wechat：cheung-z-x
+
+Description: 工作进程的入口，不属于插件包：按文件路径加载 module 目录，
+不经过插件包的 __init__(会导入 kimi_chat 和整个机器人)
+
+"""
+import importlib
+import importlib.util
+import os
+import signal
+import sys
+
+MODULE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "module")
+# module 目录在工作进程中注册的包名
+PACKAGE = "kimichat_worker_modules"
+
+
+def init_worker():
+    # Ctrl+C 由主进程处理，工作进程随主进程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _load_package():
+    package = sys.modules.get(PACKAGE)
+    if package is None:
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE, os.path.join(MODULE_DIR, "__init__.py"), submodule_search_locations=[MODULE_DIR]
+        )
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE] = package
+        spec.loader.exec_module(package)
+    return package
+
+
+def call(module_name, func_name, *args):
+    """执行 module 目录下 module_name 模块中的 func_name(*args)"""
+    _load_package()
+    module = importlib.import_module(f"{PACKAGE}.{module_name}")
+    return getattr(module, func_name)(*args)